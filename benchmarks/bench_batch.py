@@ -0,0 +1,241 @@
+"""
+Benchmark the batch pipeline on a synthetic library with a stub pingo.
+
+Examples:
+  python benchmarks/bench_batch.py --chapters 10 --pages 40 -o results.json
+  python benchmarks/bench_batch.py --chapters 10 --pages 40 --baseline results.json
+
+Reports wall time, time per stage (summed over worker threads), peak RSS and
+the number of filesystem calls made inside the library. Results are written as
+JSON so runs can be compared with --baseline.
+"""
+import argparse
+import builtins
+import functools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))
+sys.path.insert(0, HERE)
+
+import send2trash  # noqa: E402
+
+from comic_optimizer import cleanup, core  # noqa: E402
+from corpus import generate_library  # noqa: E402
+
+# functions timed as stages, keyed by the name used in the report; verify and
+# trash run on the background cleanup thread, so they overlap the other stages
+STAGE_FUNCTIONS = {
+    "plan": (core, "plan_batch"),
+    "clean": (core, "delete_non_image_files"),
+    "rename": (core, "rename_files_with_zero_padding"),
+    "pingo": (core, "run_pingo"),
+    "dedupe": (core, "remove_redundant_images"),
+    "archive": (core, "compress_to_cbz"),
+    "verify": (cleanup, "verify_archive"),
+    "trash": (send2trash, "send2trash"),
+}
+
+# filesystem calls counted when their path is inside the library
+FILE_OPS = {
+    os: ("listdir", "scandir", "walk", "stat", "remove", "rename", "replace", "rmdir"),
+    os.path: ("exists", "isdir", "isfile", "getsize"),
+    builtins: ("open",),
+}
+
+
+class Recorder:
+    """Collects stage timings and file-op counts from every thread."""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.stage_seconds = {name: 0.0 for name in STAGE_FUNCTIONS}
+        self.stage_calls = {name: 0 for name in STAGE_FUNCTIONS}
+        self.file_ops = {}
+        self._lock = threading.Lock()
+        self._restore = []
+
+    def install(self) -> None:
+        for stage, (module, attr) in STAGE_FUNCTIONS.items():
+            if hasattr(module, attr):
+                self._patch(module, attr, self._timed(stage, getattr(module, attr)))
+        for module, names in FILE_OPS.items():
+            for name in names:
+                self._patch(module, name, self._counted(name, getattr(module, name)))
+
+    def uninstall(self) -> None:
+        for module, name, original in reversed(self._restore):
+            setattr(module, name, original)
+        self._restore.clear()
+
+    def _patch(self, module, name, replacement) -> None:
+        self._restore.append((module, name, getattr(module, name)))
+        setattr(module, name, replacement)
+
+    def _timed(self, stage, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.stage_seconds[stage] += time.perf_counter() - started
+                    self.stage_calls[stage] += 1
+
+        return wrapper
+
+    def _counted(self, name, func):
+        root_dir = self.root_dir
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            path = args[0] if args else kwargs.get("path", kwargs.get("file"))
+            if isinstance(path, (str, os.PathLike)) and os.fspath(path).startswith(root_dir):
+                with self._lock:
+                    self.file_ops[name] = self.file_ops.get(name, 0) + 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+
+def peak_rss_kb() -> dict:
+    """Peak resident set size of this process and of its (stub pingo) children, in KB."""
+    try:
+        import resource
+    except ImportError:
+        return {"self": None, "children": None}
+    scale = 1024 if sys.platform == "darwin" else 1  # macOS reports bytes, Linux KB
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale,
+    }
+
+
+def _delete(paths) -> None:
+    for path in paths if isinstance(paths, list) else [paths]:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="comic-optimizer-bench-", dir=args.work_dir)
+    try:
+        library = generate_library(
+            work_dir,
+            series=args.series,
+            chapters=args.chapters,
+            pages=args.pages,
+            page_kb=(args.min_kb, args.max_kb),
+            formats=tuple(args.formats.split(",")),
+            seed=args.seed,
+        )
+        presets = {
+            "stub": [
+                sys.executable, os.path.join(HERE, "stub_pingo.py"), "-s4", "-webp", "-process=4",
+                f"-stub-cost={args.cost}", f"-stub-ratio={args.ratio}",
+            ]
+        }
+        recorder = Recorder(work_dir)
+        if not args.real_trash:
+            # Don't fill the user's trash with benchmark files
+            recorder._patch(send2trash, "send2trash", _delete)
+        recorder.install()
+        started = time.perf_counter()
+        try:
+            if args.mode == "folder":
+                for folder_path, zip_file_path in core.discover_folders(work_dir, ".cbz"):
+                    core.process_single_folder(folder_path, zip_file_path, "stub", args.skip_pingo, presets)
+            else:
+                core.process_root_directory(
+                    work_dir, ".cbz", "stub", args.skip_pingo, presets, max_workers=args.workers,
+                    removal_policy=args.removal
+                )
+        finally:
+            wall = time.perf_counter() - started
+            recorder.uninstall()
+        bytes_out = sum(
+            os.path.getsize(os.path.join(root, file))
+            for root, _, files in os.walk(work_dir)
+            for file in files
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "library": library,
+        "wall_seconds": round(wall, 4),
+        "pages_per_second": round(library["pages"] / wall, 2) if wall else None,
+        "bytes_out": bytes_out,
+        "stage_seconds": {name: round(value, 4) for name, value in recorder.stage_seconds.items()},
+        "stage_calls": recorder.stage_calls,
+        "peak_rss_kb": peak_rss_kb(),
+        "file_ops": dict(sorted(recorder.file_ops.items())),
+        "file_ops_total": sum(recorder.file_ops.values()),
+    }
+
+
+def compare(result: dict, baseline: dict) -> list:
+    """Return lines comparing the headline numbers with a baseline run."""
+    lines = []
+
+    def delta(label, new, old):
+        if new is None or old in (None, 0):
+            return
+        lines.append(f"{label:<24}{old:>12.3f} -> {new:>12.3f}  ({(new - old) / old * 100:+.1f}%)")
+
+    delta("wall_seconds", result["wall_seconds"], baseline.get("wall_seconds"))
+    for name, value in result["stage_seconds"].items():
+        delta(f"stage {name}", value, baseline.get("stage_seconds", {}).get(name))
+    delta("file_ops_total", result["file_ops_total"], baseline.get("file_ops_total"))
+    delta("peak_rss_kb", result["peak_rss_kb"]["self"], baseline.get("peak_rss_kb", {}).get("self"))
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=2)
+    parser.add_argument("--chapters", type=int, default=5, help="chapters per series")
+    parser.add_argument("--pages", type=int, default=20, help="pages per chapter")
+    parser.add_argument("--min-kb", type=int, default=200)
+    parser.add_argument("--max-kb", type=int, default=800)
+    parser.add_argument("--formats", default="png,jpg", help="comma separated, from png,jpg,webp")
+    parser.add_argument("--cost", type=int, default=20, help="stub pingo hash rounds per KB")
+    parser.add_argument("--ratio", type=float, default=0.6, help="stub pingo output/input size")
+    parser.add_argument("--mode", choices=("batch", "folder"), default="batch",
+                        help="process_root_directory, or process_single_folder one folder at a time")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--skip-pingo", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="where to generate the library (default: temp dir)")
+    parser.add_argument("--removal", choices=("trash", "delete", "keep"), default="trash",
+                        help="what batch mode does with processed folders")
+    parser.add_argument("--real-trash", action="store_true", help="send processed folders to the real trash")
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(["", "Compared with baseline:"] + compare(result, baseline)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
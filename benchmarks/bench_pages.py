@@ -0,0 +1,132 @@
+"""
+Benchmark page classification on a folder with many entries.
+
+Examples:
+  python benchmarks/bench_pages.py --entries 10000
+  python benchmarks/bench_pages.py --entries 20000 -o pages.json
+
+The folder holds pages with mixed-case extensions, pages whose content is another
+format than their extension, images without an extension and non-image files.
+Timed, best of --repeat:
+  classify_endswith  the previous per-name test, any(name.endswith(ext) ...), which missed upper case
+  classify_lower     the same on name.lower(), as the planner did
+  classify_lookup    imageinfo.image_format, one lookup per name in any case
+  scan               building the FolderIndex (one os.scandir pass)
+  sniff              FolderIndex.sniff, reading the first bytes of every file
+  prepare            delete_non_image_files and rename_files_with_zero_padding on a fresh copy
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))
+
+from comic_optimizer import config, core  # noqa: E402
+from comic_optimizer.folderindex import FolderIndex  # noqa: E402
+from comic_optimizer.imageinfo import image_format  # noqa: E402
+
+HEADERS = {"png": b"\x89PNG\r\n\x1a\n", "jpeg": b"\xff\xd8\xff\xe0", "webp": b"RIFF\0\0\0\0WEBPVP8 "}
+EXTENSIONS = {"png": [".png", ".PNG"], "jpeg": [".jpg", ".JPG", ".jpeg"], "webp": [".webp"]}
+JUNK = [".txt", ".xml", ".nfo", ".db", ".url"]
+
+
+def make_folder(folder: str, entries: int, seed: int) -> dict:
+    """Write entries files, mostly pages; returns how many of each kind were written."""
+    rng = random.Random(seed)
+    counts = {"pages": 0, "mislabeled": 0, "no_extension": 0, "junk": 0}
+    for number in range(entries):
+        kind = rng.choices(list(counts), weights=(85, 4, 1, 10))[0]
+        fmt = rng.choice(list(HEADERS))
+        if kind == "junk":
+            name, data = f"file{number}{rng.choice(JUNK)}", b"not an image"
+        elif kind == "mislabeled":
+            other = rng.choice([f for f in EXTENSIONS if f != fmt])
+            name, data = f"page{number}{EXTENSIONS[other][0]}", HEADERS[fmt]
+        elif kind == "no_extension":
+            name, data = f"page{number}", HEADERS[fmt]
+        else:
+            name, data = f"page{number}{rng.choice(EXTENSIONS[fmt])}", HEADERS[fmt]
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(data + bytes(64))
+        counts[kind] += 1
+    return counts
+
+
+def best_of(repeat: int, func, setup=None) -> float:
+    best = None
+    for _ in range(repeat):
+        state = setup() if setup else None
+        started = time.perf_counter()
+        func(state)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 5)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="where to write the folder (default: temp dir)")
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="comic-optimizer-bench-", dir=args.work_dir)
+    try:
+        source = os.path.join(work_dir, "source")
+        os.makedirs(source)
+        counts = make_folder(source, args.entries, args.seed)
+        names = os.listdir(source)
+        copy = os.path.join(work_dir, "copy")
+
+        def fresh_copy():
+            shutil.rmtree(copy, ignore_errors=True)
+            shutil.copytree(source, copy)
+            return FolderIndex(copy)
+
+        def prepare(index):
+            core.delete_non_image_files(copy, index)
+            core.rename_files_with_zero_padding(copy, index)
+
+        seconds = {
+            "classify_endswith": best_of(args.repeat, lambda _: [
+                name for name in names if any(name.endswith(ext) for ext in config.IMAGE_EXTENSIONS)
+            ]),
+            "classify_lower": best_of(args.repeat, lambda _: [
+                name for name in names if any(name.lower().endswith(ext) for ext in config.IMAGE_EXTENSIONS)
+            ]),
+            "classify_lookup": best_of(args.repeat, lambda _: [name for name in names if image_format(name)]),
+            "scan": best_of(args.repeat, lambda _: FolderIndex(source)),
+            "sniff": best_of(args.repeat, lambda index: index.sniff(), lambda: FolderIndex(source)),
+            "prepare": best_of(args.repeat, prepare, fresh_copy),
+        }
+        index = fresh_copy()
+        prepare(index)
+        pages_found = len(index.pages())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "entries": counts,
+        "pages_found": pages_found,
+        "seconds": seconds,
+        "us_per_entry": {name: round(value / args.entries * 1e6, 2) for name, value in seconds.items()},
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
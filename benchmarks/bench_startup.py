@@ -0,0 +1,129 @@
+"""
+Benchmark cold and warm start-up time of the source tree and of a Nuitka build.
+
+Examples:
+  python benchmarks/bench_startup.py -o startup.json
+  python benchmarks/bench_startup.py --binary dist/comic-optimizer/comic-optimizer.exe --baseline startup.json
+
+Each target is started as a fresh process --repeat times. The first run is
+reported as cold (the closest to a first launch that can be had without
+dropping the OS file cache); the median of the rest as warm. GUI targets run
+with COMIC_OPTIMIZER_EXIT_AFTER_STARTUP set, so the window closes as soon as it
+is first idle and the time covers imports, settings and building the window.
+Every run uses an empty temporary home, so no user settings are read.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+
+
+def import_command(module: str) -> list:
+    return [sys.executable, "-c", f"import sys; sys.path.insert(0, {SRC!r}); import comic_optimizer.{module}"]
+
+
+# Source targets, timed from process start to exit
+SOURCE_TARGETS = {
+    "python": [sys.executable, "-c", "pass"],
+    "import_cli": import_command("cli"),
+    "import_gui": import_command("gui"),
+    "cli_help": [
+        sys.executable, "-c",
+        f"import sys; sys.path.insert(0, {SRC!r}); from comic_optimizer.cli import main; sys.exit(main())", "--help"
+    ],
+    "gui": [sys.executable, os.path.join(SRC, "main.py")],
+}
+
+
+def time_run(command: list, env: dict) -> float:
+    started = time.perf_counter()
+    completed = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        last_line = completed.stderr.strip().splitlines()[-1:] or [""]
+        raise RuntimeError(f"exited with {completed.returncode}: {last_line[0]}")
+    return elapsed
+
+
+def measure(command: list, repeat: int, env: dict) -> dict:
+    times = [time_run(command, env) for _ in range(repeat)]
+    return {
+        "cold_seconds": round(times[0], 4),
+        "warm_seconds": round(statistics.median(times[1:]), 4) if len(times) > 1 else None,
+        "runs": len(times),
+    }
+
+
+def run(args) -> dict:
+    targets = {name: command for name, command in SOURCE_TARGETS.items() if name in args.targets}
+    if args.binary:
+        targets["binary"] = [os.path.abspath(args.binary)]
+    home = tempfile.mkdtemp(prefix="comic-optimizer-bench-home-")
+    env = dict(os.environ, HOME=home, APPDATA=home, COMIC_OPTIMIZER_EXIT_AFTER_STARTUP="1")
+    results = {}
+    try:
+        for name, command in targets.items():
+            try:
+                results[name] = measure(command, args.repeat, env)
+            except (OSError, RuntimeError) as e:
+                # The GUI targets need a display and ttkbootstrap; report the rest
+                results[name] = {"error": str(e)}
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "targets": results,
+    }
+
+
+def compare(result: dict, baseline: dict) -> list:
+    """Return lines comparing start-up times with a baseline run."""
+    lines = []
+
+    def delta(label, new, old):
+        if new is None or old in (None, 0):
+            return
+        lines.append(f"{label:<24}{old:>12.3f} -> {new:>12.3f}  ({(new - old) / old * 100:+.1f}%)")
+
+    for name, times in result["targets"].items():
+        old = baseline.get("targets", {}).get(name, {})
+        delta(f"{name} cold", times.get("cold_seconds"), old.get("cold_seconds"))
+        delta(f"{name} warm", times.get("warm_seconds"), old.get("warm_seconds"))
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="runs per target, the first one is cold")
+    parser.add_argument("--targets", default=",".join(SOURCE_TARGETS),
+                        help=f"comma separated, from {','.join(SOURCE_TARGETS)}")
+    parser.add_argument("--binary", help="also time this Nuitka build of the GUI")
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+    args.targets = [name.strip() for name in args.targets.split(",") if name.strip()]
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(["", "Compared with baseline:"] + compare(result, baseline)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Generate a synthetic comic library for the benchmarks."""
+import os
+import random
+import struct
+
+FORMATS = ("png", "jpg", "webp")
+
+
+def _header(fmt: str, width: int, height: int) -> bytes:
+    """Return a minimal but parseable header for the format."""
+    if fmt == "png":
+        return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height) + b"\x08\x02\0\0\0"
+    if fmt == "jpg":
+        return b"\xff\xd8\xff\xc0" + struct.pack(">HBHH", 17, 8, height, width) + b"\x03" + bytes(9)
+    if fmt == "webp":
+        return (b"RIFF\0\0\0\0WEBPVP8X" + struct.pack("<I", 10) + bytes(4)
+                + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little"))
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+def generate_library(
+        root_dir: str,
+        series: int = 2,
+        chapters: int = 5,
+        pages: int = 20,
+        page_kb: tuple = (200, 800),
+        formats: tuple = ("png", "jpg"),
+        extras: int = 1,
+        seed: int = 0
+) -> dict:
+    """
+    Write series/chapter/page folders under root_dir and return a summary.
+    page_kb is the (min, max) size of each page; formats are picked at random per
+    page. Each chapter also gets `extras` non-image files for the cleanup stage.
+    """
+    rng = random.Random(seed)
+    total_pages = total_bytes = 0
+    for series_index in range(series):
+        for chapter_index in range(chapters):
+            folder = os.path.join(root_dir, f"Series {series_index + 1}", f"Chapter {chapter_index + 1}")
+            os.makedirs(folder, exist_ok=True)
+            for page_index in range(pages):
+                fmt = rng.choice(formats)
+                width, height = rng.choice(((1200, 1800), (1600, 2400), (2000, 3000)))
+                size = rng.randint(page_kb[0], page_kb[1]) * 1024
+                header = _header(fmt, width, height)
+                with open(os.path.join(folder, f"page {page_index + 1}.{fmt}"), "wb") as f:
+                    f.write(header + rng.randbytes(max(0, size - len(header))))
+                total_pages += 1
+                total_bytes += size
+            for extra_index in range(extras):
+                with open(os.path.join(folder, f"credits {extra_index + 1}.txt"), "w", encoding="utf-8") as f:
+                    f.write("Scanlated by nobody\n")
+    return {
+        "series": series,
+        "chapters": series * chapters,
+        "pages": total_pages,
+        "bytes": total_bytes,
+    }
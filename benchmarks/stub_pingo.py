@@ -0,0 +1,67 @@
+"""
+Deterministic stand-in for pingo used by the benchmarks.
+
+Accepts the same arguments as a pingo preset plus two extra flags:
+  -stub-cost=N   CPU work per KB of input, in hash rounds (default 20)
+  -stub-ratio=R  output size as a fraction of the input (default 0.6)
+
+With -webp, each page is written as a .webp next to the original; otherwise it is
+rewritten in place. Output bytes are derived from the input, so runs are repeatable.
+"""
+import hashlib
+import os
+import sys
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".avif", ".gif"}
+
+
+def burn(data: bytes, rounds: int) -> bytes:
+    digest = hashlib.sha256(data[:4096]).digest()
+    for _ in range(rounds):
+        digest = hashlib.sha256(digest).digest()
+    return digest
+
+
+def optimize(path: str, webp: bool, cost: int, ratio: float) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    seed = burn(data, cost * max(1, len(data) // 1024))
+    size = max(16, int(len(data) * ratio))
+    body = (seed * (size // len(seed) + 1))[:size]
+    stem, ext = os.path.splitext(path)
+    if webp:
+        out_path = stem + ".webp"
+        payload = b"RIFF" + (size + 4).to_bytes(4, "little") + b"WEBP" + body
+    else:
+        out_path = path
+        payload = data[:16] + body
+    with open(out_path, "wb") as f:
+        f.write(payload)
+    return f"{os.path.basename(path)} : {len(data)} -> {len(payload)}"
+
+
+def main(argv: list) -> int:
+    flags = [arg for arg in argv if arg.startswith("-")]
+    targets = [arg for arg in argv if not arg.startswith("-")]
+    webp = "-webp" in flags
+    cost, ratio = 20, 0.6
+    for flag in flags:
+        if flag.startswith("-stub-cost="):
+            cost = int(flag.split("=", 1)[1])
+        elif flag.startswith("-stub-ratio="):
+            ratio = float(flag.split("=", 1)[1])
+    files = []
+    for target in targets:
+        if os.path.isdir(target):
+            for root, _, names in os.walk(target):
+                files.extend(os.path.join(root, name) for name in names)
+        else:
+            files.append(target)
+    for path in sorted(files):
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            print(optimize(path, webp, cost, ratio))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -16,9 +16,9 @@ if "%GIT_TAG%"=="" (
 )
 
 REM --------------------------------------------------------------------------
-REM Update the src/version.py file with the latest version
+REM Update the src/comic_optimizer/version.py file with the latest version
 REM --------------------------------------------------------------------------
-(echo __version__ = "%VERSION_STRING%") > src/version.py
+(echo __version__ = "%VERSION_STRING%") > src/comic_optimizer/version.py
 
 REM --------------------------------------------------------------------------
 REM Run Nuitka
@@ -5,7 +5,7 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import PRIMARY
 
 try:
-    from version import __version__ as VERSION
+    from .version import __version__ as VERSION
 except ImportError:
     try:
         VERSION = subprocess.check_output([
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from . import config
+from .control import POLL_SECONDS
+from .encoders import encode
+
+logger = logging.getLogger(__name__)
+
+
+def pick_samples(pages: list, count: int) -> list:
+    """Return up to count pages spread evenly through the list (never the first, often a cover)."""
+    if len(pages) <= count:
+        return list(pages)
+    step = len(pages) / (count + 1)
+    return [pages[int(step * (index + 1))] for index in range(count)]
+
+
+class PresetSelector:
+    """
+    Pick a preset per series by running every candidate on a few sample pages.
+    With max_seconds_per_mb, the preset with the smallest output among those fast
+    enough wins; with max_size_ratio, the fastest preset reaching that output/input
+    ratio wins. Without a budget, or if no preset meets it, the smallest output wins
+    (the fastest one under a time budget). Decisions are kept per series, and saved
+    to decisions_path if given, so later chapters skip the sampling.
+    Sample timings are wall-clock and include any load from folders running at the same time.
+    """
+
+    def __init__(
+            self,
+            presets: dict,
+            candidates: Optional[list] = None,
+            max_seconds_per_mb: float = 0.0,
+            max_size_ratio: float = 0.0,
+            sample_pages: int = config.ADAPTIVE_SAMPLE_PAGES,
+            decisions_path: Optional[str] = None
+    ):
+        self.presets = presets
+        self.candidates = [name for name in (candidates or presets) if presets.get(name)]
+        if not self.candidates:
+            raise ValueError("No presets to choose from")
+        self.max_seconds_per_mb = max_seconds_per_mb
+        self.max_size_ratio = max_size_ratio
+        self.sample_pages = sample_pages
+        self.decisions_path = decisions_path
+        self._decisions = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_settings(cls, user_settings: dict, decisions_path: Optional[str] = None) -> "PresetSelector":
+        return cls(
+            user_settings.get("presets", {}),
+            candidates=user_settings.get("adaptive_presets") or None,
+            max_seconds_per_mb=user_settings.get("adaptive_max_seconds_per_mb", 0),
+            max_size_ratio=user_settings.get("adaptive_max_size_ratio", 0),
+            decisions_path=decisions_path,
+        )
+
+    @property
+    def signature(self) -> str:
+        """Identifies the candidates and budget a saved decision was made with."""
+        commands = [[name] + list(self.presets[name]) for name in self.candidates]
+        return json.dumps([commands, self.max_seconds_per_mb, self.max_size_ratio])
+
+    def choose(self, series: str, load_samples, control=None) -> tuple:
+        """
+        Return (preset_name, note) for a series.
+        load_samples() returns a list of (file_name, bytes); it is only called when the
+        series has no decision yet. Chapters of a series that ask while its sampling is
+        running wait for that result instead of sampling again.
+        With a control.BatchControl, sampling and waiting stop with the batch (Cancelled).
+        """
+        with self._lock:
+            if series in self._decisions:
+                return self._decisions[series], "kept for the series"
+            waiting = series in self._pending
+            if not waiting:
+                self._pending[series] = threading.Event()
+            event = self._pending[series]
+        if waiting:
+            while not event.wait(POLL_SECONDS) or control is not None and control.cancelled:
+                if control is not None:
+                    control.checkpoint()
+            with self._lock:
+                if series in self._decisions:
+                    return self._decisions[series], "kept for the series"
+            return self.candidates[0], "sampling failed, using the first candidate"
+        try:
+            if len(self.candidates) == 1:
+                preset, note = self.candidates[0], "only candidate"
+            else:
+                preset, note = self._sample(load_samples(), control)
+            with self._lock:
+                self._decisions[series] = preset
+            self._save()
+            return preset, note
+        finally:
+            with self._lock:
+                del self._pending[series]
+            event.set()
+
+    def _sample(self, samples: list, control=None) -> tuple:
+        bytes_in = sum(len(data) for _, data in samples)
+        if not bytes_in:
+            return self.candidates[0], "no pages to sample"
+        results = []
+        for name in self.candidates:
+            try:
+                seconds, bytes_out = self._run(self.presets[name], samples, control)
+            except (OSError, RuntimeError) as e:
+                logger.warning(f"Leaving out preset {name}: {e}")
+                continue
+            results.append((name, seconds / (bytes_in / (1024 * 1024)), bytes_out / bytes_in))
+        if not results:
+            return self.candidates[0], "every candidate failed on the samples"
+        if self.max_seconds_per_mb:
+            fast = [result for result in results if result[1] <= self.max_seconds_per_mb]
+            best = min(fast, key=lambda r: r[2]) if fast else min(results, key=lambda r: r[1])
+        elif self.max_size_ratio:
+            small = [result for result in results if result[2] <= self.max_size_ratio]
+            best = min(small, key=lambda r: r[1]) if small else min(results, key=lambda r: r[2])
+        else:
+            best = min(results, key=lambda r: r[2])
+        note = f"sampled {len(samples)} pages: " + ", ".join(
+            f"{name} {ratio:.2f} of the size at {speed:.1f}s/MB" for name, speed, ratio in results
+        )
+        return best[0], note
+
+    @staticmethod
+    def _run(cmd: list, samples: list, control=None) -> tuple:
+        """Run cmd on copies of the samples; return (seconds, bytes of the smaller file per page)."""
+        scratch = tempfile.mkdtemp(prefix="comic-optimizer-sample-")
+        try:
+            paths = []
+            for file_name, data in samples:
+                path = os.path.join(scratch, file_name)
+                with open(path, "wb") as f:
+                    f.write(data)
+                paths.append(path)
+            started = time.perf_counter()
+            encode(cmd, paths, control)
+            seconds = time.perf_counter() - started
+            bytes_out = 0
+            for path in paths:
+                webp_path = os.path.splitext(path)[0] + ".webp"
+                size = os.path.getsize(path)
+                if webp_path != path and os.path.exists(webp_path):
+                    size = min(size, os.path.getsize(webp_path))
+                bytes_out += size
+            return seconds, bytes_out
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def _load(self) -> None:
+        if not self.decisions_path or not os.path.exists(self.decisions_path):
+            return
+        try:
+            with open(self.decisions_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring preset decisions in {self.decisions_path}: {e}")
+            return
+        self._decisions = {
+            series: entry["preset"]
+            for series, entry in saved.items()
+            if entry.get("signature") == self.signature and entry.get("preset") in self.candidates
+        }
+
+    def _save(self) -> None:
+        if not self.decisions_path:
+            return
+        with self._lock:
+            saved = {}
+            if os.path.exists(self.decisions_path):
+                try:
+                    with open(self.decisions_path, "r", encoding="utf-8") as f:
+                        saved = json.load(f)
+                except (OSError, ValueError):
+                    saved = {}
+            signature = self.signature
+            saved.update({
+                series: {"preset": preset, "signature": signature}
+                for series, preset in self._decisions.items()
+            })
+            os.makedirs(os.path.dirname(self.decisions_path), exist_ok=True)
+            temp_path = self.decisions_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(saved, f, indent=1)
+            os.replace(temp_path, self.decisions_path)
@@ -0,0 +1,302 @@
+import errno
+import html
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from typing import Callable, Optional
+
+from . import config
+
+# ZIP records, written by hand so stored pages can be copied file to file
+_LOCAL_SIGNATURE = 0x04034B50
+_CENTRAL_SIGNATURE = 0x02014B50
+_END_SIGNATURE = 0x06054B50
+_ZIP64_END_SIGNATURE = 0x06064B50
+_ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END = struct.Struct("<IHHHHIIH")
+_ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+_ZIP64_EXTRA = struct.Struct("<HHQQ")
+_UTF8_FLAG = 0x800
+_CREATE_SYSTEM = 0 if sys.platform == "win32" else 3
+
+# Bytes handed to one copy_file_range/sendfile call (Linux copies at most ~2 GB per call)
+_MAX_KERNEL_COPY = 1 << 30
+# Errors meaning the kernel copy isn't available for these files; fall back to the next method
+_COPY_NOT_SUPPORTED = {
+    errno.ENOSYS, errno.EINVAL, errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSOCK, errno.EBADF,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+}
+
+
+class CbzWriter:
+    """
+    Stream pages into an archive in reading order.
+    Pages can be added as soon as they are ready, in any order and from several
+    threads; each one is written as soon as every page before it has been written.
+    Entries are stored (not compressed), so each page is copied file to file by the
+    kernel (copy_file_range or sendfile) instead of through Python buffers, and its
+    CRC-32 is computed over a memory map unless the caller already knows it. Other
+    entries (add_extra) follow the pages, and a ComicInfo.xml page index is added on
+    close unless one was among them. The archive is written under a .part name and
+    only renamed once close() succeeds.
+    """
+
+    def __init__(self, zip_file_path: str, page_count: int, buffer_size: int = config.ARCHIVE_BUFFER_SIZE):
+        self.zip_file_path = zip_file_path
+        self.part_path = zip_file_path + ".part"
+        self.page_count = page_count
+        self.buffer_size = buffer_size
+        self._file = open(self.part_path, "wb", buffering=0)
+        self._offset = 0
+        self._entries = []
+        self._pending = {}
+        self._next = 0
+        self._written = []
+        self._extras = []
+        self._lock = threading.Lock()
+
+    def has_page(self, index: int) -> bool:
+        return index < self._next or index in self._pending
+
+    def add_page(
+            self, index: int, path: str, arcname: Optional[str] = None, crc: Optional[int] = None,
+            offset: int = 0, size: Optional[int] = None
+    ) -> None:
+        """
+        Queue page number index (0-based, in reading order) and write every page that is now in order.
+        The page is size bytes at offset in path, by default the whole file. crc is its
+        CRC-32 if already known, e.g. from the archive it is copied out of.
+        """
+        with self._lock:
+            self._pending[index] = (arcname or os.path.basename(path), path, None, crc, offset, size)
+            self._flush()
+
+    def add_page_bytes(self, index: int, arcname: str, data: bytes, crc: Optional[int] = None) -> None:
+        """Like add_page, for a page already in memory (e.g. decompressed from another archive)."""
+        with self._lock:
+            self._pending[index] = (arcname, None, data, crc, 0, len(data))
+            self._flush()
+
+    def add_extra(
+            self, arcname: str, path: Optional[str] = None, data: Optional[bytes] = None, crc: Optional[int] = None,
+            offset: int = 0, size: Optional[int] = None
+    ) -> None:
+        """Queue an entry that isn't a page (metadata, notes), from path as in add_page or from data, for close()."""
+        with self._lock:
+            self._extras.append((arcname, path, data, crc, offset, len(data) if data is not None else size))
+
+    def _flush(self) -> None:
+        while self._next in self._pending:
+            self._write_page(*self._pending.pop(self._next))
+            self._next += 1
+
+    def _write_page(
+            self, arcname: str, path: Optional[str], data: Optional[bytes], crc: Optional[int], offset: int,
+            size: Optional[int], page: bool = True
+    ) -> None:
+        if data is not None:
+            self._write_bytes(arcname, data, crc)
+            if page:
+                self._written.append((arcname, len(data)))
+            return
+        with open(path, "rb", buffering=0) as src:
+            stat = os.fstat(src.fileno())
+            if size is None:
+                size = stat.st_size - offset
+            if crc is None:
+                crc = _crc32(src, offset, size)
+            self._write_entry(arcname, crc, size, stat.st_mtime, stat.st_mode)
+            _copy_range(src, self._file, offset, size, self.buffer_size)
+        self._offset += size
+        if page:
+            self._written.append((arcname, size))
+
+    def _write_bytes(self, arcname: str, data: bytes, crc: Optional[int] = None) -> None:
+        self._write_entry(arcname, zlib.crc32(data) if crc is None else crc, len(data), time.time(), 0o600)
+        _write_all(self._file, data)
+        self._offset += len(data)
+
+    def _write_entry(self, arcname: str, crc: int, size: int, mtime: float, mode: int) -> None:
+        """Write the local header of a stored entry and remember it for the central directory."""
+        name = arcname.replace(os.sep, "/").encode("utf-8")
+        flags = 0 if name.isascii() else _UTF8_FLAG
+        dos_time, dos_date = _dos_timestamp(mtime)
+        extra = b""
+        version = zipfile.DEFAULT_VERSION
+        if size > zipfile.ZIP64_LIMIT:
+            extra = _ZIP64_EXTRA.pack(1, 16, size, size)
+            version = zipfile.ZIP64_VERSION
+        header_size = size if not extra else 0xFFFFFFFF
+        header = _LOCAL_HEADER.pack(
+            _LOCAL_SIGNATURE, version, flags, zipfile.ZIP_STORED, dos_time, dos_date, crc, header_size,
+            header_size, len(name), len(extra)
+        )
+        _write_all(self._file, header + name + extra)
+        self._entries.append((name, flags, dos_time, dos_date, crc, size, self._offset, (mode & 0xFFFF) << 16))
+        self._offset += len(header) + len(name) + len(extra)
+
+    def _write_central_directory(self) -> None:
+        start = self._offset
+        records = []
+        for name, flags, dos_time, dos_date, crc, size, offset, external_attr in self._entries:
+            # Fields too large for 32 bits move to the zip64 extra field, in this order
+            zip64 = [value for value in (size, size, offset) if value > zipfile.ZIP64_LIMIT]
+            extra = struct.pack(f"<HH{len(zip64)}Q", 1, 8 * len(zip64), *zip64) if zip64 else b""
+            version = zipfile.ZIP64_VERSION if zip64 else zipfile.DEFAULT_VERSION
+            size_field = 0xFFFFFFFF if size > zipfile.ZIP64_LIMIT else size
+            records.append(_CENTRAL_HEADER.pack(
+                _CENTRAL_SIGNATURE, _CREATE_SYSTEM << 8 | version, version, flags, zipfile.ZIP_STORED, dos_time,
+                dos_date, crc, size_field, size_field, len(name), len(extra), 0, 0, 0, external_attr,
+                0xFFFFFFFF if offset > zipfile.ZIP64_LIMIT else offset
+            ) + name + extra)
+        directory = b"".join(records)
+        end = start + len(directory)
+        count = len(self._entries)
+        if count > zipfile.ZIP_FILECOUNT_LIMIT or start > zipfile.ZIP64_LIMIT or len(directory) > zipfile.ZIP64_LIMIT:
+            directory += _ZIP64_END.pack(
+                _ZIP64_END_SIGNATURE, _ZIP64_END.size - 12, zipfile.ZIP64_VERSION, zipfile.ZIP64_VERSION, 0, 0,
+                count, count, end - start, start
+            )
+            directory += _ZIP64_LOCATOR.pack(_ZIP64_LOCATOR_SIGNATURE, 0, end, 1)
+            count, size, start = min(count, 0xFFFF), 0xFFFFFFFF, 0xFFFFFFFF
+        else:
+            size = end - start
+        directory += _END.pack(_END_SIGNATURE, 0, 0, count, count, size, start, 0)
+        _write_all(self._file, directory)
+
+    def close(self, check: Optional[Callable[[str], Optional[str]]] = None) -> Optional[str]:
+        """
+        Write the page index, finish the archive and move it into place.
+        check is given the finished .part file first; if it returns a problem, the
+        .part is discarded, whatever is at zip_file_path is left alone and the
+        problem is returned.
+        """
+        if self._pending:
+            missing = sorted(set(range(self._next, self.page_count)) - set(self._pending))
+            raise ValueError(f"{self.zip_file_path}: pages {missing} were never added")
+        for extra in self._extras:
+            self._write_page(*extra, page=False)
+        # An archive's own ComicInfo.xml (series, writer, ...) is kept rather than replaced by the page index
+        if not any(extra[0].lower() == "comicinfo.xml" for extra in self._extras):
+            self._write_bytes("ComicInfo.xml", build_comic_info(self._written).encode("utf-8"))
+        self._write_central_directory()
+        self._file.close()
+        problem = check(self.part_path) if check is not None else None
+        if problem is not None:
+            os.remove(self.part_path)
+            return problem
+        os.replace(self.part_path, self.zip_file_path)
+        return None
+
+    def abort(self) -> None:
+        """Discard the partial archive."""
+        try:
+            self._file.close()
+        finally:
+            if os.path.exists(self.part_path):
+                os.remove(self.part_path)
+
+
+def _dos_timestamp(mtime: float) -> tuple:
+    """Return the (time, date) fields of a ZIP entry for mtime, clamped to the 1980-2107 range."""
+    year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    elif year > 2107:
+        year, month, day, hour, minute, second = 2107, 12, 31, 23, 59, 58
+    return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+
+def _crc32(src, offset: int, size: int) -> int:
+    """CRC-32 of size bytes at offset in src, read through a memory map in one pass."""
+    if size == 0:
+        return 0
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    try:
+        view = mmap.mmap(src.fileno(), offset - start + size, access=mmap.ACCESS_READ, offset=start)
+    except (OSError, ValueError):
+        # Not mappable (some network or virtual filesystems): read it in large chunks
+        src.seek(offset)
+        crc = 0
+        while size:
+            chunk = src.read(min(config.ARCHIVE_BUFFER_SIZE, size))
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size -= len(chunk)
+        return crc
+    with view, memoryview(view) as data:
+        return zlib.crc32(data[offset - start:])
+
+
+def entry_data_offset(src, info: zipfile.ZipInfo) -> int:
+    """Return where the data of a ZIP entry starts in the archive file src (after its local header)."""
+    src.seek(info.header_offset)
+    header = src.read(_LOCAL_HEADER.size)
+    if len(header) != _LOCAL_HEADER.size or _LOCAL_HEADER.unpack(header)[0] != _LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    name_length, extra_length = _LOCAL_HEADER.unpack(header)[-2:]
+    return info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+
+
+def _copy_range(src, dst, offset: int, size: int, buffer_size: int) -> None:
+    """Append size bytes at offset in src to dst, in the kernel where the platform allows."""
+    end = offset + size
+    for name in ("copy_file_range", "sendfile"):
+        if offset >= end or not hasattr(os, name):
+            continue
+        try:
+            while offset < end:
+                count = min(end - offset, _MAX_KERNEL_COPY)
+                if name == "copy_file_range":
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), count, offset)
+                else:
+                    copied = os.sendfile(dst.fileno(), src.fileno(), offset, count)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError as e:
+            # The next method picks up at offset
+            if e.errno not in _COPY_NOT_SUPPORTED:
+                raise
+    if offset >= end:
+        return
+    src.seek(offset)
+    buffer = memoryview(bytearray(min(buffer_size, end - offset)))
+    while offset < end:
+        count = src.readinto(buffer[:min(len(buffer), end - offset)])
+        if not count:
+            raise OSError(f"{src.name} is shorter than expected")
+        _write_all(dst, buffer[:count])
+        offset += count
+
+
+def _write_all(dst, data) -> None:
+    """Write data to an unbuffered file, which may accept only part of it per call."""
+    view = memoryview(data)
+    while view:
+        view = view[dst.write(view):]
+
+
+def build_comic_info(pages: list) -> str:
+    """Return a ComicInfo.xml listing each (name, size) page in reading order."""
+    lines = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<ComicInfo xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">',
+        f"  <PageCount>{len(pages)}</PageCount>",
+        "  <Pages>",
+    ]
+    for index, (name, size) in enumerate(pages):
+        page_type = ' Type="FrontCover"' if index == 0 else ""
+        lines.append(f'    <Page Image="{index}" ImageSize="{size}" Key="{html.escape(name, quote=True)}"{page_type} />')
+    lines += ["  </Pages>", "</ComicInfo>", ""]
+    return "\n".join(lines)
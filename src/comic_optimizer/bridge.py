@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+from . import config, core
+from .control import BatchControl
+
+# Marks the end of the batch in the event queue
+_DONE = object()
+
+
+class BatchBridge:
+    """
+    The bridge between a front end (the GUI, the command line) and one batch run.
+    It builds core.run_batch's arguments from a settings dict (the user settings
+    with the front end's choices on top): the page cache, the auto preset's
+    selector, workers, logging. The batch is orchestrated on the event loop that
+    consumes events(); run() and start() give it a loop of their own.
+    Progress comes out of events() as an async stream of dicts, keyed by "event":
+        status   message
+        report   folder, output
+        folder   folder, archive, bytes_in, bytes_out, seconds, pages_kept, pages_skipped
+        stage    folder, stage, seconds, files_in/out, bytes_in/out (with stage_timings)
+        error    message; the batch failed and no summary follows
+        summary  folders, bytes_in, bytes_out, bytes_saved, seconds, stopped
+    Events pass through a bounded queue. The batch's callbacks block while it is
+    full, so a consumer that falls behind holds the batch back instead of piling
+    events up. pause(), resume() and cancel() may be called from any thread.
+    """
+
+    def __init__(self, root_dir: str, settings: dict, resume: bool = True):
+        self.root_dir = root_dir
+        self.settings = settings
+        self._resume = resume
+        self.control = BatchControl()
+
+    @property
+    def paused(self) -> bool:
+        return self.control.paused
+
+    @property
+    def cancelled(self) -> bool:
+        return self.control.cancelled
+
+    def pause(self) -> None:
+        self.control.pause()
+
+    def resume(self) -> None:
+        self.control.resume()
+
+    def cancel(self) -> None:
+        self.control.cancel()
+
+    async def events(self):
+        """Run the batch, yielding its events; closing the stream early (aclose()) stops the batch."""
+        queue = asyncio.Queue(maxsize=config.BRIDGE_EVENT_QUEUE_SIZE)
+        closed = threading.Event()
+        batch = asyncio.ensure_future(self._run(queue, closed))
+        finished = False
+        try:
+            while True:
+                event = await queue.get()
+                if event is _DONE:
+                    finished = True
+                    break
+                yield event
+        finally:
+            closed.set()
+            drain = None
+            if not finished:
+                self.cancel()
+                # Threads blocked on the full queue must get through to see the stop
+                drain = asyncio.ensure_future(self._discard(queue))
+            try:
+                await batch
+            finally:
+                if drain is not None:
+                    drain.cancel()
+
+    @staticmethod
+    async def _discard(queue: asyncio.Queue) -> None:
+        while True:
+            await queue.get()
+
+    def run(self, on_event) -> None:
+        """Run the batch on a new event loop in this thread, calling on_event(event) for each event."""
+
+        async def consume():
+            async for event in self.events():
+                on_event(event)
+
+        asyncio.run(consume())
+
+    def start(self, on_event, on_done=None) -> threading.Thread:
+        """Like run(), in a daemon thread; on_done() is called once the batch is over."""
+
+        def target():
+            try:
+                self.run(on_event)
+            finally:
+                if on_done:
+                    on_done()
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _page_cache(self):
+        if self.settings.get("skip_pingo") or not self.settings.get("cache_enabled", True):
+            return None
+        from .cache import PageCache
+        from .settings.settings_utils import PAGE_CACHE_DIR
+
+        return PageCache(PAGE_CACHE_DIR, self.settings.get("cache_max_mb", 2048) * 1024 * 1024)
+
+    def _preset_selector(self):
+        if self.settings.get("last_preset") != config.AUTO_PRESET:
+            return None
+        from .adaptive import PresetSelector
+        from .settings.settings_utils import PRESET_DECISIONS_FILE
+
+        return PresetSelector.from_settings(self.settings, PRESET_DECISIONS_FILE)
+
+    async def _run(self, queue: asyncio.Queue, closed: threading.Event) -> None:
+        loop = asyncio.get_running_loop()
+        settings = self.settings
+        totals = {"folders": 0, "bytes_in": 0, "bytes_out": 0}
+
+        def emit(event, **fields):
+            # The batch calls back from its executor threads; this blocks while the queue is full
+            if not closed.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put({"event": event, **fields}), loop).result()
+
+        async def emit_here(event, **fields):
+            if not closed.is_set():
+                await queue.put({"event": event, **fields})
+
+        def on_folder(job):
+            totals["folders"] += 1
+            totals["bytes_in"] += job.bytes_in
+            totals["bytes_out"] += job.bytes_out
+            emit("folder", folder=job.folder_path, archive=job.zip_file_path,
+                 bytes_in=job.bytes_in, bytes_out=job.bytes_out, seconds=round(job.seconds, 3),
+                 pages_kept=job.pages_kept, pages_skipped=job.pages_skipped)
+
+        started = time.monotonic()
+        try:
+            try:
+                await core.run_batch(
+                    self.root_dir,
+                    settings.get("last_output_ext") or config.OUTPUT_EXTENSIONS[0],
+                    settings.get("last_preset", ""),
+                    settings.get("skip_pingo", False),
+                    settings.get("presets", {}),
+                    status_callback=lambda message: emit("status", message=message),
+                    report_callback=lambda folder, output: emit("report", folder=folder, output=output),
+                    max_workers=settings.get("max_workers", 0),
+                    cache=await asyncio.to_thread(self._page_cache),
+                    resume=self._resume,
+                    folder_callback=on_folder,
+                    include_archives=settings.get("include_archives", False),
+                    event_callback=(lambda event: emit("stage", **event)) if settings.get("stage_timings") else None,
+                    profile_path=settings.get("profile_path") or None,
+                    min_gain=settings.get("min_gain_percent", 0) / 100,
+                    preset_selector=await asyncio.to_thread(self._preset_selector),
+                    control=self.control,
+                    log_path=settings.get("report_log_path") or None,
+                    dedup=settings.get("dedup_pages", True),
+                    duplicate_report=settings.get("duplicate_report", False),
+                    scratch_dir=settings.get("scratch_dir") or None,
+                    scratch_bytes=settings.get("scratch_max_mb", config.SCRATCH_MAX_MB) * 1024 * 1024,
+                    removal_policy=settings.get("removal_policy") or config.REMOVAL_POLICY,
+                    hold_dir=settings.get("hold_dir") or None,
+                )
+            except Exception as e:
+                await emit_here("error", message=str(e))
+                return
+            await emit_here(
+                "summary",
+                folders=totals["folders"],
+                bytes_in=totals["bytes_in"],
+                bytes_out=totals["bytes_out"],
+                bytes_saved=totals["bytes_in"] - totals["bytes_out"],
+                seconds=round(time.monotonic() - started, 3),
+                stopped=self.control.cancelled,
+            )
+        finally:
+            if not closed.is_set():
+                await queue.put(_DONE)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+class PageCache:
+    """
+    On-disk cache of optimized pages.
+    Entries are keyed by the source image's content hash plus the pingo command, so
+    the same page optimized with the same preset is only sent to pingo once. The
+    least recently used entries are evicted when the cache grows past max_bytes. The
+    index is checked against the files on disk when the cache is opened.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._total = 0
+        self._load()
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def make_key(data: bytes, cmd: list) -> str:
+        """Return the cache key for an image's bytes optimized with the given command."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps(cmd).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def _load(self) -> None:
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        indexed = {}
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                indexed = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to load page cache index: {e}")
+        # The index only lists what was there at the last save(): pages written by a run killed before it,
+        # or by another worker sharing the cache, are only on disk, and evicted ones are only in the index
+        self._entries = self._scan()
+        for key, entry in self._entries.items():
+            used = indexed.get(key, {}).get("used")
+            if used is not None:
+                entry["used"] = used
+        self._total = sum(entry["size"] for entry in self._entries.values())
+
+    def _scan(self) -> dict:
+        """Read the entries from the files on disk, last used as of their modification time."""
+        entries = {}
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                key, ext = os.path.splitext(file)
+                if file == INDEX_FILE or not ext or ext == ".tmp":
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, file))
+                except OSError:
+                    # Evicted by another worker since the listing
+                    continue
+                entries[key] = {"ext": ext, "size": stat.st_size, "used": stat.st_mtime}
+        return entries
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return (cached_path, ext) for a key and mark it as used, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                path = self._path(key, entry["ext"])
+                if os.path.exists(path):
+                    entry["used"] = time.time()
+                    self.hits += 1
+                    return path, entry["ext"]
+                self._total -= entry["size"]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, source_path: str) -> None:
+        """Store a copy of an optimized page and evict old entries if over budget."""
+        ext = os.path.splitext(source_path)[1].lower()
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            return
+        path = self._path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._total -= old["size"]
+                if old["ext"] != ext:
+                    self._remove_file(key, old["ext"])
+            self._entries[key] = {"ext": ext, "size": size, "used": time.time()}
+            self._total += size
+            self._evict()
+
+    def _evict(self) -> None:
+        if self._total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["used"]):
+            if self._total <= self.max_bytes:
+                break
+            self._remove_file(key, entry["ext"])
+            self._total -= entry["size"]
+            del self._entries[key]
+
+    def _remove_file(self, key: str, ext: str) -> None:
+        try:
+            os.remove(self._path(key, ext))
+        except OSError:
+            pass
+
+    def save(self) -> None:
+        """Write the index to disk."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            index_path = os.path.join(self.cache_dir, INDEX_FILE)
+            with self._lock:
+                data = json.dumps(self._entries)
+            with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(index_path + ".tmp", index_path)
+        except Exception as e:
+            logger.warning(f"Failed to save page cache index: {e}")
+
+    def summary(self) -> str:
+        return (
+            f"Page cache: {self.hits} hits, {self.misses} misses, "
+            f"{self._total / (1024 * 1024):.1f} MB of {self.max_bytes / (1024 * 1024):.1f} MB used"
+        )
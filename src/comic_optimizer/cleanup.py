@@ -0,0 +1,250 @@
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+from typing import Optional
+
+from . import config
+from .imageinfo import image_format
+from .instrument import measure
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def _count_pages(zipf: zipfile.ZipFile) -> int:
+    return sum(1 for info in zipf.infolist() if not info.is_dir() and image_format(os.path.basename(info.filename)))
+
+
+def archive_page_count(zip_file_path: str) -> int:
+    """Return the number of image entries in an archive."""
+    with zipfile.ZipFile(zip_file_path) as zipf:
+        return _count_pages(zipf)
+
+
+def verify_archive(zip_file_path: str, pages: Optional[int] = None) -> Optional[str]:
+    """Check every entry's CRC and that the archive holds the given number of pages; return the problem, else None."""
+    try:
+        with zipfile.ZipFile(zip_file_path) as zipf:
+            bad = zipf.testzip()
+            if bad is not None:
+                return f"{bad} fails its CRC check"
+            found = _count_pages(zipf)
+    except (zipfile.BadZipFile, OSError) as e:
+        return str(e)
+    if pages is not None and found != pages:
+        return f"{found} pages, expected {pages}"
+    return None
+
+
+def _delete(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def _free_path(path: str) -> str:
+    """Return path, or path with a number added if something is already there."""
+    base, ext = os.path.splitext(path)
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = f"{base} ({number}){ext}"
+    return path
+
+
+class _Removal:
+    """A source waiting to be removed, with what's needed to check its archive first."""
+
+    def __init__(self, job, journal, pages: int):
+        self.job = job
+        self.journal = journal
+        self.pages = pages
+        self.submitted = time.monotonic()
+
+
+class CleanupQueue:
+    """
+    Removes the sources of finished archives off the pipeline's critical path.
+    Before a source is removed its archive is checked (every CRC, and its page
+    count); a source whose archive fails is left where it is and reported. By policy:
+      trash   send it to the system trash; sources that pile up while a trash call runs
+              (it is slow on some platforms) go in the next call together. One that
+              can't be trashed is left in place and reported
+      delete  delete it for good
+      keep    leave it where it is (the next run processes it again)
+      move    move it to hold_dir, under its path relative to root_dir
+    A folder is journaled "done" once its source is gone. With background=False,
+    submit() does the work before returning.
+    """
+
+    def __init__(self, policy: str = config.REMOVAL_POLICY, hold_dir: Optional[str] = None,
+                 root_dir: Optional[str] = None, background: bool = True, batch_size: int = config.CLEANUP_BATCH_SIZE):
+        if policy not in config.REMOVAL_POLICIES:
+            raise ValueError(
+                f"Unknown removal policy {policy!r}, expected one of {', '.join(config.REMOVAL_POLICIES)}"
+            )
+        if policy == "move" and not hold_dir:
+            raise ValueError("The move removal policy needs a holding directory")
+        self.policy = policy
+        self.hold_dir = hold_dir
+        self.root_dir = root_dir
+        self.batch_size = max(1, batch_size)
+        self.submitted = 0
+        self.verified = 0
+        self.verify_seconds = 0.0
+        self.verify_bytes = 0
+        self.removed = 0
+        self.kept = 0
+        self.batches = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.failures = []
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def submit(self, job, journal=None, pages: int = 0) -> None:
+        """Remove job's source (folder_path) once its archive (zip_file_path) is verified to hold pages pages."""
+        removal = _Removal(job, journal, pages)
+        with self._lock:
+            self.submitted += 1
+        if self._queue is None:
+            self._process([removal])
+        else:
+            self._queue.put(removal)
+
+    def close(self) -> None:
+        """Finish every removal submitted so far."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Whatever finished while the last batch was being removed goes in the same trash call
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+            if batch:
+                try:
+                    self._process(batch)
+                except Exception:
+                    logger.exception("Cleanup of %d sources failed", len(batch))
+            if stopping:
+                return
+
+    def _process(self, batch: list) -> None:
+        ready = []
+        for removal in batch:
+            if self.policy == "keep" or not os.path.exists(removal.job.folder_path):
+                ready.append(removal)
+                continue
+            started = time.perf_counter()
+            with measure(removal.job, "verify", removal.job.zip_file_path):
+                problem = verify_archive(removal.job.zip_file_path, removal.pages)
+            with self._lock:
+                self.verified += 1
+                self.verify_seconds += time.perf_counter() - started
+                self.verify_bytes += os.path.getsize(removal.job.zip_file_path) \
+                    if os.path.exists(removal.job.zip_file_path) else 0
+            if problem is None:
+                ready.append(removal)
+            else:
+                self._fail(removal, f"archive {removal.job.zip_file_path} failed verification ({problem})")
+        if self.policy == "trash":
+            self._trash(ready)
+        else:
+            for removal in ready:
+                self._remove(removal)
+
+    def _trash(self, batch: list) -> None:
+        from send2trash import send2trash
+
+        paths = [removal.job.folder_path for removal in batch if os.path.exists(removal.job.folder_path)]
+        if paths:
+            with self._lock:
+                self.batches += 1
+            try:
+                send2trash(paths)
+            except Exception as e:
+                logger.warning("Trashing %d sources at once failed (%s), trying one by one", len(paths), e)
+                for removal in batch:
+                    if os.path.exists(removal.job.folder_path):
+                        try:
+                            send2trash(removal.job.folder_path)
+                        except Exception as e:
+                            self._fail(removal, f"could not be sent to the trash ({e})")
+        for removal in batch:
+            if not os.path.exists(removal.job.folder_path):
+                self._done(removal)
+
+    def _remove(self, removal: _Removal) -> None:
+        path = removal.job.folder_path
+        try:
+            if self.policy == "keep" or not os.path.exists(path):
+                pass
+            elif self.policy == "delete":
+                _delete(path)
+            else:
+                relative = os.path.relpath(path, self.root_dir) if self.root_dir else os.path.basename(path)
+                if relative.startswith(os.pardir):
+                    relative = os.path.basename(path)
+                target = _free_path(os.path.join(self.hold_dir, relative))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+        except OSError as e:
+            self._fail(removal, f"could not be removed ({e})")
+            return
+        self._done(removal)
+
+    def _done(self, removal: _Removal) -> None:
+        latency = time.monotonic() - removal.submitted
+        with self._lock:
+            if self.policy == "keep":
+                self.kept += 1
+            else:
+                self.removed += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+        removal.job.advance("done", removal.journal)
+
+    def left_in_place(self, job, reason: str) -> None:
+        """Report a source that is kept where it is, and why."""
+        message = f"{job.folder_path} was left in place: {reason}"
+        logger.warning(message)
+        with self._lock:
+            self.failures.append(message)
+
+    def _fail(self, removal: _Removal, reason: str) -> None:
+        self.left_in_place(removal.job, reason)
+
+    def summary(self) -> str:
+        """Return the verification cost, the removal latency and any sources left in place."""
+        done = self.removed + self.kept
+        lines = [
+            f"Cleanup ({self.policy}): {done} sources"
+            + (f" in {self.batches} trash calls" if self.policy == "trash" else "")
+            + (f", {self.latency_total / done:.2f}s average and {self.latency_max:.2f}s longest after archiving"
+               if done else ""),
+            f"Verified {self.verified} archives ({self.verify_bytes / (1024 * 1024):.1f} MB) "
+            f"in {self.verify_seconds:.2f}s",
+        ]
+        lines.extend(self.failures)
+        return "\n".join(lines)
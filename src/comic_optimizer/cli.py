@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import zipfile
+
+from . import config
+from .settings.settings_utils import load_user_settings
+
+
+def build_parser(user_settings: dict) -> argparse.ArgumentParser:
+    presets = user_settings.get("presets", {})
+    parser = argparse.ArgumentParser(
+        prog="comic-optimizer",
+        description="Optimize comic folders with pingo and pack them into archives, without the GUI.",
+    )
+    parser.add_argument("root_dir", help="root directory containing the comic folders")
+    parser.add_argument(
+        "-p", "--preset",
+        choices=sorted(presets) + [config.AUTO_PRESET],
+        default=user_settings.get("last_preset") or next(iter(presets), None),
+        help=f"pingo preset from user_settings.toml, or {config.AUTO_PRESET} to pick one per series "
+             "by sampling pages (default: last preset used in the GUI)",
+    )
+    parser.add_argument(
+        "--max-seconds-per-mb",
+        type=float,
+        default=user_settings.get("adaptive_max_seconds_per_mb", 0),
+        help=f"{config.AUTO_PRESET}: pick the best compression among presets at most this slow",
+    )
+    parser.add_argument(
+        "--max-size-ratio",
+        type=float,
+        default=user_settings.get("adaptive_max_size_ratio", 0),
+        help=f"{config.AUTO_PRESET}: pick the fastest preset shrinking pages to this fraction",
+    )
+    parser.add_argument(
+        "-e", "--ext",
+        choices=config.OUTPUT_EXTENSIONS,
+        default=user_settings.get("last_output_ext", config.OUTPUT_EXTENSIONS[0]),
+        help="output archive extension",
+    )
+    parser.add_argument("--skip-pingo", action="store_true", help="only clean, rename and archive")
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=user_settings.get("max_workers", 0),
+        help="folders processed at once, 0 picks a value from the CPU count",
+    )
+    parser.add_argument(
+        "--archives",
+        action=argparse.BooleanOptionalAction,
+        default=user_settings.get("include_archives", False),
+        help="also optimize existing .cbz/.zip files without extracting them to the library",
+    )
+    parser.add_argument(
+        "--min-gain",
+        type=float,
+        metavar="PERCENT",
+        default=user_settings.get("min_gain_percent", 0),
+        help="stop re-encoding a folder's pages of a format once its first pages saved less than this",
+    )
+    parser.add_argument(
+        "--dedup",
+        action=argparse.BooleanOptionalAction,
+        default=user_settings.get("dedup_pages", True),
+        help="optimize pages found byte for byte in several folders once",
+    )
+    parser.add_argument(
+        "--duplicate-report",
+        action="store_true",
+        default=user_settings.get("duplicate_report", False),
+        help="list every group of identical pages in the batch report",
+    )
+    parser.add_argument(
+        "--scratch",
+        metavar="DIR",
+        default=user_settings.get("scratch_dir") or None,
+        help="process folders in a copy in DIR (a RAM disk, a local SSD) and only write archives to the library",
+    )
+    parser.add_argument(
+        "--scratch-max-mb",
+        type=int,
+        metavar="MB",
+        default=user_settings.get("scratch_max_mb", config.SCRATCH_MAX_MB),
+        help="scratch space used at once; folders that don't fit wait, larger ones are processed in place",
+    )
+    parser.add_argument(
+        "--removal",
+        choices=config.REMOVAL_POLICIES,
+        default=user_settings.get("removal_policy") or config.REMOVAL_POLICY,
+        help="what happens to a folder once its archive is written and verified",
+    )
+    parser.add_argument(
+        "--hold-dir",
+        metavar="DIR",
+        default=user_settings.get("hold_dir") or None,
+        help="where --removal move puts folders, outside root_dir",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="don't use the page cache")
+    parser.add_argument("--no-resume", action="store_true", help="ignore the journal of an interrupted run")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="list the folders that would be processed")
+    parser.add_argument("--json", action="store_true", help="print JSON lines instead of text")
+    parser.add_argument(
+        "--stages", action="store_true", help="report time, files and bytes for every stage of every folder"
+    )
+    parser.add_argument("--profile", metavar="PATH", help="write a cProfile dump of the run to PATH")
+    parser.add_argument(
+        "--log",
+        metavar="PATH",
+        default=user_settings.get("report_log_path") or None,
+        help="append every line of pingo output to PATH; reports only keep the first lines of each folder",
+    )
+    distributed = parser.add_argument_group(
+        "distributed batch", "spread a library over several machines that see it and DIR on a shared filesystem"
+    )
+    role = distributed.add_mutually_exclusive_group()
+    role.add_argument("--coordinate", action="store_true",
+                      help="queue the library's folders in DIR and wait until workers have processed them")
+    role.add_argument("--work", action="store_true", help="process folders from DIR until none are left")
+    distributed.add_argument("--queue", metavar="DIR", help="queue directory, outside root_dir")
+    distributed.add_argument(
+        "--lease",
+        type=float,
+        metavar="SECONDS",
+        default=config.QUEUE_LEASE_SECONDS,
+        help="hand a folder to another worker if its worker hasn't been heard from for this long",
+    )
+    return parser
+
+
+class Reporter:
+    """Print progress as text on stderr, or as JSON lines on stdout."""
+
+    def __init__(self, as_json: bool):
+        self.as_json = as_json
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields) -> None:
+        # Called from pipeline worker threads
+        with self._lock:
+            self._print(event, fields)
+
+    def _print(self, event: str, fields: dict) -> None:
+        if self.as_json:
+            print(json.dumps({"event": event, **fields}), flush=True)
+            return
+        if event == "status":
+            print(fields["message"].replace("\n", " | "), file=sys.stderr, flush=True)
+        elif event == "report":
+            print(f"{fields['folder']}:\n{fields['output']}\n")
+        elif event == "folder":
+            print(
+                f"{fields['folder']}: {_format_size(fields['bytes_in'])} -> "
+                f"{_format_size(fields['bytes_out'])} in {fields['seconds']:.1f}s"
+            )
+        elif event == "plan":
+            print(f"{fields['folder']} -> {fields['archive']} ({fields['pages']} pages, "
+                  f"{_format_size(fields['bytes'])})")
+        elif event == "summary" and fields.get("dry_run"):
+            print(f"{fields['folders']} folders, {fields['pages']} pages, {_format_size(fields['bytes'])}")
+        elif event == "summary":
+            print(
+                f"{fields['folders']} folders, {_format_size(fields['bytes_saved'])} saved "
+                f"in {fields['seconds']:.1f}s" + (" (stopped, run again to resume)" if fields.get("stopped") else "")
+            )
+        elif event == "stage":
+            print(
+                f"{fields['folder']} {fields['stage']}: {fields['seconds']:.2f}s, "
+                f"{fields['files_in']} -> {fields['files_out']} files, "
+                f"{_format_size(fields['bytes_in'])} -> {_format_size(fields['bytes_out'])}",
+                file=sys.stderr,
+                flush=True,
+            )
+        elif event == "error":
+            print(f"Error: {fields['message']}", file=sys.stderr)
+
+
+def _format_size(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def dry_run(args, reporter: Reporter) -> None:
+    """Report the batch plan without touching any file."""
+    from . import core
+    from .folderindex import FolderIndex
+
+    planned = total_pages = total_bytes = 0
+    folders = core.discover_folders(args.root_dir, args.ext)
+    if args.archives:
+        taken = {zip_file_path for _, zip_file_path in folders}
+        folders += [entry for entry in core.discover_archives(args.root_dir, args.ext) if entry[1] not in taken]
+    for folder_path, zip_file_path in folders:
+        if os.path.isfile(folder_path):
+            job = core.ArchiveJob(folder_path, zip_file_path)
+            try:
+                core.prepare_archive(job)
+            except (zipfile.BadZipFile, OSError) as e:
+                print(f"Skipping {folder_path}: {e}", file=sys.stderr)
+                continue
+            pages, size = job.pages, job.bytes_in
+        else:
+            index = FolderIndex(folder_path)
+            pages = core.list_pages(folder_path, index)
+            size = sum(index.size(page) for page in pages)
+        planned += 1
+        total_pages += len(pages)
+        total_bytes += size
+        reporter.emit("plan", folder=folder_path, archive=zip_file_path, pages=len(pages), bytes=size)
+    reporter.emit("summary", folders=planned, pages=total_pages, bytes=total_bytes,
+                  bytes_saved=0, seconds=0.0, dry_run=True)
+
+
+def run_queue(args, settings: dict, reporter: Reporter) -> int:
+    """Coordinate or work on a batch shared through a queue directory."""
+    from .distributed import FolderQueue, QueueWorker, enqueue_library, wait_for_queue
+
+    queue = FolderQueue(args.queue, args.lease)
+    if args.coordinate:
+        reporter.emit("status", message=f"Sizing folders in {args.root_dir}")
+        added = enqueue_library(queue, args.root_dir, args.ext)
+        reporter.emit("status", message=f"Queued {added} folders in {args.queue}")
+        from .control import BatchControl
+
+        control = BatchControl()
+        signal.signal(signal.SIGINT, lambda signum, frame: control.cancel())
+        started = time.monotonic()
+        counts = wait_for_queue(queue, lambda message: reporter.emit("status", message=message), control)
+        results = [entry["result"] for entry in queue.entries("done")]
+        for entry in queue.entries("failed"):
+            reporter.emit("report", folder=entry.get("folder", "?"), output=f"Failed: {entry.get('error')}")
+        bytes_in = sum(result["bytes_in"] for result in results)
+        bytes_out = sum(result["bytes_out"] for result in results)
+        reporter.emit("summary", folders=len(results), bytes_in=bytes_in, bytes_out=bytes_out,
+                      bytes_saved=bytes_in - bytes_out, seconds=round(time.monotonic() - started, 3),
+                      stopped=control.cancelled, failed=counts["failed"])
+        return 1 if counts["failed"] else 130 if control.cancelled else 0
+
+    cache = None
+    if not args.skip_pingo and settings["cache_enabled"]:
+        from .cache import PageCache
+        from .settings.settings_utils import PAGE_CACHE_DIR
+
+        cache = PageCache(PAGE_CACHE_DIR, settings.get("cache_max_mb", 2048) * 1024 * 1024)
+    log = None
+    if args.log:
+        from .pingolog import ReportLog
+
+        log = ReportLog(args.log)
+    scratch = None
+    if args.scratch:
+        from .staging import ScratchSpace
+
+        scratch = ScratchSpace(args.scratch, args.scratch_max_mb * 1024 * 1024)
+    from .cleanup import CleanupQueue
+
+    cleanup = CleanupQueue(args.removal, args.hold_dir, args.root_dir, background=False)
+    totals = {"folders": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def on_folder(job):
+        totals["folders"] += 1
+        totals["bytes_in"] += job.bytes_in
+        totals["bytes_out"] += job.bytes_out
+        reporter.emit("folder", folder=job.folder_path, archive=job.zip_file_path, bytes_in=job.bytes_in,
+                      bytes_out=job.bytes_out, seconds=round(job.seconds, 3), pages_kept=job.pages_kept,
+                      pages_skipped=job.pages_skipped)
+
+    worker = QueueWorker(
+        queue, args.root_dir, args.preset, args.skip_pingo, settings["presets"], args.workers, cache=cache,
+        min_gain=args.min_gain / 100, log=log,
+        status_callback=lambda message: reporter.emit("status", message=message),
+        folder_callback=on_folder,
+        report_callback=lambda folder, output: reporter.emit("report", folder=folder, output=output),
+        scratch=scratch,
+        cleanup=cleanup,
+    )
+
+    def on_interrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        reporter.emit("status", message="Stopping, unfinished folders go back to the queue")
+        worker.cancel()
+
+    signal.signal(signal.SIGINT, on_interrupt)
+    started = time.monotonic()
+    try:
+        worker.run()
+    finally:
+        if cache is not None:
+            cache.save()
+        if scratch is not None:
+            scratch.close()
+        if log is not None:
+            log.close()
+    if cleanup.submitted:
+        reporter.emit("report", folder="Batch", output=cleanup.summary())
+    reporter.emit("summary", folders=totals["folders"], bytes_in=totals["bytes_in"], bytes_out=totals["bytes_out"],
+                  bytes_saved=totals["bytes_in"] - totals["bytes_out"], seconds=round(time.monotonic() - started, 3),
+                  stopped=worker.cancelled)
+    return 130 if worker.cancelled else 0
+
+
+def main(argv=None) -> int:
+    user_settings = load_user_settings()
+    parser = build_parser(user_settings)
+    args = parser.parse_args(argv)
+    reporter = Reporter(args.json)
+    if not os.path.isdir(args.root_dir):
+        reporter.emit("error", message=f"Not a directory: {args.root_dir}")
+        return 2
+    if args.dry_run:
+        dry_run(args, reporter)
+        return 0
+    root_dir = os.path.abspath(args.root_dir)
+    if args.scratch and os.path.commonpath([os.path.abspath(args.scratch), root_dir]) == root_dir:
+        # Copies there would be picked up as series of the library
+        parser.error("--scratch must be outside root_dir")
+    if args.removal == "move":
+        if not args.hold_dir:
+            parser.error("--removal move needs --hold-dir")
+        if os.path.commonpath([os.path.abspath(args.hold_dir), root_dir]) == root_dir:
+            parser.error("--hold-dir must be outside root_dir")
+    if args.coordinate or args.work:
+        if not args.queue:
+            parser.error("--coordinate and --work need --queue")
+        queue_dir = os.path.abspath(args.queue)
+        if os.path.commonpath([queue_dir, root_dir]) == root_dir:
+            # It would be picked up as a series of the library
+            parser.error("--queue must be outside root_dir")
+        if args.work and args.preset == config.AUTO_PRESET:
+            parser.error(f"--work needs a preset other than {config.AUTO_PRESET}")
+
+    settings = {
+        **user_settings,
+        "last_preset": args.preset,
+        "last_output_ext": args.ext,
+        "skip_pingo": args.skip_pingo,
+        "max_workers": args.workers,
+        "include_archives": args.archives,
+        "cache_enabled": user_settings.get("cache_enabled", True) and not args.no_cache,
+        "min_gain_percent": args.min_gain,
+        "adaptive_max_seconds_per_mb": args.max_seconds_per_mb,
+        "adaptive_max_size_ratio": args.max_size_ratio,
+        "stage_timings": args.stages,
+        "profile_path": args.profile or "",
+        "report_log_path": args.log or "",
+        "dedup_pages": args.dedup,
+        "duplicate_report": args.duplicate_report,
+        "scratch_dir": args.scratch or "",
+        "scratch_max_mb": args.scratch_max_mb,
+        "removal_policy": args.removal,
+        "hold_dir": args.hold_dir or "",
+    }
+    if args.coordinate or args.work:
+        return run_queue(args, settings, reporter)
+    # Imported here so --help and argument errors don't pay for the pipeline's imports
+    from .bridge import BatchBridge
+
+    batch = BatchBridge(args.root_dir, settings, resume=not args.no_resume)
+
+    def on_interrupt(signum, frame):
+        # First Ctrl+C stops cleanly, a second one aborts
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        reporter.emit("status", message="Stopping, press Ctrl+C again to abort")
+        batch.cancel()
+
+    failed = False
+
+    def on_event(event):
+        nonlocal failed
+        failed = failed or event["event"] == "error"
+        reporter.emit(**event)
+
+    signal.signal(signal.SIGINT, on_interrupt)
+    batch.run(on_event)
+    if failed:
+        return 1
+    return 130 if batch.cancelled else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
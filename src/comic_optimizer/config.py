@@ -0,0 +1,76 @@
+# Page file extensions (matched in any case) and the image format each stands for
+IMAGE_FORMATS = {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp", ".avif": "avif", ".gif": "gif"}
+IMAGE_EXTENSIONS = set(IMAGE_FORMATS)
+
+# Bytes read from the start of a file to tell its image format from its content
+SNIFF_BYTES = 32
+
+OUTPUT_EXTENSIONS = [".cbz", ".cbr", ".zip"]
+
+# Existing archives that can be optimized in place (CBR is RAR and can't be read with zipfile)
+ARCHIVE_INPUT_EXTENSIONS = {".cbz", ".zip"}
+
+# Folders waiting between pipeline stages, and threads writing/trashing archives
+PIPELINE_QUEUE_SIZE = 2
+PACKAGE_WORKERS = 2
+
+# Bytes read from each page to find its dimensions, and threads sizing folders before a batch
+HEADER_READ_BYTES = 65536
+SIZING_WORKERS = 8
+
+# Buffer size used when streaming pages into archives
+ARCHIVE_BUFFER_SIZE = 1024 * 1024
+
+# Batch journal written to the root directory while a run is in progress
+JOURNAL_FILE_NAME = ".comic-optimizer-journal.jsonl"
+
+# Pages per pingo call when work is spread over the batch-wide worker pool
+PINGO_CHUNK_PAGES = 8
+
+# Longest list of file paths passed to a single pingo call (Windows caps command lines at 32767)
+MAX_COMMAND_CHARS = 24000
+
+# Preset name that picks a preset per series by sampling pages with each candidate
+AUTO_PRESET = "auto"
+
+# Pages per folder run through every candidate preset when the preset is "auto"
+ADAPTIVE_SAMPLE_PAGES = 3
+
+# Lines of pingo output kept per folder for the report (the rest only go to the log file)
+PINGO_OUTPUT_MAX_LINES = 200
+
+# Folder reports kept in the list process_root_directory returns
+REPORT_MAX_ENTRIES = 1000
+
+# Lines kept in the GUI report panel; older lines scroll out
+REPORT_PANEL_MAX_LINES = 5000
+
+# Events a batch can have waiting for the GUI or CLI before its threads wait for them
+BRIDGE_EVENT_QUEUE_SIZE = 256
+
+# Bytes hashed from the start of pages of the same size to find candidate duplicates
+DEDUP_PREFIX_BYTES = 64 * 1024
+
+# Shared-directory queue of a distributed batch: seconds a worker keeps a folder without a heartbeat,
+# times a folder is handed out again after its worker stopped responding, and seconds between queue checks
+QUEUE_LEASE_SECONDS = 120
+QUEUE_MAX_ATTEMPTS = 3
+QUEUE_POLL_SECONDS = 2
+
+# Scratch space folders are copied to for processing (empty: process them in place in the library),
+# its default budget, and the space a staged folder reserves as a multiple of its size (pages plus pingo output)
+SCRATCH_DIR = ""
+SCRATCH_MAX_MB = 4096
+SCRATCH_SPACE_FACTOR = 2
+
+# What happens to a source once its archive is verified (trash, delete, keep or move),
+# and the most sources the background cleanup sends to the trash in one call
+REMOVAL_POLICIES = ("trash", "delete", "keep", "move")
+REMOVAL_POLICY = "trash"
+CLEANUP_BATCH_SIZE = 32
+
+# Pages of one format a folder must have re-encoded before its average gain is used to skip the rest
+GAIN_SAMPLE_PAGES = 8
+
+DEFAULT_FONT_FAMILY = "Segoe UI"
+DEFAULT_FONT_SIZE = 10
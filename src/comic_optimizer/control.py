@@ -0,0 +1,184 @@
+import asyncio
+import codecs
+import locale
+import re
+import subprocess
+import threading
+
+# Seconds between checks for a stop request while a child process runs
+POLL_SECONDS = 0.2
+# Seconds a terminated child gets to exit before it is killed
+TERMINATE_TIMEOUT = 5
+# Bytes read from a child's output at a time by run_command_async()
+READ_BYTES = 65536
+
+# Line ends as text-mode pipes see them (universal newlines)
+_LINE_END = re.compile(r"\r\n|\r|\n")
+
+
+class Cancelled(Exception):
+    """Raised inside a stage when the batch has been stopped."""
+
+
+class BatchControl:
+    """
+    Stop and pause switches for a batch run, safe to flip from any thread.
+    Stages call checkpoint() between units of work: it blocks while paused and
+    raises Cancelled once stopped; code on an event loop awaits checkpoint_async()
+    instead. Child processes started through run_command() or run_command_async()
+    are terminated on stop. Pausing lets running pingo calls finish and holds back
+    the next ones.
+    """
+
+    def __init__(self):
+        self._stopped = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._stopped.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def pause(self) -> None:
+        self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def cancel(self) -> None:
+        """Stop the batch: wake paused stages; running child processes are terminated by run_command()."""
+        self._stopped.set()
+        self._running.set()
+
+    def checkpoint(self) -> None:
+        """Wait while paused; raise Cancelled if the batch was stopped."""
+        self._running.wait()
+        if self._stopped.is_set():
+            raise Cancelled("Batch stopped")
+
+    async def checkpoint_async(self) -> None:
+        """checkpoint() for coroutines: waits without blocking the event loop."""
+        while not self._running.is_set():
+            await asyncio.sleep(POLL_SECONDS)
+        if self._stopped.is_set():
+            raise Cancelled("Batch stopped")
+
+
+def _terminate(process: subprocess.Popen) -> None:
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=TERMINATE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _read_lines(stream, sink) -> None:
+    with stream:
+        for line in stream:
+            sink(line.rstrip("\r\n"))
+
+
+def run_command(cmd: list, control=None, line_callback=None) -> str:
+    """
+    Run cmd and stream its output (stdout and stderr) line by line.
+    Each line goes to line_callback as soon as it is printed; without one, the
+    output is collected and returned. With a BatchControl, the process is
+    terminated and Cancelled raised when the batch is stopped.
+    """
+    if control is not None:
+        control.checkpoint()
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace"
+    )
+    collected = []
+    reader = threading.Thread(
+        target=_read_lines, args=(process.stdout, line_callback or collected.append), daemon=True
+    )
+    reader.start()
+    while True:
+        try:
+            process.wait(timeout=POLL_SECONDS)
+            break
+        except subprocess.TimeoutExpired:
+            if control is not None and control.cancelled:
+                _terminate(process)
+    reader.join()
+    if control is not None and control.cancelled:
+        raise Cancelled("Batch stopped")
+    return "\n".join(collected)
+
+
+async def _terminate_async(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), TERMINATE_TIMEOUT)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def _read_lines_async(stream: asyncio.StreamReader, sink) -> None:
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+    pending = ""
+    while True:
+        data = await stream.read(READ_BYTES)
+        text = pending + decoder.decode(data, final=not data)
+        # A \r at the end may be the first half of a \r\n
+        held = "\r" if data and text.endswith("\r") else ""
+        *lines, pending = _LINE_END.split(text[:-1] if held else text)
+        pending += held
+        for line in lines:
+            await sink(line)
+        if not data:
+            if pending:
+                await sink(pending)
+            return
+
+
+async def run_command_async(cmd: list, control=None, line_callback=None) -> str:
+    """
+    run_command() for the event loop: the child is started with
+    asyncio.create_subprocess_exec and its output read by the loop. line_callback
+    is a plain function, called in the loop's default executor, one line after
+    another. The child is terminated when the batch is stopped or the calling task
+    is cancelled.
+    """
+    if control is not None:
+        await control.checkpoint_async()
+    loop = asyncio.get_running_loop()
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    collected = []
+
+    async def sink(line):
+        if line_callback is None:
+            collected.append(line)
+        else:
+            await loop.run_in_executor(None, line_callback, line)
+
+    reader = asyncio.ensure_future(_read_lines_async(process.stdout, sink))
+    exited = asyncio.ensure_future(process.wait())
+    try:
+        while not exited.done():
+            await asyncio.wait({exited}, timeout=POLL_SECONDS)
+            if control is not None and control.cancelled:
+                await _terminate_async(process)
+        await reader
+    except BaseException:
+        await _terminate_async(process)
+        reader.cancel()
+        raise
+    if control is not None and control.cancelled:
+        raise Cancelled("Batch stopped")
+    return "\n".join(collected)
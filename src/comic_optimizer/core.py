@@ -0,0 +1,1244 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from typing import Optional
+
+from natsort import natsorted
+
+from . import config
+from .adaptive import PresetSelector, pick_samples
+from .archive import CbzWriter, entry_data_offset
+from .cleanup import CleanupQueue, archive_page_count, verify_archive
+from .control import Cancelled
+from .dedup import DuplicateIndex
+from .dispatch import PageDispatcher
+from .encoders import encode
+from .folderindex import FolderIndex
+from .imageinfo import image_format
+from .pingolog import PingoOutput, ReportLog
+from .instrument import Instrumentation, measure
+from .journal import Journal
+from .pipeline import Pipeline, Stage
+from .planner import BatchProgress, plan_batch
+
+logger = logging.getLogger(__name__)
+
+
+def delete_non_image_files(item_path: str, index: Optional[FolderIndex] = None) -> None:
+    """
+    Delete all non-image files in the given directory recursively.
+    A file is an image if its extension (in any case) or its first bytes say so.
+    """
+    index = index or FolderIndex(item_path)
+    index.sniff()
+    for file in index.files():
+        page = index.page(file)
+        if page is None:
+            os.remove(os.path.join(item_path, file))
+            index.remove(file)
+        elif page.content is None:
+            logger.warning(f"{os.path.join(item_path, file)} does not look like an image, keeping it as a page")
+
+
+def rename_files_with_zero_padding(item_path: str, index: Optional[FolderIndex] = None) -> list:
+    """
+    Rename image files in the directory with zero-padded numbers and return the new names in order.
+    A page whose content is another format than its extension says (once sniffed) gets that format's extension.
+    """
+    index = index or FolderIndex(item_path)
+    pages = index.pages()
+    padding = len(str(len(pages)))
+    new_names = []
+    for number, page in enumerate(natsorted(pages, key=lambda page: page.name), start=1):
+        new_name = f"{str(number).zfill(padding)}{page.extension}"
+        os.rename(os.path.join(item_path, page.name), os.path.join(item_path, new_name))
+        index.rename(page.name, new_name)
+        new_names.append(new_name)
+    return new_names
+
+
+def list_pages(item_path: str, index: Optional[FolderIndex] = None) -> list:
+    """
+    Return the image files in the directory tree in reading order, as paths relative to it:
+    the pages directly in it in natural order, then those in subfolders (extras, covers).
+    """
+    index = index or FolderIndex(item_path)
+    pages, nested = [], []
+    for page in index.pages(recursive=True):
+        (nested if os.sep in page.name else pages).append(page.name)
+    return natsorted(pages) + natsorted(nested)
+
+
+def run_pingo(
+        item_path: str,
+        preset_name: str,
+        presets: dict,
+        files: Optional[list] = None,
+        chunk_callback=None,
+        dispatcher=None,
+        savings=None,
+        control=None,
+        line_callback=None,
+        index: Optional[FolderIndex] = None
+) -> Optional[str]:
+    """
+    Run pingo on the directory and return its output, using the selected preset from the given presets dict.
+    If files is given, only those files are optimized, split over several pingo calls
+    when needed to keep the command line short. chunk_callback(files) is called after
+    each call so finished pages can be used before the rest are done.
+    With a dispatch.PageDispatcher, the pages are split into small chunks and run on
+    the batch-wide worker pool instead of one pingo call for the whole folder.
+    With a PageSavings (and files given), each finished page's gain is recorded and
+    pages whose format has not been paying off are left as they are.
+    With the directory's FolderIndex (and files given), each call's output is indexed
+    before chunk_callback or the PageSavings see it.
+    With a control.BatchControl, pingo is terminated and Cancelled raised when the batch is stopped.
+    Output is streamed through a pingolog.PingoOutput, so only its first lines are
+    returned; line_callback(line) gets every line.
+    """
+    cmd = presets.get(preset_name, [])
+    if not cmd:
+        raise ValueError(f"Preset '{preset_name}' not found in user settings")
+    chunk_filter = None
+    if savings is not None:
+        chunk_filter = savings.filter
+        chunk_callback = savings.wrap_callback(chunk_callback)
+    if index is not None:
+        after_chunk = chunk_callback
+
+        def chunk_callback(chunk):
+            index.refresh([os.path.relpath(page_path, index.root) for page_path in chunk])
+            if after_chunk:
+                after_chunk(chunk)
+
+    output = PingoOutput(line_callback=line_callback)
+    if dispatcher is not None:
+        if files is None:
+            files = [os.path.join(item_path, page) for page in list_pages(item_path)]
+        chunks = _chunk_paths(files, max_files=config.PINGO_CHUNK_PAGES)
+        dispatcher.run(cmd, chunks, chunk_callback, chunk_filter, output.feed)
+        return output.text()
+    # Small chunks give savings a chance to learn before the whole folder is sent
+    targets = [[item_path]] if files is None else _chunk_paths(
+        files, max_files=config.PINGO_CHUNK_PAGES if savings is not None and savings.min_gain > 0 else 0
+    )
+    for chunk in targets:
+        run_chunk = chunk_filter(chunk) if chunk_filter and files is not None else chunk
+        if run_chunk:
+            encode(cmd, run_chunk, control, output.feed)
+        if chunk_callback and files is not None:
+            chunk_callback(chunk)
+    return output.text()
+
+
+def _chunk_paths(paths: list, max_chars: int = config.MAX_COMMAND_CHARS, max_files: int = 0) -> list:
+    """Split paths into groups whose joined length stays under max_chars (and of at most max_files paths)."""
+    chunks, current, length = [], [], 0
+    for path in paths:
+        if current and (length + len(path) + 1 > max_chars or len(current) == max_files):
+            chunks.append(current)
+            current, length = [], 0
+        current.append(path)
+        length += len(path) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _pick_smaller(index: FolderIndex, page: str) -> str:
+    """Return pingo's .webp for a page (relative to the index) if it is smaller than the original, else the original."""
+    optimized = index.optimized(page)
+    # A page cache hit has already replaced the original with the smaller file
+    if optimized != page and page in index and index.size(optimized) >= index.size(page):
+        return page
+    return optimized
+
+
+class PageSavings:
+    """
+    Size of each page before and after pingo, for one folder.
+    Gains are tracked per file extension. Once min_gain is set and sample_pages pages
+    of an extension have been re-encoded, further pages of that extension are skipped
+    while the average gain so far stays below min_gain (a fraction, 0.05 = 5%).
+    Sizes after pingo are read from index, the folder's FolderIndex.
+    """
+
+    def __init__(
+            self, index: FolderIndex, sizes: dict, min_gain: float = 0.0, sample_pages: int = config.GAIN_SAMPLE_PAGES
+    ):
+        self.index = index
+        self.sizes = sizes
+        self.min_gain = min_gain
+        self.sample_pages = sample_pages
+        self.skipped = set()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _worth_encoding(self, page_path: str) -> bool:
+        if self.min_gain <= 0:
+            return True
+        pages, before, after = self._stats.get(os.path.splitext(page_path)[1].lower(), (0, 0, 0))
+        return pages < self.sample_pages or not before or 1 - after / before >= self.min_gain
+
+    def filter(self, chunk: list) -> list:
+        """Return the pages of chunk still worth re-encoding and remember the others as skipped."""
+        with self._lock:
+            keep = [page_path for page_path in chunk if self._worth_encoding(page_path)]
+            self.skipped.update(page_path for page_path in chunk if page_path not in keep)
+        return keep
+
+    def record(self, chunk: list) -> None:
+        """Record the gain of every page of chunk that pingo re-encoded."""
+        for page_path in chunk:
+            before = self.sizes.get(page_path)
+            if before is None or page_path in self.skipped:
+                continue
+            after = self.index.size(self.index.optimized(os.path.relpath(page_path, self.index.root)))
+            ext = os.path.splitext(page_path)[1].lower()
+            with self._lock:
+                pages, total_before, total_after = self._stats.get(ext, (0, 0, 0))
+                self._stats[ext] = (pages + 1, total_before + before, total_after + after)
+
+    def wrap_callback(self, chunk_callback):
+        def done(chunk):
+            self.record(chunk)
+            if chunk_callback:
+                chunk_callback(chunk)
+
+        return done
+
+
+def format_savings(bytes_in: int, bytes_out: int, pages_kept: int = 0, pages_skipped: int = 0) -> str:
+    """Return a one-line summary of the bytes saved on the pages."""
+    saved = bytes_in - bytes_out
+    percent = saved * 100 / bytes_in if bytes_in else 0.0
+    line = f"Saved {saved / (1024 * 1024):.1f} MB of {bytes_in / (1024 * 1024):.1f} MB ({percent:.0f}%)"
+    if pages_kept:
+        line += f", {pages_kept} pages kept as original (not smaller)"
+    if pages_skipped:
+        line += f", {pages_skipped} pages skipped (low expected gain)"
+    return line
+
+
+def run_pingo_cached(
+        item_path: str, pages: list, preset_name: str, presets: dict, cache, page_callback=None, dispatcher=None,
+        savings=None, control=None, line_callback=None, index: Optional[FolderIndex] = None
+) -> Optional[str]:
+    """
+    Run pingo only on pages missing from the page cache.
+    Cached pages are copied into the folder in place of the original, then every
+    page pingo optimized is stored in the cache (or the original, if pingo's file is
+    not smaller). page_callback(page_path) is called with each original page path as
+    soon as its optimized file is ready. Pages skipped by savings are not cached.
+    index (the folder's FolderIndex) is kept up to date with the files written.
+    Returns pingo output plus a hit/miss line.
+    """
+    cmd = presets.get(preset_name, [])
+    if not cmd:
+        raise ValueError(f"Preset '{preset_name}' not found in user settings")
+    index = index or FolderIndex(item_path)
+    misses = {}
+    hits = 0
+    for page in pages:
+        page_path = os.path.join(item_path, page)
+        with open(page_path, "rb") as f:
+            key = cache.make_key(f.read(), cmd)
+        cached = cache.get(key)
+        if cached is None:
+            misses[page_path] = key
+            continue
+        cached_path, cached_ext = cached
+        base, ext = os.path.splitext(page_path)
+        # Extensions are cached in lower case: a page kept as it was (1.JPG) keeps its name
+        output_path = page_path if ext.lower() == cached_ext else base + cached_ext
+        shutil.copyfile(cached_path, output_path)
+        index.add(os.path.relpath(output_path, item_path))
+        if output_path != page_path:
+            os.remove(page_path)
+            index.remove(page)
+        hits += 1
+        if page_callback:
+            page_callback(page_path)
+
+    def store_chunk(chunk):
+        for page_path in chunk:
+            if savings is None or page_path not in savings.skipped:
+                cache.put(misses[page_path], os.path.join(
+                    item_path, _pick_smaller(index, os.path.relpath(page_path, item_path))
+                ))
+            if page_callback:
+                page_callback(page_path)
+
+    output = ""
+    if misses:
+        output = run_pingo(
+            item_path, preset_name, presets, files=list(misses), chunk_callback=store_chunk, dispatcher=dispatcher,
+            savings=savings, control=control, line_callback=line_callback, index=index
+        )
+    return f"{output}\nCache: {hits} hits, {len(misses)} misses".lstrip("\n")
+
+
+def remove_redundant_images(item_path: str, index: Optional[FolderIndex] = None) -> int:
+    """
+    Where an image has a .webp with the same name, keep whichever of the two is smaller.
+    Returns the number of originals kept because the .webp was not smaller.
+    """
+    index = index or FolderIndex(item_path)
+    files = index.files()
+    webp_files = {
+        os.path.splitext(file)[0]: file for file in files if file.endswith(".webp")
+    }
+    kept = 0
+    for file in files:
+        name = os.path.splitext(file)[0]
+        if image_format(file) not in (None, "webp") and name in webp_files:
+            webp_file = webp_files[name]
+            if index.size(webp_file) < index.size(file):
+                os.remove(os.path.join(item_path, file))
+                index.remove(file)
+            else:
+                os.remove(os.path.join(item_path, webp_file))
+                index.remove(webp_file)
+                kept += 1
+    return kept
+
+
+def compress_to_cbz(
+        item_path: str, zip_file_path: str, pages: Optional[list] = None, writer=None,
+        index: Optional[FolderIndex] = None
+) -> None:
+    """
+    Compress the directory into a cbz file.
+    pages lists the files (relative to item_path) in reading order; by default every
+    file in the directory tree is added in natural order. Pages already streamed into
+    writer are not written again. The archive is written under a .part name and renamed
+    when complete, so an interrupted run never leaves a truncated archive under the final name.
+    """
+    if pages is None:
+        pages = natsorted((index or FolderIndex(item_path)).files())
+    if writer is None:
+        writer = CbzWriter(zip_file_path, len(pages))
+    try:
+        for index, page in enumerate(pages):
+            if not writer.has_page(index):
+                writer.add_page(index, os.path.join(item_path, page), page)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+# Stages a folder passes through, in order, as recorded in the batch journal
+STAGES = ("prepared", "optimized", "archived", "done")
+
+
+class FolderJob:
+    """State of one chapter folder as it moves through the processing stages."""
+
+    def __init__(self, folder_path: str, zip_file_path: str, stage: Optional[str] = None):
+        self.folder_path = folder_path
+        # Where the pages are worked on: the folder itself, or its copy in scratch space
+        self.work_path = folder_path
+        self.zip_file_path = zip_file_path
+        self.stage = stage
+        self.pages = []
+        self.writer = None
+        self._writer_lock = threading.Lock()
+        self._page_numbers = {}
+        self.pingo_output = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self.size_pages = 0
+        self.size_bytes = 0
+        self.size_pixels = None
+        # Why the folder couldn't be read while sizing it (e.g. a damaged archive), if it couldn't
+        self.size_error = None
+        self.instruments = None
+        self.index = None
+        self.bytes_optimized = None
+        self.pages_kept = 0
+        self.pages_skipped = 0
+        self.control = None
+        self.log = None
+        self.duplicates = None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.folder_path)
+
+    def folder_index(self) -> FolderIndex:
+        """Return the folder's file index, scanning the folder the first time."""
+        if self.index is None:
+            self.index = FolderIndex(self.work_path)
+        return self.index
+
+    def log_line(self, line: str) -> None:
+        """Copy a line of pingo output to the batch's full log, if there is one."""
+        if self.log is not None:
+            self.log.write(self.folder_path, line)
+
+    def reached(self, stage: str) -> bool:
+        """Return True if the folder has already completed the given stage."""
+        return self.stage is not None and STAGES.index(self.stage) >= STAGES.index(stage)
+
+    def stream_page(self, page_path: str) -> None:
+        """Write an optimized page into the archive as soon as it is ready; safe to call from several threads."""
+        page = os.path.relpath(page_path, self.work_path)
+        with self._writer_lock:
+            if self.writer is None:
+                self.writer = CbzWriter(self.zip_file_path, len(self.pages))
+                self._page_numbers = {name: number for number, name in enumerate(self.pages)}
+            writer, number = self.writer, self._page_numbers[page]
+        optimized = _pick_smaller(self.folder_index(), page)
+        writer.add_page(number, os.path.join(self.work_path, optimized), optimized)
+
+    def advance(self, stage: str, journal=None) -> None:
+        self.stage = stage
+        if journal is not None:
+            journal.record(self.folder_path, stage)
+
+
+def prepare_folder(job: FolderJob, journal=None) -> None:
+    """Stage 1: drop non-image files and rename pages with zero padding."""
+    if job.reached("prepared"):
+        return
+    index = job.folder_index()
+    with measure(job, "clean"):
+        delete_non_image_files(job.work_path, index)
+    with measure(job, "rename"):
+        rename_files_with_zero_padding(job.work_path, index)
+    job.pages = list_pages(job.work_path, index)
+    job.bytes_in = sum(index.size(page) for page in job.pages)
+    job.advance("prepared", journal)
+
+
+def optimize_folder(
+        job: FolderJob, preset_name: str, skip_pingo: bool, presets: dict, cache=None, journal=None, dispatcher=None,
+        min_gain: float = 0.0
+) -> None:
+    """
+    Stage 2: run pingo (through the page cache if given) and keep the smaller of each page and its .webp.
+    With a dispatcher, pingo runs on page chunks in the shared worker pool and each
+    chunk is streamed into the archive as soon as it is done. With min_gain, pages of
+    a format whose earlier pages in the folder saved less than that fraction are not
+    re-encoded. The bytes saved are added to the folder's report.
+    """
+    if job.reached("optimized"):
+        return
+    index = job.folder_index()
+    if not skip_pingo:
+        if not job.pages:
+            # Resumed after the prepare stage: pages are already renamed, but a run that
+            # died in pingo may have left .webp files next to them
+            job.pages = list_pages(job.work_path, index)
+            _rollback_optimize(job)
+            index = job.folder_index()
+            job.pages = list_pages(job.work_path, index)
+        sizes = {os.path.join(job.work_path, page): index.size(page) for page in job.pages}
+        savings = PageSavings(index, sizes, min_gain)
+        job.bytes_in = sum(sizes.values())
+        owned, copies = {}, {}
+        if job.duplicates is not None:
+            with measure(job, "dedup"):
+                owned, copies = job.duplicates.claim(job.folder_path, sizes, job.work_path)
+        files = [page_path for page_path in sizes if page_path not in copies]
+        try:
+            try:
+                with measure(job, "pingo"):
+                    job.pingo_output = _run_folder_pingo(
+                        job, files, preset_name, presets, cache, dispatcher, savings, min_gain
+                    )
+                for page_path, digest in owned.items():
+                    optimized = _pick_smaller(index, os.path.relpath(page_path, job.work_path))
+                    job.duplicates.publish(digest, os.path.join(job.work_path, optimized), page_path)
+            finally:
+                # Copies elsewhere run pingo themselves if this folder didn't get to publish
+                for digest in owned.values():
+                    job.duplicates.release(digest)
+            # Copies waiting on a folder that failed or was stopped still need pingo
+            leftover = [
+                page_path for page_path, digest in copies.items()
+                if not job.duplicates.fetch(page_path, digest, job.control)
+            ]
+            index.refresh([os.path.relpath(page_path, job.work_path) for page_path in copies])
+            if cache is not None or dispatcher is not None:
+                for page_path in copies:
+                    if page_path not in leftover:
+                        job.stream_page(page_path)
+            if leftover:
+                with measure(job, "pingo"):
+                    job.pingo_output = "\n".join(filter(None, [
+                        job.pingo_output,
+                        _run_folder_pingo(job, leftover, preset_name, presets, cache, dispatcher, savings, min_gain),
+                    ]))
+        except Cancelled:
+            _rollback_optimize(job)
+            raise
+        # Pingo wrote new files behind the index's back
+        index.rescan()
+        job.pages_skipped = len(savings.skipped)
+    with measure(job, "dedupe"):
+        job.pages_kept = remove_redundant_images(job.work_path, index)
+    if not skip_pingo:
+        job.bytes_optimized = sum(index.size(index.optimized(page)) for page in job.pages)
+        job.pingo_output = "\n".join(filter(None, [
+            job.pingo_output,
+            format_savings(job.bytes_in, job.bytes_optimized, job.pages_kept, job.pages_skipped),
+        ]))
+    job.advance("optimized", journal)
+
+
+def _run_folder_pingo(
+        job: FolderJob, files: list, preset_name: str, presets: dict, cache, dispatcher, savings: PageSavings,
+        min_gain: float
+) -> Optional[str]:
+    """Run pingo on some of a folder's pages (paths) through the cache, the worker pool or directly."""
+    if not files:
+        return None
+    if cache is not None:
+        pages = [os.path.relpath(page_path, job.work_path) for page_path in files]
+        return run_pingo_cached(
+            job.work_path, pages, preset_name, presets, cache,
+            page_callback=job.stream_page, dispatcher=dispatcher, savings=savings, control=job.control,
+            line_callback=job.log_line, index=job.folder_index()
+        )
+    if dispatcher is not None:
+        return run_pingo(
+            job.work_path, preset_name, presets, files=files,
+            chunk_callback=lambda chunk: [job.stream_page(page_path) for page_path in chunk],
+            dispatcher=dispatcher, savings=savings, line_callback=job.log_line, index=job.folder_index()
+        )
+    # Given the folder, an encoder only sees the pages directly in it
+    if min_gain > 0 or len(files) < len(job.pages) or any(os.sep in page for page in job.pages):
+        return run_pingo(
+            job.work_path, preset_name, presets, files=files, savings=savings if min_gain > 0 else None,
+            control=job.control, line_callback=job.log_line, index=job.folder_index()
+        )
+    output = run_pingo(job.work_path, preset_name, presets, control=job.control, line_callback=job.log_line)
+    job.folder_index().refresh(job.pages)
+    return output
+
+
+def _rollback_optimize(job: FolderJob) -> None:
+    """Put a folder whose optimize stage was stopped back in its prepared state."""
+    if job.writer is not None:
+        job.writer.abort()
+        job.writer = None
+    for page in job.pages:
+        page_path = os.path.join(job.work_path, page)
+        webp_path = os.path.splitext(page_path)[0] + ".webp"
+        # A .webp next to its original is pingo output, possibly cut short
+        if webp_path != page_path and os.path.exists(page_path) and os.path.exists(webp_path):
+            os.remove(webp_path)
+    job.index = None
+
+
+def count_source_pages(job: FolderJob) -> int:
+    """Count the pages in a folder job's source tree, subfolders included, for checking its archive against."""
+    in_place = job.work_path == job.folder_path
+    index = job.folder_index() if in_place else FolderIndex(job.folder_path)
+    index.sniff()
+    names = [page.name for page in index.pages(recursive=True)]
+    if in_place:
+        # Pages were renamed to distinct numbers, and pingo's .webp next to one is the same page
+        return len({os.path.splitext(name)[0] for name in names})
+    return len(names)
+
+
+def package_folder(job: FolderJob, journal=None, cleanup=None) -> None:
+    """
+    Stage 3: write the archive and hand the source folder to cleanup (a
+    cleanup.CleanupQueue; by default it is verified and trashed before returning).
+    """
+    if job.reached("done"):
+        return
+    source_pages = count_source_pages(job) if os.path.isdir(job.folder_path) else None
+    if not job.reached("archived") or verify_archive(job.zip_file_path, source_pages) is not None:
+        if not os.path.isdir(job.work_path):
+            raise FileNotFoundError(
+                f"Cannot rebuild {job.zip_file_path}: source folder {job.work_path} is gone"
+            )
+        index = job.folder_index()
+        pages = [index.optimized(page) for page in job.pages or list_pages(job.work_path, index)]
+        with measure(job, "archive") as event:
+            compress_to_cbz(job.work_path, job.zip_file_path, pages, job.writer, index)
+            event.update(files_out=1, bytes_out=os.path.getsize(job.zip_file_path))
+        job.writer = None
+        job.advance("archived", journal)
+    job.bytes_out = os.path.getsize(job.zip_file_path)
+    if source_pages is not None:
+        (cleanup or CleanupQueue(background=False)).submit(job, journal, source_pages)
+    else:
+        job.advance("done", journal)
+    job.index = None
+
+
+class ArchiveJob(FolderJob):
+    """
+    An existing CBZ/ZIP being optimized into a new archive.
+    folder_path is the source archive. Pages that pingo has to see are extracted to
+    a scratch directory; everything else is read straight from the source.
+    """
+
+    def __init__(self, archive_path: str, zip_file_path: str, stage: Optional[str] = None):
+        super().__init__(archive_path, zip_file_path, stage)
+        self.entries = []
+        self.sources = {}
+        self.scratch_dir = None
+
+    def cleanup(self) -> None:
+        if self.scratch_dir is not None:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            self.scratch_dir = None
+
+
+def prepare_archive(job: ArchiveJob, journal=None) -> None:
+    """Stage 1 for archives: list the image entries in reading order and name the pages."""
+    if job.reached("prepared"):
+        return
+    with measure(job, "read") as event, zipfile.ZipFile(job.folder_path) as zipf:
+        infos = [
+            info for info in zipf.infolist()
+            if not info.is_dir() and image_format(info.filename)
+        ]
+        event.update(files_out=len(infos), bytes_out=sum(info.file_size for info in infos))
+    infos = natsorted(infos, key=lambda info: info.filename)
+    padding = len(str(len(infos)))
+    job.entries = [info.filename for info in infos]
+    job.pages = [
+        f"{str(index).zfill(padding)}{os.path.splitext(info.filename)[1]}"
+        for index, info in enumerate(infos, start=1)
+    ]
+    job.bytes_in = sum(info.file_size for info in infos)
+    job.advance("prepared", journal)
+
+
+def optimize_archive(
+        job: ArchiveJob, preset_name: str, skip_pingo: bool, presets: dict, cache=None, journal=None, dispatcher=None,
+        min_gain: float = 0.0
+) -> None:
+    """
+    Stage 2 for archives: extract the pages pingo needs to a scratch directory and run it there.
+    Pages found in the page cache are never extracted.
+    """
+    if job.reached("optimized"):
+        return
+    if not skip_pingo and job.pages:
+        cmd = presets.get(preset_name, [])
+        if not cmd:
+            raise ValueError(f"Preset '{preset_name}' not found in user settings")
+        job.scratch_dir = tempfile.mkdtemp(prefix="comic-optimizer-")
+        try:
+            with measure(job, "pingo", job.scratch_dir) as event:
+                output, hits, misses = _optimize_archive_pages(
+                    job, preset_name, presets, cmd, cache, dispatcher, min_gain
+                )
+                event.update(files_in=len(job.pages), bytes_in=job.bytes_in)
+        except BaseException:
+            job.cleanup()
+            raise
+        job.pingo_output = output
+        if cache is not None:
+            job.pingo_output = f"{output}\nCache: {hits} hits, {misses} misses".lstrip("\n")
+    job.advance("optimized", journal)
+
+
+def _optimize_archive_pages(
+        job: ArchiveJob, preset_name: str, presets: dict, cmd: list, cache, dispatcher=None, min_gain: float = 0.0
+) -> tuple:
+    misses = {}
+    sizes = {}
+    hits = 0
+    with zipfile.ZipFile(job.folder_path) as zipf:
+        for entry, page in zip(job.entries, job.pages):
+            data = zipf.read(entry)
+            key = cache.make_key(data, cmd) if cache is not None else None
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                job.sources[page] = cached[0]
+                hits += 1
+                continue
+            page_path = os.path.join(job.scratch_dir, page)
+            with open(page_path, "wb") as f:
+                f.write(data)
+            misses[page_path] = key
+            sizes[page_path] = len(data)
+    output = ""
+    if misses:
+        index = FolderIndex(job.scratch_dir)
+        savings = PageSavings(index, sizes, min_gain)
+        output = run_pingo(
+            job.scratch_dir, preset_name, presets, files=list(misses), dispatcher=dispatcher, savings=savings,
+            control=job.control, line_callback=job.log_line, index=index
+        )
+        job.pages_skipped = len(savings.skipped)
+        for page_path, key in misses.items():
+            if page_path in savings.skipped:
+                continue
+            optimized = os.path.join(job.scratch_dir, _pick_smaller(index, os.path.basename(page_path)))
+            job.sources[os.path.basename(page_path)] = optimized
+            if cache is not None:
+                cache.put(key, optimized)
+    return output, hits, len(misses)
+
+
+def package_archive(job: ArchiveJob, journal=None, cleanup=None) -> None:
+    """
+    Stage 3 for archives: write the new archive in one pass and hand the source to cleanup.
+    A page is only replaced by pingo's result if that is smaller; otherwise the
+    original bytes are copied through untouched, as is every entry that isn't a page.
+    An archive rewritten in place is verified before it replaces the source; if it
+    fails, the source is kept as it was and reported to cleanup.
+    """
+    if job.reached("done"):
+        return
+    try:
+        if not job.reached("archived"):
+            # The source is the only copy when it is rewritten in place
+            in_place = job.folder_path == job.zip_file_path
+            source_pages = archive_page_count(job.folder_path) if in_place else None
+            writer = CbzWriter(job.zip_file_path, len(job.pages))
+            pages_out = 0
+            job.pages_kept = 0
+            try:
+                with measure(job, "archive") as event:
+                    with zipfile.ZipFile(job.folder_path) as zipf, open(job.folder_path, "rb", buffering=0) as source:
+                        for index, (entry, page) in enumerate(zip(job.entries, job.pages)):
+                            info = zipf.getinfo(entry)
+                            original_size = info.file_size
+                            optimized = job.sources.get(page)
+                            # A cached page may have been evicted since the optimize stage
+                            optimized_size = os.path.getsize(optimized) \
+                                if optimized is not None and os.path.exists(optimized) else None
+                            if optimized_size is not None and optimized_size < original_size:
+                                name = os.path.splitext(page)[0] + os.path.splitext(optimized)[1]
+                                writer.add_page(index, optimized, name)
+                                pages_out += optimized_size
+                            else:
+                                if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                                    # Copy the stored bytes straight across, under the CRC they already have
+                                    writer.add_page(
+                                        index, job.folder_path, page, info.CRC, entry_data_offset(source, info),
+                                        original_size
+                                    )
+                                else:
+                                    writer.add_page_bytes(index, page, zipf.read(entry), info.CRC)
+                                pages_out += original_size
+                                job.pages_kept += optimized_size is not None
+                        # Everything that isn't a page (ComicInfo.xml, notes) is carried over unchanged
+                        pages = set(job.entries)
+                        for info in zipf.infolist():
+                            if info.is_dir() or info.filename in pages:
+                                continue
+                            if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                                writer.add_extra(
+                                    info.filename, job.folder_path, crc=info.CRC,
+                                    offset=entry_data_offset(source, info), size=info.file_size
+                                )
+                            else:
+                                writer.add_extra(info.filename, data=zipf.read(info), crc=info.CRC)
+                    # Only once the source is closed: close() replaces it when the archive is rewritten in place
+                    problem = writer.close(
+                        (lambda part_path: verify_archive(part_path, source_pages)) if in_place else None
+                    )
+                    if problem is None:
+                        event.update(files_out=1, bytes_out=os.path.getsize(job.zip_file_path))
+            except BaseException:
+                writer.abort()
+                raise
+            if problem is not None:
+                job.bytes_out = job.bytes_in
+                (cleanup or CleanupQueue(background=False)).left_in_place(
+                    job, f"its rewritten archive failed verification ({problem})"
+                )
+                return
+            if job.pingo_output is not None:
+                job.bytes_optimized = pages_out
+                job.pingo_output = "\n".join(filter(None, [
+                    job.pingo_output,
+                    format_savings(job.bytes_in, pages_out, job.pages_kept, job.pages_skipped),
+                ]))
+            job.advance("archived", journal)
+    finally:
+        job.cleanup()
+    job.bytes_out = os.path.getsize(job.zip_file_path)
+    if job.folder_path != job.zip_file_path and os.path.exists(job.folder_path):
+        (cleanup or CleanupQueue(background=False)).submit(job, journal, archive_page_count(job.folder_path))
+    else:
+        job.advance("done", journal)
+
+
+def process_single_folder(
+        item_path: str, zip_file_path: str, preset_name: str, skip_pingo: bool, presets: dict, cache=None,
+        instruments=None, min_gain: float = 0.0
+) -> Optional[str]:
+    """
+    Process a single folder and return pingo output if run.
+    instruments: optional instrument.Instrumentation that times each stage.
+    min_gain: skip pages whose format saved less than this fraction on earlier pages
+    """
+    job = FolderJob(item_path, zip_file_path)
+    job.instruments = instruments
+    prepare_folder(job)
+    optimize_folder(job, preset_name, skip_pingo, presets, cache, min_gain=min_gain)
+    package_folder(job)
+    return job.pingo_output
+
+
+def _is_archive(file: str) -> bool:
+    return os.path.splitext(file)[1].lower() in config.ARCHIVE_INPUT_EXTENSIONS
+
+
+def discover_folders(root_dir: str, output_ext: str) -> list:
+    """
+    Find every chapter folder under root_dir.
+    Returns a list of (folder_path, zip_file_path) tuples. A top-level folder with
+    subfolders is treated as a series and each subfolder becomes its own archive.
+    A top-level folder holding archives but no images is a series of existing
+    archives, not a chapter, and is left alone.
+    """
+    jobs = []
+    with os.scandir(root_dir) as it:
+        items = [entry for entry in it if entry.is_dir()]
+    for item in items:
+        with os.scandir(item.path) as it:
+            children = list(it)
+        subfolders = [child.path for child in children if child.is_dir()]
+        if not subfolders and any(_is_archive(child.name) for child in children) and not any(
+                image_format(child.name) for child in children
+        ):
+            continue
+        if subfolders:
+            for subfolder in subfolders:
+                zip_file_path = os.path.join(
+                    item.path, f"{os.path.basename(subfolder)}{output_ext}"
+                )
+                jobs.append((subfolder, zip_file_path))
+        else:
+            jobs.append((item.path, os.path.join(root_dir, f"{item.name}{output_ext}")))
+    return jobs
+
+
+def discover_archives(root_dir: str, output_ext: str) -> list:
+    """
+    Find existing comic archives in root_dir and its top-level series folders.
+    Returns a list of (archive_path, output_path) tuples; the output keeps the
+    archive's name with output_ext, so a .cbz written as .cbz replaces itself.
+    Files that aren't ZIP archives (a renamed RAR, a truncated download) are skipped.
+    """
+    archives = []
+    with os.scandir(root_dir) as it:
+        for item in it:
+            if item.is_dir():
+                with os.scandir(item.path) as children:
+                    archives.extend(
+                        child.path for child in children if _is_archive(child.name) and child.is_file()
+                    )
+            elif _is_archive(item.name):
+                archives.append(item.path)
+    readable = []
+    for path in natsorted(archives):
+        if zipfile.is_zipfile(path):
+            readable.append((path, os.path.splitext(path)[0] + output_ext))
+        else:
+            logger.warning(f"Skipping {path}: not a ZIP archive")
+    return readable
+
+
+def get_pingo_process_count(cmd: list) -> int:
+    """Return the number of threads pingo will use for the given command (-process=N)."""
+    for arg in cmd:
+        if arg.startswith("-process="):
+            try:
+                return max(1, int(arg.split("=", 1)[1]))
+            except ValueError:
+                break
+    return 1
+
+
+def resolve_worker_count(max_workers: int, cmd: list, skip_pingo: bool = False) -> int:
+    """
+    Return how many folders to process at once.
+    A positive max_workers is used as is. Zero means auto: divide the CPU count by
+    the threads each pingo process uses so folders and pingo don't oversubscribe cores.
+    """
+    if max_workers and max_workers > 0:
+        return max_workers
+    cpu_count = os.cpu_count() or 1
+    per_folder = 1 if skip_pingo else get_pingo_process_count(cmd)
+    return max(1, cpu_count // per_folder)
+
+
+def _series_of(job: FolderJob, root_dir: str) -> str:
+    """Return the series folder a chapter belongs to; a chapter directly in root_dir is its own series."""
+    parent = os.path.dirname(job.folder_path)
+    return job.folder_path if os.path.normpath(parent) == os.path.normpath(root_dir) else parent
+
+
+def _load_samples(job: FolderJob, count: int) -> list:
+    """Return (file_name, bytes) for a few pages spread through the folder or archive."""
+    if isinstance(job, ArchiveJob):
+        with zipfile.ZipFile(job.folder_path) as zipf:
+            return [
+                (page, zipf.read(entry))
+                for entry, page in pick_samples(list(zip(job.entries, job.pages)), count)
+            ]
+    pages = job.pages or list_pages(job.work_path, job.folder_index())
+    samples = []
+    for page in pick_samples(pages, count):
+        with open(os.path.join(job.work_path, page), "rb") as f:
+            samples.append((page, f.read()))
+    return samples
+
+
+def _retarget(entries: list, saved: dict, root_dir: str, output_ext: str) -> Optional[list]:
+    """
+    Fit the entries of an interrupted batch to this run's root directory and output
+    extension; None if they already do. A moved library has every path rebased, and
+    folders whose archive isn't written yet get one with the new extension.
+    """
+    changed = False
+    old_root = saved.get("root_dir")
+    if old_root and os.path.normcase(os.path.abspath(old_root)) != os.path.normcase(os.path.abspath(root_dir)):
+        logger.warning(f"Library moved from {old_root} to {root_dir} since the interrupted batch, resuming it there")
+        entries = [
+            [os.path.join(root_dir, os.path.relpath(path, old_root)) for path in (folder_path, zip_file_path)] + [stage]
+            for folder_path, zip_file_path, stage in entries
+        ]
+        changed = True
+    old_ext = saved.get("output_ext")
+    if old_ext and old_ext != output_ext:
+        logger.warning(
+            f"The interrupted batch wrote {old_ext} archives; the folders it hasn't archived yet get {output_ext}"
+        )
+        entries = [
+            [folder_path, zip_file_path if stage in ("archived", "done") else (
+                os.path.splitext(folder_path)[0] if os.path.isfile(folder_path) else folder_path
+            ) + output_ext, stage]
+            for folder_path, zip_file_path, stage in entries
+        ]
+        changed = True
+    return entries if changed else None
+
+
+def _resume_jobs(entries: list) -> list:
+    """Turn journal entries into jobs for the folders that still have work left."""
+    jobs = []
+    for folder_path, zip_file_path, stage in entries:
+        if os.path.isfile(folder_path) or (_is_archive(folder_path) and stage in ("archived", "done")):
+            # Scratch copies of an archive's pages don't survive a restart
+            job = ArchiveJob(folder_path, zip_file_path, stage if stage in ("archived", "done") else None)
+            if not job.reached("done"):
+                jobs.append(job)
+            continue
+        job = FolderJob(folder_path, zip_file_path, stage)
+        if job.reached("done"):
+            continue
+        if not os.path.isdir(folder_path) and not job.reached("archived"):
+            logger.warning(f"Skipping {folder_path}: folder no longer exists")
+            continue
+        jobs.append(job)
+    return jobs
+
+
+def process_root_directory(*args, **kwargs) -> list:
+    """Run a batch (see run_batch for the arguments) on a new event loop, for callers that don't have one."""
+    return asyncio.run(run_batch(*args, **kwargs))
+
+
+async def run_batch(
+        root_dir: str,
+        output_ext: str,
+        selected_preset: str,
+        skip_pingo: bool,
+        preset_dict: dict,
+        status_callback=None,
+        report_callback=None,
+        max_workers: int = 0,
+        cache=None,
+        resume: bool = True,
+        folder_callback=None,
+        include_archives: bool = False,
+        event_callback=None,
+        profile_path: Optional[str] = None,
+        min_gain: float = 0.0,
+        preset_selector=None,
+        control=None,
+        log_path: Optional[str] = None,
+        dedup: bool = True,
+        duplicate_report: bool = False,
+        scratch_dir: Optional[str] = None,
+        scratch_bytes: int = config.SCRATCH_MAX_MB * 1024 * 1024,
+        removal_policy: str = config.REMOVAL_POLICY,
+        hold_dir: Optional[str] = None
+) -> list:
+    """
+    Process all folders in the selected root directory, on the running event loop.
+    Returns a list of output messages for each processed folder (the last
+    config.REPORT_MAX_ENTRIES of them, so long batches don't hold every report).
+    status_callback: optional function to update status (e.g., for GUI)
+    report_callback: optional function(folder_name, pingo_output) called as each folder completes
+    max_workers: number of pingo processes run at once, 0 picks a value from the CPU count
+    cache: optional cache.PageCache; pages already in it skip pingo
+    resume: continue an interrupted batch from the journal in root_dir if there is one
+    folder_callback: optional function(job) called with each FolderJob once it is done
+    include_archives: also optimize existing .cbz/.zip files, reading pages straight from them
+    event_callback: optional function(event) called with a dict for every stage of every
+        folder (folder, stage, seconds, files_in/out, bytes_in/out); turns on stage timing
+    profile_path: write a cProfile dump of every stage call to this file; turns on stage timing
+    min_gain: skip re-encoding pages of a format whose earlier pages in the folder saved
+        less than this fraction (0.05 = 5%); 0 re-encodes every page
+    preset_selector: adaptive.PresetSelector used when selected_preset is config.AUTO_PRESET;
+        by default every preset is a candidate and decisions last for this run only
+    control: control.BatchControl to pause or stop the batch from another thread. Each
+        stage waits at its start while paused. On stop, running pingo calls are
+        terminated, folders in the middle of pingo are put back in their prepared
+        state and the batch returns early, keeping the journal so the next run
+        resumes after the work already finished.
+    log_path: append every line pingo prints, and the batch summaries, to this file;
+        the reports themselves only keep the first lines of each folder
+    dedup: send byte-identical pages found in several folders (credits, ads) to pingo
+        once and copy the result to the others; the batch report counts them
+    duplicate_report: also list every group of identical pages in the batch report
+    scratch_dir: process folders in a copy in this directory (e.g. a RAM disk) instead of
+        in place, so only the archive is written to the library; at most scratch_bytes of
+        it are used at once (see staging.ScratchSpace). A staged folder stopped before its
+        archive is written starts over on resume, from its untouched original.
+    removal_policy: what happens to a source once its archive is written and verified,
+        one of config.REMOVAL_POLICIES (trash, delete, keep, or move to hold_dir); sources are
+        removed in the background, several per trash call, and the batch report has
+        the verification time and how long removals trailed the archives
+
+    Folders are sized first (pages, bytes, pixels from the image headers) and started
+    largest first, and the status shows an ETA from the throughput so far.
+    Folders move through a prepare -> optimize -> package pipeline, so zipping and
+    trashing one folder overlaps with pingo running on the next. Pingo itself runs
+    on small page chunks from a batch-wide worker pool, so big folders at the end of
+    a batch still use every worker. Every stage transition is written to a journal,
+    removed once the whole batch finishes.
+
+    The batch is orchestrated on the event loop. Stages are tasks passing folders
+    through bounded queues, and each stage call, which is blocking file work, runs
+    in a thread pool (pipeline.Pipeline). Pingo is started with
+    asyncio.create_subprocess_exec by the dispatcher's tasks (dispatch.PageDispatcher).
+    Finding, sizing and reporting run in the default executor. Callbacks are only
+    called from executor threads, never on the loop, so they may block; a front end
+    that falls behind holds the batch back (bridge.BatchBridge).
+    """
+    cleanup = CleanupQueue(removal_policy, hold_dir, root_dir)
+    journal = Journal(root_dir)
+
+    def open_batch() -> list:
+        entries = journal.load() if resume else None
+        settings = {"root_dir": os.path.abspath(root_dir), "output_ext": output_ext}
+        if entries is not None:
+            retargeted = _retarget(entries, journal.settings, root_dir, output_ext)
+            if retargeted is not None:
+                entries = retargeted
+                journal.rewrite(entries, settings)
+            else:
+                journal.reopen()
+            jobs = _resume_jobs(entries)
+            if status_callback:
+                status_callback(f"Resuming interrupted batch\n{len(jobs)} folders left")
+            return plan_batch(jobs)
+        jobs = [FolderJob(folder_path, zip_file_path)
+                for folder_path, zip_file_path in discover_folders(root_dir, output_ext)]
+        if include_archives:
+            # A folder and an archive with the same name would write the same output
+            taken = {job.zip_file_path for job in jobs}
+            archives = discover_archives(root_dir, output_ext)
+            # Archives that are rewritten in place claim their name first
+            archives.sort(key=lambda entry: entry[0] != entry[1])
+            for archive_path, zip_file_path in archives:
+                if zip_file_path not in taken:
+                    taken.add(zip_file_path)
+                    jobs.append(ArchiveJob(archive_path, zip_file_path))
+        if status_callback:
+            status_callback(f"Sizing {len(jobs)} folders")
+        jobs = plan_batch(jobs)
+        journal.start([(job.folder_path, job.zip_file_path) for job in jobs], settings)
+        return jobs
+
+    jobs = await asyncio.to_thread(open_batch)
+    selector = None
+    if selected_preset == config.AUTO_PRESET and not skip_pingo:
+        selector = preset_selector or PresetSelector(preset_dict)
+    cmd = preset_dict.get(selected_preset, [])
+    if selector is not None:
+        # Size the pool for the candidate using the most threads
+        cmd = max((preset_dict[name] for name in selector.candidates), key=get_pingo_process_count)
+    workers = resolve_worker_count(max_workers, cmd, skip_pingo)
+    pingo_outputs = deque(maxlen=config.REPORT_MAX_ENTRIES)
+    if not jobs:
+        await asyncio.to_thread(cleanup.close)
+        await asyncio.to_thread(journal.close, True)
+        return list(pingo_outputs)
+
+    log = ReportLog(log_path) if log_path else None
+    duplicates = None
+    if dedup and not skip_pingo:
+        duplicates = DuplicateIndex()
+        folders = [job for job in jobs if not isinstance(job, ArchiveJob) and not job.reached("optimized")]
+        await asyncio.to_thread(lambda: duplicates.scan([(job.folder_path, job.folder_index()) for job in folders]))
+        for job in folders:
+            job.duplicates = duplicates
+    for job in jobs:
+        job.control = control
+        job.log = log
+
+    instruments = None
+    if event_callback is not None or profile_path:
+        instruments = Instrumentation(event_callback, profile_path)
+        for job in jobs:
+            job.instruments = instruments
+
+    def timed(func):
+        if instruments is not None:
+            func = instruments.profiled(func)
+
+        def run(job):
+            if control is not None:
+                control.checkpoint()
+            started = time.monotonic()
+            try:
+                func(job)
+            finally:
+                job.seconds += time.monotonic() - started
+
+        return run
+
+    scratch = None
+    if scratch_dir:
+        from .staging import ScratchSpace
+        scratch = ScratchSpace(scratch_dir, scratch_bytes, control)
+
+    def folder_journal(job):
+        # A scratch copy doesn't survive a restart, so its stages before the archive aren't recorded
+        return journal if job.work_path == job.folder_path else None
+
+    @timed
+    def prepare(job):
+        if isinstance(job, ArchiveJob):
+            prepare_archive(job, journal)
+            return
+        # Folders with work done in place on an earlier run carry on in place
+        if scratch is not None and job.stage is None:
+            with measure(job, "copy", job.folder_path):
+                scratch.stage(job, lambda: pipe.stopping)
+        prepare_folder(job, folder_journal(job))
+
+    @timed
+    def optimize(job):
+        if status_callback:
+            status_callback(f"Processing\n{job.name}\n{format_stats()}")
+        preset, note = selected_preset, None
+        if selector is not None and not job.reached("optimized"):
+            preset, note = selector.choose(
+                _series_of(job, root_dir), lambda: _load_samples(job, selector.sample_pages), control
+            )
+        if isinstance(job, ArchiveJob):
+            optimize_archive(job, preset, skip_pingo, preset_dict, cache, journal, dispatcher, min_gain)
+        else:
+            optimize_folder(job, preset, skip_pingo, preset_dict, cache, folder_journal(job), dispatcher, min_gain)
+        if note:
+            job.pingo_output = "\n".join(filter(None, [f"Preset: {preset} ({note})", job.pingo_output]))
+
+    @timed
+    def package(job):
+        if isinstance(job, ArchiveJob):
+            package_archive(job, journal, cleanup)
+        else:
+            package_folder(job, journal, cleanup)
+            if scratch is not None:
+                scratch.release(job)
+
+    def on_stage_done(stage, job):
+        if status_callback:
+            status_callback(f"{stage.name.capitalize()}d\n{job.name}\n{format_stats()}")
+
+    def format_stats():
+        lines = [pipe.format_stats()]
+        if dispatcher is not None:
+            lines.append(dispatcher.format_stats())
+        lines.append(progress.format_eta())
+        return "\n".join(lines)
+
+    def report_batch(text):
+        pingo_outputs.append(text)
+        if log is not None:
+            log.write("Batch", text)
+        if report_callback:
+            report_callback("Batch", text)
+
+    def on_complete(job):
+        progress.record(job)
+        if folder_callback:
+            folder_callback(job)
+        if job.pingo_output:
+            pingo_outputs.append(f"{job.name}:\n{job.pingo_output}")
+            if report_callback:
+                report_callback(job.name, job.pingo_output)
+
+    pipe = Pipeline(
+        [
+            Stage("prepare", prepare),
+            # One folder more than pingo workers keeps the chunk queue from running dry
+            Stage("optimize", optimize, workers=min(workers + 1, len(jobs))),
+            Stage("package", package, workers=config.PACKAGE_WORKERS),
+        ],
+        queue_size=config.PIPELINE_QUEUE_SIZE,
+        stats_callback=on_stage_done,
+    )
+    def close_batch(finished):
+        # Folders are only journaled done once their source is removed
+        cleanup.close()
+        journal.close(finished)
+        optimized = [job for job in jobs if job.bytes_optimized is not None]
+        if optimized:
+            report_batch(format_savings(
+                sum(job.bytes_in for job in optimized),
+                sum(job.bytes_optimized for job in optimized),
+                sum(job.pages_kept for job in optimized),
+                sum(job.pages_skipped for job in optimized),
+            ))
+        if duplicates is not None:
+            if duplicates.pages_reused:
+                report_batch(duplicates.summary(root_dir, duplicate_report))
+            duplicates.close()
+        if cache is not None and not skip_pingo:
+            cache.save()
+            report_batch(cache.summary())
+        if cleanup.submitted:
+            report_batch(cleanup.summary())
+        if scratch is not None:
+            scratch.close()
+            report_batch(scratch.summary())
+        if instruments is not None:
+            instruments.dump_profile()
+            report_batch(instruments.summary())
+        if log is not None:
+            log.close()
+
+    progress = BatchProgress(jobs)
+    dispatcher = None if skip_pingo else PageDispatcher(workers, control)
+    finished = False
+    if instruments is not None:
+        instruments.start()
+    try:
+        await pipe.run(jobs, on_complete=on_complete)
+        finished = True
+    except Cancelled:
+        await asyncio.to_thread(report_batch, "Stopped: run the batch again to resume")
+    finally:
+        if dispatcher is not None:
+            await dispatcher.close()
+        await asyncio.to_thread(close_batch, finished)
+    return list(pingo_outputs)
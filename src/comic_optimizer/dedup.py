@@ -0,0 +1,155 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+from . import config
+from .control import POLL_SECONDS
+
+
+class _Entry:
+    """One distinct page content: where its copies are and, once published, pingo's result for it."""
+
+    def __init__(self, owner: str, size: int):
+        self.owner = owner
+        self.size = size
+        self.paths = []
+        self.ready = threading.Event()
+        self.published = False
+        # Optimized file in the scratch directory, None if the original was kept
+        self.result = None
+
+
+class DuplicateIndex:
+    """
+    Batch-wide index of byte-identical pages, so each is sent to pingo once.
+    Candidates are narrowed cheaply before anything is hashed in full: scan() groups
+    the batch's pages by size and hashes the first prefix_bytes of pages whose size
+    is shared; at optimize time only pages whose size and prefix both match another
+    page are hashed in full. The first folder to claim a page runs pingo on it and
+    publishes the result; every other copy is replaced by that result, waiting for
+    it if the owner is still running.
+    """
+
+    def __init__(self, prefix_bytes: int = config.DEDUP_PREFIX_BYTES):
+        self.prefix_bytes = prefix_bytes
+        self.pages_reused = 0
+        self.bytes_reused = 0
+        self._sizes = set()
+        self._prefixes = set()
+        self._entries = {}
+        self._scratch = None
+        self._lock = threading.Lock()
+
+    def _prefix(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read(self.prefix_bytes)).digest()
+
+    def scan(self, folders: list) -> None:
+        """Find the size and prefix groups with more than one page among (folder_path, FolderIndex) pairs."""
+        by_size = {}
+        for folder_path, index in folders:
+            for page in index.pages(recursive=True):
+                size = index.size(page.name)
+                if size:
+                    by_size.setdefault(size, []).append(os.path.join(folder_path, page.name))
+        prefixes = {}
+        for size, paths in by_size.items():
+            if len(paths) < 2:
+                continue
+            self._sizes.add(size)
+            for path in paths:
+                key = (size, self._prefix(path))
+                prefixes[key] = prefixes.get(key, 0) + 1
+        self._prefixes = {key for key, count in prefixes.items() if count > 1}
+
+    def digest(self, path: str, size: int) -> Optional[str]:
+        """Return the full hash of a page that may have a duplicate in the batch, else None."""
+        if size not in self._sizes or (size, self._prefix(path)) not in self._prefixes:
+            return None
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    def claim(self, folder_path: str, sizes: dict, work_path: Optional[str] = None) -> tuple:
+        """
+        Sort a folder's pages ({path: size}) by who optimizes them.
+        Returns (owned, copies), both {path: digest}: owned pages are the first
+        copy seen and this folder must publish() or release() them; copies are
+        optimized elsewhere (or earlier in this folder) and are filled in by fetch().
+        Pages in neither have no duplicate. work_path is where the pages are if not in
+        folder_path (a scratch copy); the summary names them under folder_path.
+        """
+        owned, copies = {}, {}
+        for path, size in sizes.items():
+            digest = self.digest(path, size)
+            if digest is None:
+                continue
+            with self._lock:
+                entry = self._entries.get(digest)
+                if entry is None:
+                    entry = self._entries[digest] = _Entry(folder_path, size)
+                    owned[path] = digest
+                else:
+                    copies[path] = digest
+                entry.paths.append(
+                    os.path.join(folder_path, os.path.relpath(path, work_path)) if work_path else path
+                )
+        return owned, copies
+
+    def publish(self, digest: str, result_path: str, page_path: str) -> None:
+        """Share the file pingo produced for an owned page (page_path itself if the original was kept)."""
+        entry = self._entries[digest]
+        if result_path != page_path:
+            with self._lock:
+                if self._scratch is None:
+                    self._scratch = tempfile.mkdtemp(prefix="comic-optimizer-dedup-")
+            entry.result = os.path.join(self._scratch, digest + os.path.splitext(result_path)[1])
+            shutil.copyfile(result_path, entry.result)
+        entry.published = True
+        entry.ready.set()
+
+    def release(self, digest: str) -> None:
+        """Give up an owned page without a result (the owner failed or was stopped); copies run pingo themselves."""
+        self._entries[digest].ready.set()
+
+    def fetch(self, page_path: str, digest: str, control=None) -> bool:
+        """
+        Replace a copy with the published result, waiting for the owner if needed.
+        Returns False if the owner released the page, so it still needs pingo.
+        """
+        entry = self._entries[digest]
+        while not entry.ready.wait(POLL_SECONDS):
+            if control is not None:
+                control.checkpoint()
+        if not entry.published:
+            return False
+        if entry.result is not None:
+            output_path = os.path.splitext(page_path)[0] + os.path.splitext(entry.result)[1]
+            shutil.copyfile(entry.result, output_path)
+            if output_path != page_path:
+                os.remove(page_path)
+        with self._lock:
+            self.pages_reused += 1
+            self.bytes_reused += entry.size
+        return True
+
+    def summary(self, root_dir: Optional[str] = None, details: bool = False) -> str:
+        """One line on the copies found, plus one line per group of identical pages with details."""
+        groups = [entry for entry in self._entries.values() if len(entry.paths) > 1]
+        lines = [
+            f"Duplicates: {self.pages_reused} pages identical to another page in the batch, "
+            f"{self.bytes_reused / (1024 * 1024):.1f} MB not sent to pingo ({len(groups)} distinct pages)"
+        ]
+        if details:
+            for entry in sorted(groups, key=lambda entry: entry.size * len(entry.paths), reverse=True):
+                paths = [os.path.relpath(path, root_dir) if root_dir else path for path in entry.paths]
+                lines.append(f"{len(paths)} copies of {entry.size / 1024:.0f} KB: {', '.join(paths)}")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        """Remove the shared results."""
+        if self._scratch is not None:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+            self._scratch = None
@@ -0,0 +1,150 @@
+import asyncio
+from collections import deque
+
+from .control import Cancelled
+from .encoders import encode_async
+
+
+class _Ticket:
+    """Tracks the chunks of one submission until every one has run."""
+
+    def __init__(self, chunk_count: int, chunk_callback, chunk_filter=None, line_callback=None):
+        self.remaining = chunk_count
+        self.outputs = [None] * chunk_count
+        self.chunk_callback = chunk_callback
+        self.chunk_filter = chunk_filter
+        self.line_callback = line_callback
+        self.error = None
+        self.done = asyncio.Event()
+        if chunk_count == 0:
+            self.done.set()
+
+    def finish_chunk(self) -> None:
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.done.set()
+
+
+class PageDispatcher:
+    """
+    Pool of pingo workers shared by every folder in a batch.
+    Folders are split into chunks of pages and spread over per-worker queues. A
+    worker runs chunks from its own queue and, once that is empty, steals from the
+    back of the busiest other queue, so every core keeps working until the last
+    page of the batch is done, even when only one big folder is left.
+    The workers are tasks on the event loop the dispatcher is created on: pingo is
+    started with asyncio.create_subprocess_exec (encoders.encode_async) and the
+    callbacks, which read and write files, run in the loop's default executor.
+    With a control.BatchControl, queued chunks wait while paused and running pingo
+    calls are terminated when the batch is stopped.
+    """
+
+    def __init__(self, workers: int, control=None):
+        self.workers = max(1, workers)
+        self.control = control
+        self._loop = asyncio.get_running_loop()
+        self._queues = [deque() for _ in range(self.workers)]
+        self._ready = asyncio.Condition()
+        self._closed = False
+        self._next_queue = 0
+        self._running = 0
+        self._done = 0
+        self._tasks = [self._loop.create_task(self._worker(index)) for index in range(self.workers)]
+
+    def run(self, cmd: list, chunks: list, chunk_callback=None, chunk_filter=None, line_callback=None) -> list:
+        """
+        Run cmd on every chunk of file paths and block until all are done.
+        For threads other than the dispatcher's loop, such as the pipeline's stages.
+        chunk_callback(chunk) is called from an executor thread as each chunk finishes.
+        chunk_filter(chunk), if given, is called just before a chunk runs and returns
+        the paths still worth running; a chunk filtered down to nothing is not run.
+        line_callback(line) gets pingo's output as it streams in, from several
+        threads at once; without it, the output of each chunk is returned in order.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            raise RuntimeError("PageDispatcher.run() would block its own event loop; await run_async()")
+        return asyncio.run_coroutine_threadsafe(
+            self.run_async(cmd, chunks, chunk_callback, chunk_filter, line_callback), self._loop
+        ).result()
+
+    async def run_async(self, cmd: list, chunks: list, chunk_callback=None, chunk_filter=None,
+                        line_callback=None) -> list:
+        """run() for coroutines on the dispatcher's loop."""
+        if self._closed:
+            raise RuntimeError("Dispatcher is closed")
+        ticket = _Ticket(len(chunks), chunk_callback, chunk_filter, line_callback)
+        async with self._ready:
+            for index, chunk in enumerate(chunks):
+                self._queues[self._next_queue].append((ticket, index, cmd, chunk))
+                self._next_queue = (self._next_queue + 1) % self.workers
+            self._ready.notify_all()
+        await ticket.done.wait()
+        if ticket.error is not None:
+            raise ticket.error
+        return ticket.outputs
+
+    def _take(self, index: int):
+        own = self._queues[index]
+        if own:
+            return own.popleft()
+        victim = max(self._queues, key=len)
+        if victim:
+            return victim.pop()
+        return None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            async with self._ready:
+                item = self._take(index)
+                while item is None:
+                    if self._closed:
+                        return
+                    await self._ready.wait()
+                    item = self._take(index)
+            self._running += 1
+            ticket, chunk_index, cmd, chunk = item
+            try:
+                if ticket.error is None:
+                    targets = chunk
+                    if ticket.chunk_filter:
+                        targets = await self._loop.run_in_executor(None, ticket.chunk_filter, chunk)
+                    ticket.outputs[chunk_index] = ""
+                    if targets:
+                        ticket.outputs[chunk_index] = await encode_async(
+                            cmd, targets, self.control, ticket.line_callback
+                        )
+                    if ticket.chunk_callback:
+                        await self._loop.run_in_executor(None, ticket.chunk_callback, chunk)
+            except asyncio.CancelledError:
+                # The loop is going away: nothing queued will run, so release everyone waiting
+                ticket.error = Cancelled("Batch stopped")
+                self._abandon()
+                raise
+            except Exception as e:
+                ticket.error = e
+            finally:
+                self._running -= 1
+                self._done += 1
+                ticket.finish_chunk()
+
+    def _abandon(self) -> None:
+        for queue in self._queues:
+            while queue:
+                ticket = queue.popleft()[0]
+                ticket.error = ticket.error or Cancelled("Batch stopped")
+                ticket.finish_chunk()
+
+    def format_stats(self) -> str:
+        queued = sum(len(queue) for queue in self._queues)
+        return f"pingo: {queued} chunks queued, {self._running} running, {self._done} done"
+
+    async def close(self) -> None:
+        """Stop the workers once their queues are empty."""
+        async with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+        await asyncio.gather(*self._tasks)
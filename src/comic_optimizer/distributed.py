@@ -0,0 +1,416 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Optional
+
+from . import config, core
+from .control import BatchControl, Cancelled
+from .planner import plan_batch
+
+logger = logging.getLogger(__name__)
+
+# Subdirectories of the queue directory, one per state a queued folder can be in
+STATES = ("pending", "leased", "done", "failed")
+
+
+class LeaseLost(Exception):
+    """Raised when a worker's lease expired and its folder went back to the queue."""
+
+
+def _to_queue_path(root_dir: str, path: str) -> str:
+    # Hosts may mount the library at different places, or run different systems
+    return os.path.relpath(path, root_dir).replace(os.sep, "/")
+
+
+def _from_queue_path(root_dir: str, path: str) -> str:
+    return os.path.join(root_dir, *path.split("/"))
+
+
+class Lease:
+    """
+    A worker's claim on one queued folder: the file leased/<key>~<token>.json.
+    The token is new for every claim, so a worker whose lease expired can't renew
+    or finish a later claim of the same folder. The lease file is also the folder's
+    journal (record() has the same signature as Journal.record()): a folder taken
+    back from a worker that died resumes after its last finished stage.
+    """
+
+    def __init__(self, queue, key: str, token: str, entry: dict):
+        self.queue = queue
+        self.key = key
+        self.entry = entry
+        self.path = queue._path("leased", f"{key}~{token}")
+        self.lost = False
+
+    def _rewrite(self) -> None:
+        try:
+            with open(self.path, "r+", encoding="utf-8") as f:
+                f.truncate()
+                f.write(json.dumps(self.entry))
+                f.flush()
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            self.lost = True
+            raise LeaseLost(f"Lost the lease on {self.entry['folder']}") from None
+
+    def _move(self, state: str) -> None:
+        self._rewrite()
+        try:
+            os.rename(self.path, self.queue._path(state, self.key))
+        except FileNotFoundError:
+            self.lost = True
+            raise LeaseLost(f"Lost the lease on {self.entry['folder']}") from None
+
+    def heartbeat(self) -> None:
+        """Renew the lease; raises LeaseLost if it already expired."""
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            self.lost = True
+            raise LeaseLost(f"Lost the lease on {self.entry['folder']}") from None
+
+    def record(self, folder_path: str, stage: str) -> None:
+        """Durably record that the folder has finished a stage."""
+        self.entry["stage"] = stage
+        self._rewrite()
+
+    def complete(self, result: dict) -> None:
+        self.entry["result"] = result
+        self._move("done")
+
+    def fail(self, error: str) -> None:
+        self.entry["error"] = error
+        self._move("failed")
+
+    def release(self) -> None:
+        """Put the folder back in the queue for another worker, keeping the stages it finished."""
+        self._move("pending")
+
+
+class FolderQueue:
+    """
+    A batch's folders shared between machines through a directory on a shared filesystem.
+    Each folder is a small JSON file that moves between the pending, leased, done and
+    failed subdirectories by rename, which is atomic, so two workers never claim the
+    same folder. Workers touch their lease files while they work; a lease whose file
+    hasn't been touched for lease_seconds belongs to a worker that died, and any
+    worker (or the coordinator) puts its folder back in pending. Lease ages are
+    measured against the shared filesystem's clock, so hosts need not agree on the time.
+    Folder and archive paths are stored relative to the library root. The coordinator
+    marks the queue complete once every folder is in it; until then an empty queue
+    only means the folders are still being planned.
+    """
+
+    def __init__(self, queue_dir: str, lease_seconds: float = config.QUEUE_LEASE_SECONDS,
+                 max_attempts: int = config.QUEUE_MAX_ATTEMPTS):
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        for state in STATES:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _path(self, state: str, name: str) -> str:
+        return os.path.join(self.queue_dir, state, name + ".json")
+
+    def _names(self, state: str) -> list:
+        # Keys start with the folder's position in the plan, so this is largest folder first
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.queue_dir, state)) if name.endswith(".json"))
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def now(self) -> float:
+        """Return the shared filesystem's current time."""
+        path = os.path.join(self.queue_dir, "clock")
+        open(path, "a").close()
+        os.utime(path)
+        return os.stat(path).st_mtime
+
+    @property
+    def complete(self) -> bool:
+        """Whether the coordinator has finished queuing folders."""
+        return os.path.exists(os.path.join(self.queue_dir, "complete"))
+
+    def mark_complete(self, complete: bool = True) -> None:
+        """Mark the queue as holding every folder of the batch, or as still being filled."""
+        path = os.path.join(self.queue_dir, "complete")
+        if complete:
+            open(path, "a").close()
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def counts(self) -> dict:
+        return {state: len(self._names(state)) for state in STATES}
+
+    def enqueue(self, root_dir: str, jobs: list) -> int:
+        """Queue planned FolderJobs in order; folders already in the queue are left alone. Returns the number added."""
+        queued = {name.split("~")[0].split("-", 1)[1] for state in STATES for name in self._names(state)}
+        position = len(queued)
+        added = 0
+        for job in jobs:
+            folder = _to_queue_path(root_dir, job.folder_path)
+            digest = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:16]
+            if digest in queued:
+                continue
+            queued.add(digest)
+            entry = {"folder": folder, "archive": _to_queue_path(root_dir, job.zip_file_path), "stage": job.stage,
+                     "attempts": 0}
+            temp_path = os.path.join(self.queue_dir, f".{digest}.tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self._path("pending", f"{position:06d}-{digest}"))
+            position += 1
+            added += 1
+        return added
+
+    def claim(self, worker_id: str) -> Optional[Lease]:
+        """Lease the next pending folder, or return None if there is none."""
+        for key in self._names("pending"):
+            pending_path = self._path("pending", key)
+            token = uuid.uuid4().hex[:12]
+            lease_path = self._path("leased", f"{key}~{token}")
+            try:
+                # Renaming keeps the mtime, which must not look like an expired lease
+                os.utime(pending_path)
+                os.rename(pending_path, lease_path)
+            except FileNotFoundError:
+                # Another worker got there first
+                continue
+            lease = Lease(self, key, token, self._read(lease_path))
+            lease.entry["worker"] = worker_id
+            lease._rewrite()
+            return lease
+        return None
+
+    def requeue_expired(self) -> int:
+        """Put folders whose worker stopped renewing its lease back in the queue. Returns how many were found."""
+        now = self.now()
+        expired = 0
+        for name in self._names("leased"):
+            path = self._path("leased", name)
+            try:
+                if now - os.stat(path).st_mtime <= self.lease_seconds:
+                    continue
+                entry = self._read(path)
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                # Torn by a crash mid-write, so it no longer says which folder it was
+                entry = {"attempts": self.max_attempts - 1, "error": f"Lease {name} was damaged by a crash"}
+            key, token = name.split("~")
+            entry["attempts"] = entry.get("attempts", 0) + 1
+            state = "pending"
+            if entry["attempts"] >= self.max_attempts:
+                state = "failed"
+                entry.setdefault("error", f"Worker {entry.get('worker')} stopped responding {entry['attempts']} times")
+            lease = Lease(self, key, token, entry)
+            try:
+                lease._move(state)
+            except LeaseLost:
+                continue
+            logger.warning(f"Lease on {entry.get('folder', key)} expired, moved to {state}")
+            expired += 1
+        return expired
+
+    def entries(self, state: str) -> list:
+        """Return the entries of every folder in a state."""
+        entries = []
+        for name in self._names(state):
+            try:
+                entries.append(self._read(self._path(state, name)))
+            except (FileNotFoundError, ValueError):
+                continue
+        return entries
+
+
+def enqueue_library(queue: FolderQueue, root_dir: str, output_ext: str) -> int:
+    """
+    Plan the library's folders, largest first, and add them to the queue. Returns the number added.
+    Workers that find the queue empty in the meantime wait for it to be marked complete.
+    """
+    queue.mark_complete(False)
+    jobs = [core.FolderJob(folder_path, zip_file_path)
+            for folder_path, zip_file_path in core.discover_folders(root_dir, output_ext)]
+    added = queue.enqueue(root_dir, plan_batch(jobs))
+    queue.mark_complete()
+    return added
+
+
+def wait_for_queue(queue: FolderQueue, status_callback=None, control=None) -> dict:
+    """
+    Watch the queue until every folder is done or failed, putting back folders of
+    dead workers, and return the final counts.
+    """
+    last = None
+    while True:
+        queue.requeue_expired()
+        # Read before the counts, so folders queued just before the queue was marked complete are seen
+        complete = queue.complete
+        counts = queue.counts()
+        if counts != last and status_callback:
+            status_callback(f"Queue: {counts['pending']} pending, {counts['leased']} running, "
+                            f"{counts['done']} done, {counts['failed']} failed")
+        last = counts
+        if not counts["pending"] and not counts["leased"] and complete:
+            return counts
+        if control is not None and control.cancelled:
+            return counts
+        time.sleep(config.QUEUE_POLL_SECONDS)
+
+
+class QueueWorker:
+    """
+    Processes folders claimed from a FolderQueue until it is empty, `workers` at a time.
+    Each folder goes through the same prepare, optimize and package stages as in
+    process_root_directory, with its lease as the journal. A heartbeat thread renews
+    the leases; if one is lost anyway (the worker stalled past the lease), pingo is
+    stopped on that folder and it is left to the worker that took it over.
+    Once nothing is pending the worker keeps polling while other workers hold
+    leases, so it can take over their folders if they die, and while the coordinator
+    hasn't finished queuing, so a worker may be started first. With a
+    staging.ScratchSpace, folders are copied there and processed locally. cleanup is
+    a cleanup.CleanupQueue with background=False, so a folder's source is gone
+    before its lease is completed.
+    """
+
+    def __init__(self, queue: FolderQueue, root_dir: str, preset_name: str, skip_pingo: bool, presets: dict,
+                 workers: int = 0, worker_id: Optional[str] = None, cache=None, min_gain: float = 0.0, log=None,
+                 status_callback=None, folder_callback=None, report_callback=None, scratch=None, cleanup=None):
+        self.queue = queue
+        self.root_dir = root_dir
+        self.preset_name = preset_name
+        self.skip_pingo = skip_pingo
+        self.presets = presets
+        self.workers = core.resolve_worker_count(workers, presets.get(preset_name, []), skip_pingo)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.cache = cache
+        self.min_gain = min_gain
+        self.log = log
+        self.status_callback = status_callback
+        self.folder_callback = folder_callback
+        self.report_callback = report_callback
+        self.scratch = scratch
+        self.cleanup = cleanup
+        self.control = BatchControl()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.control.cancelled
+
+    def cancel(self) -> None:
+        """Stop: folders being processed are rolled back and put back in the queue."""
+        self.control.cancel()
+        with self._lock:
+            for folder_control in self._active.values():
+                folder_control.cancel()
+
+    def run(self) -> None:
+        if not self.queue.complete and self.status_callback:
+            self.status_callback("Waiting for the coordinator to queue folders")
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stopped,), daemon=True)
+        heartbeat.start()
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            stopped.set()
+            heartbeat.join()
+
+    def _heartbeat(self, stopped: threading.Event) -> None:
+        while not stopped.wait(self.queue.lease_seconds / 4):
+            with self._lock:
+                active = list(self._active.items())
+            for lease, folder_control in active:
+                try:
+                    lease.heartbeat()
+                except LeaseLost as e:
+                    logger.warning(f"{e}, stopping work on it")
+                    folder_control.cancel()
+
+    def _work(self) -> None:
+        while not self.control.cancelled:
+            lease = self.queue.claim(self.worker_id)
+            if lease is not None:
+                self._process(lease)
+                continue
+            if self.queue.requeue_expired():
+                continue
+            # Read before the counts, so folders queued just before the queue was marked complete are seen
+            complete = self.queue.complete
+            counts = self.queue.counts()
+            if not counts["pending"] and not counts["leased"] and complete:
+                return
+            time.sleep(config.QUEUE_POLL_SECONDS)
+
+    def _process(self, lease: Lease) -> None:
+        entry = lease.entry
+        job = core.FolderJob(_from_queue_path(self.root_dir, entry["folder"]),
+                             _from_queue_path(self.root_dir, entry["archive"]), entry.get("stage"))
+        job.control = BatchControl()
+        job.log = self.log
+        with self._lock:
+            self._active[lease] = job.control
+        # A stop that came in between the claim and now
+        if self.control.cancelled:
+            job.control.cancel()
+        started = time.monotonic()
+        try:
+            if not os.path.isdir(job.folder_path) and not job.reached("archived"):
+                raise FileNotFoundError(f"Folder {job.folder_path} no longer exists")
+            if self.status_callback:
+                self.status_callback(f"Processing {entry['folder']}")
+            journal = lease
+            if self.scratch is not None and job.stage is None:
+                if self.scratch.stage(job, lambda: job.control.cancelled):
+                    # The scratch copy is lost with this worker, so its folder starts over elsewhere
+                    journal = None
+            job.control.checkpoint()
+            core.prepare_folder(job, journal)
+            job.control.checkpoint()
+            core.optimize_folder(job, self.preset_name, self.skip_pingo, self.presets, self.cache, journal,
+                                 min_gain=self.min_gain)
+            job.control.checkpoint()
+            core.package_folder(job, lease, self.cleanup)
+            job.seconds = time.monotonic() - started
+            lease.complete({
+                "worker": self.worker_id, "seconds": round(job.seconds, 3), "bytes_in": job.bytes_in,
+                "bytes_out": job.bytes_out, "pages_kept": job.pages_kept, "pages_skipped": job.pages_skipped,
+            })
+        except (Cancelled, LeaseLost):
+            if not lease.lost:
+                try:
+                    lease.release()
+                except LeaseLost:
+                    pass
+            return
+        except Exception as e:
+            logger.exception(f"Failed to process {job.folder_path}")
+            try:
+                lease.fail(str(e))
+            except LeaseLost:
+                pass
+            if self.report_callback:
+                self.report_callback(job.name, f"Failed: {e}")
+            return
+        finally:
+            with self._lock:
+                del self._active[lease]
+            if self.scratch is not None:
+                self.scratch.release(job)
+        if self.folder_callback:
+            self.folder_callback(job)
+        if job.pingo_output and self.report_callback:
+            self.report_callback(job.name, job.pingo_output)
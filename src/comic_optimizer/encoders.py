@@ -0,0 +1,172 @@
+import asyncio
+import io
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .control import POLL_SECONDS, Cancelled, run_command, run_command_async
+from .imageinfo import image_format
+
+# First word of a preset run by the in-process Pillow encoder instead of as a command
+PILLOW = "pillow"
+
+
+class Encoder(ABC):
+    """
+    Runs a preset on pages. Whatever the backend, an encoder works like pingo: the
+    result for each page is written as a .webp next to it (over it for a .webp page),
+    and one "<file> : <bytes before> -> <bytes after>" line per page is returned and
+    passed to line_callback as it comes. paths may include folders, meaning the
+    pages directly in them. With a control.BatchControl, the encoder waits while
+    paused and raises Cancelled once the batch is stopped. run_async() is the same
+    for an event loop; by default it runs run() in the loop's default executor.
+    """
+
+    @abstractmethod
+    def run(self, cmd: list, paths: list, control=None, line_callback=None) -> str:
+        """Encode the pages and return pingo-style result lines."""
+
+    async def run_async(self, cmd: list, paths: list, control=None, line_callback=None) -> str:
+        """Encode the pages without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, cmd, paths, control, line_callback)
+
+
+class CommandEncoder(Encoder):
+    """A preset that is a command line, pingo's or another tool's that takes the same arguments."""
+
+    def run(self, cmd: list, paths: list, control=None, line_callback=None) -> str:
+        return run_command(cmd + paths, control, line_callback)
+
+    async def run_async(self, cmd: list, paths: list, control=None, line_callback=None) -> str:
+        return await run_command_async(cmd + paths, control, line_callback)
+
+
+def _flag(cmd: list, name: str, default: int) -> int:
+    for arg in cmd:
+        if arg.startswith(f"-{name}="):
+            try:
+                return int(arg.split("=", 1)[1])
+            except ValueError:
+                break
+    return default
+
+
+def _encode_page(path: str, lossless: bool, quality: int, method: int) -> str:
+    """Encode one page to WebP in a pool process; the .webp is only written if it is smaller."""
+    from PIL import Image
+
+    name = os.path.basename(path)
+    before = os.path.getsize(path)
+    try:
+        with Image.open(path) as image:
+            if getattr(image, "n_frames", 1) > 1:
+                return f"{name} : animated, left as is"
+            icc_profile = image.info.get("icc_profile")
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, "WEBP", lossless=lossless, quality=quality, method=method, icc_profile=icc_profile)
+    except (OSError, ValueError) as e:
+        return f"{name} : {e}"
+    data = buffer.getbuffer()
+    if len(data) < before:
+        with open(os.path.splitext(path)[0] + ".webp", "wb") as f:
+            f.write(data)
+    return f"{name} : {before} -> {len(data)}"
+
+
+class PillowEncoder(Encoder):
+    """
+    Encodes pages to WebP with Pillow (libwebp) in a pool of processes started once
+    and kept for the whole run, instead of starting pingo for every call. Each page is
+    decoded once and encoded in memory; nothing is written unless the WebP is smaller
+    than the page. Animated images are left alone.
+    Preset flags: -lossless, -quality=N (0-100, default 80) and -method=N (0-6,
+    default 4, higher is slower and smaller). -process=N is read as for pingo, to
+    decide how many folders run at once.
+    """
+
+    def __init__(self, processes: int = 0):
+        self.processes = processes or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.processes)
+            return self._pool
+
+    def _reset_pool(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    @staticmethod
+    def _pages(paths: list) -> list:
+        pages = []
+        for path in paths:
+            if os.path.isdir(path):
+                with os.scandir(path) as it:
+                    pages.extend(sorted(entry.path for entry in it if entry.is_file() and image_format(entry.name)))
+            else:
+                pages.append(path)
+        return pages
+
+    def run(self, cmd: list, paths: list, control=None, line_callback=None) -> str:
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise RuntimeError(f"Preset {' '.join(cmd)} needs Pillow, which is not installed") from None
+        if control is not None:
+            control.checkpoint()
+        options = {
+            "lossless": "-lossless" in cmd,
+            "quality": _flag(cmd, "quality", 80),
+            "method": _flag(cmd, "method", 4),
+        }
+        pool = self._get_pool()
+        pending = {pool.submit(_encode_page, path, **options) for path in self._pages(paths)}
+        lines = []
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in done:
+                    line = future.result()
+                    lines.append(line)
+                    if line_callback:
+                        line_callback(line)
+                if control is not None and control.cancelled:
+                    raise Cancelled("Batch stopped")
+        except BrokenProcessPool:
+            # A pool process died (e.g. out of memory); start a new pool for the next call
+            self._reset_pool()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+            # Pages already being encoded finish, so none writes its .webp after a rollback
+            wait(pending)
+        return "\n".join(lines)
+
+
+# Encoders by the first word of a preset; any other preset is run as a command line
+ENCODERS = {PILLOW: PillowEncoder()}
+_COMMAND = CommandEncoder()
+
+
+def encoder_for(cmd: list) -> Encoder:
+    return ENCODERS.get(cmd[0] if cmd else None, _COMMAND)
+
+
+def encode(cmd: list, paths: list, control=None, line_callback=None) -> str:
+    """Run a preset on pages (files, or folders of pages) with the encoder it names."""
+    return encoder_for(cmd).run(cmd, paths, control, line_callback)
+
+
+async def encode_async(cmd: list, paths: list, control=None, line_callback=None) -> str:
+    """encode() for the event loop."""
+    return await encoder_for(cmd).run_async(cmd, paths, control, line_callback)
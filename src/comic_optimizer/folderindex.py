@@ -0,0 +1,159 @@
+import os
+import threading
+from typing import Optional
+
+from . import config
+from .imageinfo import Page, sniff_format
+
+
+class FolderIndex:
+    """
+    The files of one folder tree and their sizes, read with a single os.scandir pass.
+    Stages that rename, delete or add files update the index as they go, so later
+    stages read it instead of listing and stat-ing the folder again. Paths are
+    relative to the folder.
+    Files are classified as pages (imageinfo.Page) by extension as they are indexed,
+    and by content once sniff() has read their first bytes; the records are kept
+    through renames, so a file is only classified once.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._sizes = {}
+        self._pages = {}
+        self._sniffed = set()
+        self._lock = threading.Lock()
+        self.rescan()
+
+    def rescan(self) -> None:
+        """Rebuild the index from disk, e.g. after an external tool wrote into the folder."""
+        sizes = {}
+        stack = [""]
+        while stack:
+            relative = stack.pop()
+            with os.scandir(os.path.join(self.root, relative)) as it:
+                for entry in it:
+                    path = os.path.join(relative, entry.name) if relative else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(path)
+                    else:
+                        sizes[path] = entry.stat().st_size
+        with self._lock:
+            self._sizes = sizes
+            self._sniffed.intersection_update(sizes)
+            pages = {}
+            for path in sizes:
+                page = self._pages.get(path)
+                if page is None:
+                    page = Page(path)
+                    if page.format is None:
+                        continue
+                pages[path] = page
+            self._pages = pages
+
+    def sniff(self) -> None:
+        """Read the first bytes of every file not read yet, to find pages mislabeled or without an image extension."""
+        with self._lock:
+            paths = [path for path in self._sizes if path not in self._sniffed]
+        for path in paths:
+            try:
+                with open(os.path.join(self.root, path), "rb") as f:
+                    content = sniff_format(f.read(config.SNIFF_BYTES))
+            except OSError:
+                continue
+            with self._lock:
+                if path not in self._sizes:
+                    continue
+                self._sniffed.add(path)
+                page = self._pages.get(path)
+                if page is not None:
+                    page.content = content
+                elif content is not None:
+                    self._pages[path] = Page(path, content)
+
+    def page(self, path: str) -> Optional[Page]:
+        """The page record of a file, or None if it isn't a page."""
+        with self._lock:
+            return self._pages.get(path)
+
+    def pages(self, recursive: bool = False) -> list:
+        """Page records of the files directly in the folder, or with recursive, of every file in the tree."""
+        with self._lock:
+            return [page for path, page in self._pages.items() if recursive or os.sep not in path]
+
+    def files(self) -> list:
+        """Every file in the tree."""
+        with self._lock:
+            return list(self._sizes)
+
+    def names(self) -> list:
+        """Files directly in the folder, not in subfolders."""
+        with self._lock:
+            return [path for path in self._sizes if os.sep not in path]
+
+    def size(self, path: str) -> int:
+        with self._lock:
+            return self._sizes[path]
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def totals(self) -> tuple:
+        """Return (file_count, total_bytes) for the tree."""
+        with self._lock:
+            return len(self._sizes), sum(self._sizes.values())
+
+    def __contains__(self, path: str) -> bool:
+        with self._lock:
+            return path in self._sizes
+
+    def add(self, path: str, size=None) -> None:
+        """Record a file written into the folder; its size is read from disk if not given."""
+        if size is None:
+            size = os.path.getsize(os.path.join(self.root, path))
+        page = Page(path)
+        with self._lock:
+            self._sizes[path] = size
+            self._sniffed.discard(path)
+            if page.format is not None:
+                self._pages[path] = page
+            else:
+                self._pages.pop(path, None)
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._sizes.pop(path, None)
+            self._pages.pop(path, None)
+            self._sniffed.discard(path)
+
+    def rename(self, old: str, new: str) -> None:
+        with self._lock:
+            self._sizes[new] = self._sizes.pop(old)
+            page = self._pages.pop(old, None)
+            if page is not None:
+                self._pages[new] = Page(new, page.content)
+            if old in self._sniffed:
+                self._sniffed.discard(old)
+                self._sniffed.add(new)
+
+    def refresh(self, pages: list) -> None:
+        """Re-read the sizes of pages an encoder has finished, and index the .webp it may have written next to each."""
+        for page in pages:
+            for path in dict.fromkeys((page, os.path.splitext(page)[0] + ".webp")):
+                try:
+                    size = os.path.getsize(os.path.join(self.root, path))
+                except OSError:
+                    self.remove(path)
+                    continue
+                with self._lock:
+                    known = path in self._sizes
+                    if known:
+                        self._sizes[path] = size
+                if not known:
+                    self.add(path, size)
+
+    def optimized(self, page: str) -> str:
+        """Return the file pingo produced for a page: its .webp sibling, or the page itself."""
+        webp = os.path.splitext(page)[0] + ".webp"
+        return webp if webp in self else page
@@ -1,20 +1,18 @@
+import os
 import threading
+from collections import deque
 import tkinter as tk  # Add for Text/Scrollbar widgets
-from tkinter import filedialog
 
-import darkdetect
 import ttkbootstrap as ttk
-from ttkbootstrap.constants import SUCCESS, DANGER, INFO
-from ttkbootstrap.dialogs import Messagebox
+from ttkbootstrap.constants import SUCCESS, DANGER, INFO, WARNING
 
-import config
-import core
-from settings.settings_utils import load_user_settings, save_user_settings
+from . import config
+from .settings.settings_utils import load_user_settings, save_user_settings
 
 
 class GUI:
     def open_settings(self):
-        from settings.dialog import SettingsDialog
+        from .settings.dialog import SettingsDialog
 
         dlg = SettingsDialog(self.root)
         dlg.show()
@@ -23,7 +21,13 @@ class GUI:
         self.root.after(0, self.status.set, message)
 
     def show_error(self, message: str, title: str = "Error") -> None:
-        self.root.after(0, lambda *args: Messagebox.show_error(message, title=title))
+        def _show():
+            # Dialogs are only imported once one is needed
+            from ttkbootstrap.dialogs import Messagebox
+
+            Messagebox.show_error(message, title=title)
+
+        self.root.after(0, _show)
 
     """Modern Tkinter GUI for the Comic Optimizer using ttkbootstrap."""
 
@@ -52,7 +56,7 @@ class GUI:
 
         # Load available presets from user_settings
         self.preset_dict = self.user_settings.get("presets", {})
-        self.presets = list(self.preset_dict.keys())
+        self.presets = list(self.preset_dict.keys()) + [config.AUTO_PRESET]
 
         # Set selected_preset from last_preset if available and valid
         last_preset = self.user_settings.get("last_preset", "")
@@ -61,7 +65,15 @@ class GUI:
 
         # Set skip_pingo from user_settings
         self.skip_pingo = ttk.BooleanVar(value=self.user_settings.get("skip_pingo", False))
+        self.max_workers = ttk.IntVar(value=self.user_settings.get("max_workers", 0))
+        self.include_archives = ttk.BooleanVar(value=self.user_settings.get("include_archives", False))
         self.status = ttk.StringVar(value="Idle.")
+        self.pause_label = ttk.StringVar(value="Pause")
+        self.batch = None  # BatchBridge of the running batch
+        # Reports from worker threads, flushed to the panel together
+        self._report_pending = deque(maxlen=config.REPORT_PANEL_MAX_LINES)
+        self._report_scheduled = False
+        self._report_lock = threading.Lock()
 
         # Set output_extension from last_output_ext if available and valid
         last_output_ext = self.user_settings.get("last_output_ext", ".cbz")
@@ -155,21 +167,61 @@ class GUI:
         )
         skip_chk.pack(side="left")
 
-        # Start button
+        # Concurrency
+        workers_frame = ttk.Frame(mainframe)
+        workers_frame.grid(row=6, column=0, sticky="w", pady=(0, 10))
+        workers_label = ttk.Label(workers_frame, text="Parallel folders (0 = auto):")
+        workers_label.pack(side="left")
+        workers_spin = ttk.Spinbox(
+            workers_frame,
+            from_=0,
+            to=64,
+            textvariable=self.max_workers,
+            width=5,
+            increment=1,
+            state="readonly",
+            command=self._on_max_workers_change,
+        )
+        workers_spin.pack(side="left", padx=(5, 0))
+        archives_chk = ttk.Checkbutton(
+            workers_frame, text="Optimize existing CBZ/ZIP", variable=self.include_archives,
+            command=self._on_include_archives_change
+        )
+        archives_chk.pack(side="left", padx=(20, 0))
+
+        # Start / Pause / Stop buttons
+        buttons_frame = ttk.Frame(mainframe)
+        buttons_frame.grid(row=7, column=0, pady=(0, 15))
         start_btn = ttk.Button(
-            mainframe,
+            buttons_frame,
             text="Start",
             command=self.start_processing,
             width=15,
             style=SUCCESS,
         )
-        start_btn.grid(row=6, column=0, pady=(0, 15))
+        start_btn.pack(side="left")
+        pause_btn = ttk.Button(
+            buttons_frame,
+            textvariable=self.pause_label,
+            command=self.toggle_pause,
+            width=10,
+            style=WARNING,
+        )
+        pause_btn.pack(side="left", padx=(10, 0))
+        stop_btn = ttk.Button(
+            buttons_frame,
+            text="Stop",
+            command=self.stop_processing,
+            width=10,
+            style=DANGER,
+        )
+        stop_btn.pack(side="left", padx=(10, 0))
 
         # Status label
         status_label = ttk.Label(
             mainframe, textvariable=self.status, font=("Segoe UI", 10), style=INFO
         )
-        status_label.grid(row=7, column=0, sticky="w", pady=(10, 0))
+        status_label.grid(row=8, column=0, sticky="w", pady=(10, 0))
 
         # Update preset content when selection changes
         preset_combo.bind("<<ComboboxSelected>>", self._on_preset_change)
@@ -188,6 +240,9 @@ class GUI:
         self.report_text["yscrollcommand"] = report_scroll.set
 
     def _get_preset_content(self, preset_name: str) -> str:
+        if preset_name == config.AUTO_PRESET:
+            candidates = self.user_settings.get("adaptive_presets") or list(self.preset_dict)
+            return "Samples pages of each series with: " + ", ".join(candidates)
         cmd = self.preset_dict.get(preset_name, [])
         return (
             "Command: " + " ".join(cmd) if cmd else "No command found for this preset."
@@ -204,12 +259,24 @@ class GUI:
         self.user_settings["skip_pingo"] = self.skip_pingo.get()
         save_user_settings(self.user_settings)
 
+    def _on_max_workers_change(self):
+        """Save concurrency setting."""
+        self.user_settings["max_workers"] = self.max_workers.get()
+        save_user_settings(self.user_settings)
+
+    def _on_include_archives_change(self):
+        """Save archive input mode."""
+        self.user_settings["include_archives"] = self.include_archives.get()
+        save_user_settings(self.user_settings)
+
     def _on_output_ext_change(self, event=None):
         """Save last selected output extension."""
         self.user_settings["last_output_ext"] = self.output_extension.get()
         save_user_settings(self.user_settings)
 
     def browse_dir(self) -> None:
+        from tkinter import filedialog
+
         path = filedialog.askdirectory()
         if path:
             self.dir_path.set(path)
@@ -223,89 +290,115 @@ class GUI:
         self.report_text.config(state="disabled")
 
     def append_report(self, text):
-        def _append():
-            self.report_text.config(state="normal")
-            self.report_text.insert(tk.END, text + "\n\n")
-            self.report_text.see(tk.END)
-            self.report_text.config(state="disabled")
-
-        self.root.after(0, _append)
+        """Queue text for the report panel; safe to call from any thread."""
+        with self._report_lock:
+            self._report_pending.append(text)
+            if self._report_scheduled:
+                return
+            self._report_scheduled = True
+        self.root.after(100, self._flush_report)
+
+    def _flush_report(self):
+        """Add the queued reports in one insert and drop the oldest lines past REPORT_PANEL_MAX_LINES."""
+        with self._report_lock:
+            texts = list(self._report_pending)
+            self._report_pending.clear()
+            self._report_scheduled = False
+        self.report_text.config(state="normal")
+        self.report_text.insert(tk.END, "".join(text + "\n\n" for text in texts))
+        overflow = int(self.report_text.index("end-1c").split(".")[0]) - config.REPORT_PANEL_MAX_LINES
+        if overflow > 0:
+            self.report_text.delete("1.0", f"{overflow + 1}.0")
+        self.report_text.see(tk.END)
+        self.report_text.config(state="disabled")
 
     def start_processing(self) -> None:
-        """Start the processing in a background thread."""
+        """Start the batch through its bridge, which reports back through _on_batch_event."""
         if not self.dir_path.get():
-            Messagebox.show_error("Please select a directory.", title="Error")
+            self.show_error("Please select a directory.")
+            return
+        if self.batch is not None:
+            self.show_error("A batch is already running.")
             return
+        from .bridge import BatchBridge
+
+        settings = {
+            **self.user_settings,
+            "last_preset": self.selected_preset.get(),
+            "last_output_ext": self.output_extension.get(),
+            "skip_pingo": self.skip_pingo.get(),
+            "max_workers": self.max_workers.get(),
+            "include_archives": self.include_archives.get(),
+            "presets": self.preset_dict,
+        }
+        self.batch = BatchBridge(self.dir_path.get(), settings)
+        self.pause_label.set("Pause")
         self.clear_report()  # Clear report at start
-        threading.Thread(target=self.run_processing_thread, daemon=True).start()
-
-    def _process_and_report_folder(self, folder_path, zip_file_path, status_callback, report_callback, pingo_outputs):
-        status_callback(f"Processing\n{core.os.path.basename(folder_path)}")
-        pingo_output = core.process_single_folder(
-            folder_path,
-            zip_file_path,
-            self.selected_preset.get(),
-            self.skip_pingo.get(),
-            self.preset_dict
-        )
-        if pingo_output:
-            report_callback(core.os.path.basename(folder_path), pingo_output)
-            pingo_outputs.append(f"{core.os.path.basename(folder_path)}:\n{pingo_output}")
-
-    def run_processing_thread(self) -> None:
-        """Thread target: call core.process_root_directory and update GUI."""
-        root_dir = self.dir_path.get()
-        output_ext = self.output_extension.get()
-        try:
-            # Custom callback to update report live
-            def status_callback(msg):
-                self.set_status(msg)
-
-            def report_callback(folder, pingo_output):
-                if pingo_output:
-                    self.append_report(f"{folder}:\n{pingo_output}")
-
-            # Wrap process_root_directory to call report_callback after each folder
-            pingo_outputs = []
-            for item in core.os.listdir(root_dir):
-                item_path = core.os.path.join(root_dir, item)
-                if core.os.path.isdir(item_path):
-                    subfolders = [
-                        core.os.path.join(item_path, subfolder)
-                        for subfolder in core.os.listdir(item_path)
-                        if core.os.path.isdir(core.os.path.join(item_path, subfolder))
-                    ]
-                    if subfolders:
-                        for subfolder in subfolders:
-                            zip_file_path = core.os.path.join(
-                                item_path, f"{core.os.path.basename(subfolder)}{output_ext}"
-                            )
-                            self._process_and_report_folder(subfolder, zip_file_path, status_callback, report_callback,
-                                                            pingo_outputs)
-                    else:
-                        zip_file_path = core.os.path.join(root_dir, f"{item}{output_ext}")
-                        self._process_and_report_folder(item_path, zip_file_path, status_callback, report_callback,
-                                                        pingo_outputs)
-            self.set_status("Done!")
-        except Exception as e:
-            self.set_status(f"Error: {e}")
-            self.show_error(str(e), title="Error")
+        self.batch.start(self._on_batch_event, on_done=lambda: self.root.after(0, self._on_processing_done))
+
+    def toggle_pause(self) -> None:
+        """Pause the running batch (pingo calls already started finish) or resume it."""
+        if self.batch is None:
+            return
+        if self.batch.paused:
+            self.batch.resume()
+            self.pause_label.set("Pause")
+            self.set_status("Resuming")
+        else:
+            self.batch.pause()
+            self.pause_label.set("Resume")
+            self.set_status("Paused after the pingo calls already running")
+
+    def stop_processing(self) -> None:
+        """Stop the running batch; the next Start on the same folder resumes it."""
+        if self.batch is None:
+            return
+        self.batch.cancel()
+        self.pause_label.set("Pause")
+        self.set_status("Stopping")
+
+    def _on_processing_done(self) -> None:
+        self.batch = None
+        self.pause_label.set("Pause")
+
+    def _on_batch_event(self, event: dict) -> None:
+        """Called from the bridge's thread with each event of the batch."""
+        kind = event["event"]
+        if kind == "status":
+            self.set_status(event["message"])
+        elif kind == "report" and event["output"]:
+            self.append_report(f"{event['folder']}:\n{event['output']}")
+        elif kind == "stage":
+            self.append_report(
+                f"{os.path.basename(event['folder'])} {event['stage']}: {event['seconds']:.2f}s, "
+                f"{event['files_in']} -> {event['files_out']} files, "
+                f"{event['bytes_in'] / (1024 * 1024):.1f} -> {event['bytes_out'] / (1024 * 1024):.1f} MB"
+            )
+        elif kind == "error":
+            self.set_status(f"Error: {event['message']}")
+            self.show_error(event["message"], title="Error")
+        elif kind == "summary":
+            self.set_status("Stopped. Start again on this folder to resume." if event["stopped"] else "Done!")
 
     def show_about(self):
-        from about import AboutDialog
+        from .about import AboutDialog
 
         dlg = AboutDialog(self.root)
         dlg.show()
 
 
 def main() -> None:
-    from settings.settings_utils import load_user_settings
     user_settings = load_user_settings()
     theme = user_settings.get("theme")
     if not theme:
+        import darkdetect
+
         theme = "darkly" if darkdetect.isDark() else "flatly"
     root = ttk.Window(themename=theme)
     app = GUI(root)
+    if os.environ.get("COMIC_OPTIMIZER_EXIT_AFTER_STARTUP"):
+        # Used by benchmarks/bench_startup.py to time a cold start up to the first idle window
+        root.after_idle(root.destroy)
     root.mainloop()
 
 
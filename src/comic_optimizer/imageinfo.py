@@ -0,0 +1,123 @@
+import os
+import struct
+from typing import Optional
+
+from . import config
+
+# Extension given to a page whose content is in a format its name doesn't say
+FORMAT_EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "gif": ".gif", "webp": ".webp", "avif": ".avif"}
+
+# JPEG start-of-frame markers that carry the image size (not DHT/JPG/DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_image_size(path: str, max_bytes: int = 65536) -> Optional[tuple]:
+    """Return (width, height) read from the image header, or None if it can't be parsed."""
+    try:
+        with open(path, "rb") as f:
+            return parse_image_size(f.read(max_bytes))
+    except OSError:
+        return None
+
+
+def image_format(name: str) -> Optional[str]:
+    """Return the image format a file name's extension stands for, in any case, or None if it isn't a page."""
+    # Called for every file of every folder: cheaper than os.path.splitext, same answer for page names
+    dot = name.rfind(".")
+    return config.IMAGE_FORMATS.get(name[dot:].lower()) if dot > 0 else None
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Return the image format of a file from its first bytes, or None if it isn't an image."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    # The major brand may be a generic one (mif1) with avif among the compatible brands
+    if head[4:8] == b"ftyp" and (b"avif" in head[8:] or b"avis" in head[8:]):
+        return "avif"
+    return None
+
+
+class Page:
+    """
+    A file classified as a page. format comes from the name's extension (None if it
+    has no image extension); content from the file's first bytes once they have been
+    read (None until then, or if they aren't a known image format).
+    """
+
+    __slots__ = ("name", "format", "content")
+
+    def __init__(self, name: str, content: Optional[str] = None):
+        self.name = name
+        self.format = image_format(name)
+        self.content = content
+
+    @property
+    def extension(self) -> str:
+        """The extension the page should have: its own, unless its content is another image format."""
+        if self.content is not None and self.content != self.format:
+            return FORMAT_EXTENSIONS[self.content]
+        return os.path.splitext(self.name)[1]
+
+
+def parse_image_size(head: bytes) -> Optional[tuple]:
+    """Return (width, height) from the first bytes of a PNG, JPEG, GIF, WebP or AVIF file."""
+    try:
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+        if head.startswith(b"\xff\xd8"):
+            return _jpeg_size(head)
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return _webp_size(head)
+        if head[4:8] == b"ftyp":
+            return _avif_size(head)
+    except struct.error:
+        return None
+    return None
+
+
+def _jpeg_size(head: bytes) -> Optional[tuple]:
+    pos = 2
+    while pos + 9 <= len(head):
+        if head[pos] != 0xFF:
+            return None
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = struct.unpack(">H", head[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", head[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def _webp_size(head: bytes) -> Optional[tuple]:
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def _avif_size(head: bytes) -> Optional[tuple]:
+    # The image spatial extents property box holds the size; it sits in the meta box near the start
+    pos = head.find(b"ispe")
+    if pos < 0 or pos + 16 > len(head):
+        return None
+    return struct.unpack(">II", head[pos + 8:pos + 16])
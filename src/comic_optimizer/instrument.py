@@ -0,0 +1,149 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+
+def folder_totals(path: str) -> tuple:
+    """Return (file_count, total_bytes) for a directory tree or a single file."""
+    if os.path.isfile(path):
+        return 1, os.path.getsize(path)
+    files = size = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        files += 1
+                        size += entry.stat().st_size
+        except OSError:
+            continue
+    return files, size
+
+
+def _stage_totals(job, path: str) -> tuple:
+    # The stages keep the job's index current, so its own folder needn't be walked again
+    index = getattr(job, "index", None)
+    if index is not None and os.path.normpath(index.root) == os.path.normpath(path):
+        return index.totals()
+    return folder_totals(path) if os.path.exists(path) else (0, 0)
+
+
+class Instrumentation:
+    """
+    Opt-in timing of every stage of every folder.
+    Each stage produces one event dict (folder, stage, seconds, files and bytes before
+    and after) passed to event_callback as it happens, so the GUI and the CLI can
+    consume the same stream. With profile_path, the run is profiled with cProfile and
+    the profile of all worker threads is written there at the end.
+    """
+
+    def __init__(self, event_callback=None, profile_path: Optional[str] = None):
+        self.event_callback = event_callback
+        self.profile_path = profile_path
+        self.totals = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = []
+        # Since 3.12 cProfile hooks sys.monitoring, which sees every thread but allows
+        # only one active profiler; before that a profiler only sees its own thread.
+        self._shared_profile = None
+        if profile_path and sys.version_info >= (3, 12):
+            import cProfile
+
+            self._shared_profile = cProfile.Profile()
+            self._profiles.append(self._shared_profile)
+
+    @contextlib.contextmanager
+    def stage(self, job, name: str, path: Optional[str] = None):
+        """
+        Time one stage of a job. path is what the stage works on (the job's folder, or
+        its copy in scratch space, by default); its file count and size are measured before and after,
+        from the job's FolderIndex when it covers path. The yielded dict can be updated
+        with extra fields before the event is sent.
+        """
+        path = path or job.work_path
+        files_in, bytes_in = _stage_totals(job, path)
+        event = {"folder": job.folder_path, "stage": name}
+        started = time.perf_counter()
+        yield event
+        seconds = time.perf_counter() - started
+        event.setdefault("files_in", files_in)
+        event.setdefault("bytes_in", bytes_in)
+        if "files_out" not in event or "bytes_out" not in event:
+            files_out, bytes_out = _stage_totals(job, path)
+            event.setdefault("files_out", files_out)
+            event.setdefault("bytes_out", bytes_out)
+        event["seconds"] = round(seconds, 6)
+        with self._lock:
+            total = self.totals.setdefault(name, {"seconds": 0.0, "calls": 0, "files": 0, "bytes": 0})
+            total["seconds"] += seconds
+            total["calls"] += 1
+            total["files"] += event["files_in"]
+            total["bytes"] += event["bytes_in"]
+        if self.event_callback:
+            self.event_callback(event)
+
+    def profiled(self, func):
+        """Wrap a stage function so it runs under a per-thread profiler when threads need their own."""
+        if not self.profile_path or self._shared_profile is not None:
+            return func
+
+        def run(*args, **kwargs):
+            profile = getattr(self._local, "profile", None)
+            if profile is None:
+                import cProfile
+
+                profile = self._local.profile = cProfile.Profile()
+                with self._lock:
+                    self._profiles.append(profile)
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+
+        return run
+
+    def start(self) -> None:
+        """Start the profiler shared by all threads, if this Python has one."""
+        if self._shared_profile is not None:
+            self._shared_profile.enable()
+
+    def dump_profile(self) -> None:
+        """Stop profiling, merge the profiles and write them to profile_path."""
+        if self._shared_profile is not None:
+            self._shared_profile.disable()
+        if not self.profile_path or not self._profiles:
+            return
+        import pstats
+
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.profile_path)
+
+    def summary(self) -> str:
+        """Return one line per stage with its total time, files and bytes."""
+        with self._lock:
+            totals = sorted(self.totals.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        lines = ["Stage timings:"]
+        for name, total in totals:
+            lines.append(
+                f"{name}: {total['seconds']:.2f}s over {total['calls']} folders, "
+                f"{total['files']} files, {total['bytes'] / (1024 * 1024):.1f} MB"
+            )
+        return "\n".join(lines)
+
+
+def measure(job, name: str, path: Optional[str] = None):
+    """Return the job's stage timer, or a no-op context if instrumentation is off."""
+    instruments = getattr(job, "instruments", None)
+    if instruments is None:
+        return contextlib.nullcontext({})
+    return instruments.stage(job, name, path)
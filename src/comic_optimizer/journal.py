@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    Write-ahead log of a batch run, stored in the root directory.
+    The first line is the batch plan (every folder and its archive path, and the
+    settings the paths were made with); each following line records a folder
+    reaching a stage. If a run stops early, the next run reads the journal back and
+    resumes each folder after its last recorded stage instead of rediscovering the library.
+    """
+
+    def __init__(self, root_dir: str):
+        self.path = os.path.join(root_dir, config.JOURNAL_FILE_NAME)
+        self.settings = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self) -> Optional[list]:
+        """
+        Return the interrupted batch as a list of [folder_path, zip_file_path, stage]
+        entries (stage is None if the folder was never started), or None if there is
+        nothing to resume. The plan's settings are left in self.settings.
+        """
+        if not os.path.exists(self.path):
+            return None
+        plan = None
+        stages = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    logger.warning(f"Ignoring damaged journal line in {self.path}")
+                    continue
+                if "plan" in record:
+                    plan = record["plan"]
+                    self.settings = record.get("settings", {})
+                else:
+                    stages[record["folder"]] = record["stage"]
+        if plan is None:
+            return None
+        return [[folder, zip_path, stages.get(folder)] for folder, zip_path in plan]
+
+    def start(self, plan: list, settings: Optional[dict] = None) -> None:
+        """
+        Start a new journal with the batch plan, a list of (folder_path, zip_file_path),
+        and the settings that shaped it (root_dir, output_ext).
+        """
+        self.settings = settings or {}
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write({"plan": [list(entry) for entry in plan], "settings": self.settings})
+
+    def rewrite(self, entries: list, settings: Optional[dict] = None) -> None:
+        """Start the journal over from [folder_path, zip_file_path, stage] entries, keeping their stages."""
+        self.start([(folder_path, zip_file_path) for folder_path, zip_file_path, _ in entries], settings)
+        for folder_path, _, stage in entries:
+            if stage is not None:
+                self.record(folder_path, stage)
+
+    def reopen(self) -> None:
+        """Continue appending to an existing journal."""
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def record(self, folder_path: str, stage: str) -> None:
+        """Durably record that a folder has finished a stage."""
+        self._write({"folder": folder_path, "stage": stage})
+
+    def _write(self, record: dict) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, finished: bool) -> None:
+        """Close the journal, deleting it if the whole batch finished."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if finished:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.warning(f"Failed to remove journal {self.path}: {e}")
@@ -0,0 +1,95 @@
+import re
+import threading
+import time
+
+from . import config
+
+# "<file> : <size> -> <size>" result lines; sizes may carry a unit (KB, MB, ...)
+_RESULT = re.compile(
+    r"^\s*(?P<file>\S.*?)\s*:?\s+(?P<before>\d[\d.,]*)\s*(?P<before_unit>[KMG]?i?B)?"
+    r"\s*->\s*(?P<after>\d[\d.,]*)\s*(?P<after_unit>[KMG]?i?B)?"
+)
+_UNITS = {"": 1, "B": 1, "KB": 1024, "KIB": 1024, "MB": 1024 ** 2, "MIB": 1024 ** 2, "GB": 1024 ** 3, "GIB": 1024 ** 3}
+
+
+def _to_bytes(number: str, unit: str) -> int:
+    return int(float(number.replace(",", "")) * _UNITS.get((unit or "").upper(), 1))
+
+
+def parse_result(line: str):
+    """Return (file, bytes_before, bytes_after) if line is a per-file pingo result, else None."""
+    match = _RESULT.match(line)
+    if not match:
+        return None
+    try:
+        before = _to_bytes(match["before"], match["before_unit"])
+        after = _to_bytes(match["after"], match["after_unit"])
+    except ValueError:
+        return None
+    return match["file"], before, after
+
+
+class PingoOutput:
+    """
+    Pingo's output for one folder, fed line by line as it streams in.
+    Per-file results are totalled as they are parsed and only the first max_lines
+    lines are kept for the report, followed by the totals, so memory stays flat
+    however many pages the folder has. line_callback(line) also gets every line, e.g. to spill it to disk.
+    """
+
+    def __init__(self, max_lines: int = config.PINGO_OUTPUT_MAX_LINES, line_callback=None):
+        self.max_lines = max_lines
+        self.line_callback = line_callback
+        self.lines = []
+        self.dropped = 0
+        self.files = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self._lock = threading.Lock()
+
+    def feed(self, line: str) -> None:
+        if not line.strip():
+            return
+        result = parse_result(line)
+        with self._lock:
+            if result is not None:
+                self.files += 1
+                self.bytes_before += result[1]
+                self.bytes_after += result[2]
+            if len(self.lines) < self.max_lines:
+                self.lines.append(line)
+            else:
+                self.dropped += 1
+        if self.line_callback:
+            self.line_callback(line)
+
+    def text(self) -> str:
+        with self._lock:
+            lines = list(self.lines)
+            if self.dropped:
+                lines.append(f"... {self.dropped} more lines")
+            if self.files:
+                lines.append(
+                    f"pingo: {self.files} files, {self.bytes_before / (1024 * 1024):.1f} MB -> "
+                    f"{self.bytes_after / (1024 * 1024):.1f} MB"
+                )
+        return "\n".join(lines)
+
+
+class ReportLog:
+    """Append-only log file holding every pingo line, for when the bounded report isn't enough."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, folder: str, text: str) -> None:
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            for line in text.splitlines():
+                self._file.write(f"{stamp} {folder}: {line}\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
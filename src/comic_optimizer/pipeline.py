@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_STOP = object()
+
+
+class Stage:
+    """One step of the pipeline, run on a fixed number of jobs at once."""
+
+    def __init__(self, name: str, func, workers: int = 1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.processed = 0
+        self.busy_time = 0.0
+
+    def throughput(self, elapsed: float) -> float:
+        """Folders per minute since the pipeline started."""
+        return self.processed * 60 / elapsed if elapsed > 0 else 0.0
+
+
+class Pipeline:
+    """
+    Run jobs through a list of stages connected by bounded queues.
+    Each stage has its own workers, so a CPU-bound stage can work on the next job
+    while I/O-bound stages finish the previous one. The workers are tasks on the
+    event loop run() is awaited on; a stage's function is blocking file work, so
+    each call runs in a thread pool with one thread per worker. A full queue holds
+    the stage before it back. The first exception stops the pipeline and is
+    re-raised from run().
+    """
+
+    def __init__(self, stages: list, queue_size: int = 2, stats_callback=None):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in stages]
+        self.stats_callback = stats_callback
+        self._lock = threading.Lock()
+        self._remaining = [stage.workers for stage in stages]
+        self._stop = threading.Event()
+        self._error = None
+        self._started = 0.0
+
+    @property
+    def stopping(self) -> bool:
+        """True once a stage has failed and the remaining jobs are being dropped."""
+        return self._stop.is_set()
+
+    def format_stats(self) -> str:
+        """Return one line per stage with its queue depth and throughput."""
+        elapsed = time.monotonic() - self._started
+        return "\n".join(
+            f"{stage.name}: {self.queues[i].qsize()} queued, {stage.processed} done "
+            f"({stage.throughput(elapsed):.1f}/min)"
+            for i, stage in enumerate(self.stages)
+        )
+
+    async def run(self, jobs: list, on_complete=None) -> None:
+        """Feed jobs into the first stage and wait until every stage has drained."""
+        self._started = time.monotonic()
+        executor = ThreadPoolExecutor(
+            max_workers=sum(stage.workers for stage in self.stages), thread_name_prefix="pipeline"
+        )
+        try:
+            workers = [
+                asyncio.create_task(self._worker(index, executor, on_complete))
+                for index, stage in enumerate(self.stages)
+                for _ in range(stage.workers)
+            ]
+            for job in jobs:
+                if self._stop.is_set():
+                    break
+                await self.queues[0].put(job)
+            for _ in range(self.stages[0].workers):
+                await self.queues[0].put(_STOP)
+            await asyncio.gather(*workers)
+        finally:
+            # Every call has returned unless run() itself was cancelled; threads still in one finish on their own
+            executor.shutdown(wait=False)
+        if self._error is not None:
+            raise self._error
+
+    def _call(self, stage: Stage, job, on_complete) -> None:
+        started = time.monotonic()
+        stage.func(job)
+        with self._lock:
+            stage.processed += 1
+            stage.busy_time += time.monotonic() - started
+        if on_complete:
+            on_complete(job)
+        if self.stats_callback:
+            self.stats_callback(stage, job)
+
+    async def _worker(self, index: int, executor: ThreadPoolExecutor, on_complete) -> None:
+        loop = asyncio.get_running_loop()
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        is_last = index == len(self.stages) - 1
+        while True:
+            job = await inbox.get()
+            if job is _STOP:
+                break
+            if self._stop.is_set():
+                continue
+            try:
+                # Callbacks run with the stage, in its thread, so none of them runs on the loop
+                await loop.run_in_executor(executor, self._call, stage, job, on_complete if is_last else None)
+                if not is_last:
+                    await self.queues[index + 1].put(job)
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+                self._stop.set()
+        self._remaining[index] -= 1
+        if self._remaining[index] == 0 and not is_last:
+            for _ in range(self.stages[index + 1].workers):
+                await self.queues[index + 1].put(_STOP)
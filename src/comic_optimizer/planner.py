@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .imageinfo import image_format, parse_image_size, read_image_size
+
+logger = logging.getLogger(__name__)
+
+
+def size_job(job) -> None:
+    """
+    Set job.size_pages, job.size_bytes and job.size_pixels (None if no header could be read),
+    or job.size_error if the job's archive can't be read.
+    """
+    sizes = []
+    if os.path.isfile(job.folder_path):
+        try:
+            with zipfile.ZipFile(job.folder_path) as zipf:
+                for info in zipf.infolist():
+                    if info.is_dir() or not image_format(info.filename):
+                        continue
+                    with zipf.open(info) as f:
+                        sizes.append((info.file_size, parse_image_size(f.read(config.HEADER_READ_BYTES))))
+        except (zipfile.BadZipFile, OSError) as e:
+            job.size_error = str(e)
+            return
+    elif os.path.isdir(job.folder_path):
+        # The scan is kept on the job for the stages that follow
+        index = job.folder_index()
+        for page in index.pages(recursive=True):
+            dimensions = read_image_size(os.path.join(job.folder_path, page.name), config.HEADER_READ_BYTES)
+            sizes.append((index.size(page.name), dimensions))
+    job.size_pages = len(sizes)
+    job.size_bytes = sum(size for size, _ in sizes)
+    known = [dimensions for _, dimensions in sizes if dimensions]
+    job.size_pixels = sum(width * height for width, height in known) if known else None
+    if known and len(known) < len(sizes):
+        # Scale up for pages whose header couldn't be read
+        job.size_pixels = job.size_pixels * len(sizes) // len(known)
+
+
+def plan_batch(jobs: list) -> list:
+    """
+    Size every job and return them longest-first.
+    Pingo time grows with pixel count, so jobs are ordered by pixels, estimated from
+    bytes (at the batch's average pixels per byte) when no header was readable.
+    Starting the biggest folders first keeps one large folder from running alone at
+    the end of the batch. Folders already past pingo on resume only need packaging
+    and go last. Archives that can't be read are left out of the batch, with a warning.
+    """
+    with ThreadPoolExecutor(max_workers=config.SIZING_WORKERS) as executor:
+        list(executor.map(size_job, jobs))
+    for job in jobs:
+        if job.size_error is not None:
+            logger.warning(f"Skipping {job.folder_path}: {job.size_error}")
+    jobs = [job for job in jobs if job.size_error is None]
+    sized = [job for job in jobs if job.size_pixels and job.size_bytes]
+    pixels_per_byte = (
+        sum(job.size_pixels for job in sized) / sum(job.size_bytes for job in sized) if sized else 1.0
+    )
+
+    def cost(job):
+        if job.reached("optimized"):
+            return 0
+        if job.size_pixels is not None:
+            return job.size_pixels
+        return job.size_bytes * pixels_per_byte
+
+    return sorted(jobs, key=cost, reverse=True)
+
+
+class BatchProgress:
+    """Estimate the time left from the bytes processed so far."""
+
+    def __init__(self, jobs: list):
+        self.total_bytes = sum(job.size_bytes for job in jobs)
+        self.done_bytes = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, job) -> None:
+        with self._lock:
+            self.done_bytes += job.size_bytes
+
+    def format_eta(self) -> str:
+        mb_done = self.done_bytes / (1024 * 1024)
+        mb_total = self.total_bytes / (1024 * 1024)
+        elapsed = time.monotonic() - self.started
+        if not self.done_bytes or elapsed <= 0:
+            return f"ETA: estimating ({mb_done:.0f} of {mb_total:.0f} MB)"
+        remaining = (self.total_bytes - self.done_bytes) / (self.done_bytes / elapsed)
+        minutes, seconds = divmod(int(remaining), 60)
+        hours, minutes = divmod(minutes, 60)
+        eta = f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+        return f"ETA: {eta} ({mb_done:.0f} of {mb_total:.0f} MB)"
@@ -1,6 +1,6 @@
 import tkinter.font as tkfont
 
-import config
+from .. import config
 import ttkbootstrap as ttk
 
 from .settings_utils import load_user_settings, save_user_settings
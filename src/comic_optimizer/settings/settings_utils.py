@@ -0,0 +1,164 @@
+import atexit
+import copy
+import logging
+import os
+import sys
+import threading
+
+import toml
+
+logger = logging.getLogger(__name__)
+
+
+def get_user_config_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA", os.path.expanduser("~"))
+        return os.path.join(base, "comic-optimizer")
+    elif sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~/Library/Application Support"), "comic-optimizer")
+    else:
+        # Linux and others
+        return os.path.join(os.path.expanduser("~/.config"), "comic-optimizer")
+
+
+USER_CONFIG_DIR = get_user_config_dir()
+SETTINGS_FILE = os.path.join(USER_CONFIG_DIR, 'user_settings.toml')
+PAGE_CACHE_DIR = os.path.join(USER_CONFIG_DIR, 'page_cache')
+PRESET_DECISIONS_FILE = os.path.join(USER_CONFIG_DIR, 'preset_decisions.json')
+
+DEFAULT_SETTINGS = {
+    'theme': None,  # None means auto-detect
+    'font_family': 'Segoe UI',
+    'font_size': 10,
+    'last_root_dir': '',
+    'last_preset': '',
+    'skip_pingo': False,
+    'last_output_ext': '.cbz',
+    'max_workers': 0,  # Folders processed at once, 0 means auto
+    'include_archives': False,
+    'cache_enabled': True,
+    'cache_max_mb': 2048,
+    'adaptive_presets': [],  # Presets tried by the "auto" preset, empty means all
+    'adaptive_max_seconds_per_mb': 0,  # "auto" time budget: best compression among presets this fast
+    'adaptive_max_size_ratio': 0,  # "auto" size budget: fastest preset reaching this output/input ratio
+    'min_gain_percent': 0,  # Skip pages of a format whose earlier pages in the folder saved less than this
+    'dedup_pages': True,  # Optimize byte-identical pages found in several folders once
+    'duplicate_report': False,  # List every group of identical pages in the batch report
+    'scratch_dir': '',  # Process folders in a copy here (e.g. a RAM disk) and only write archives to the library
+    'scratch_max_mb': 4096,  # Scratch space used at once
+    'removal_policy': 'trash',  # Sources of verified archives: trash, delete, keep, or move to hold_dir
+    'hold_dir': '',  # Where the move policy puts sources
+    'report_log_path': '',  # Append every line of pingo output to this file when set
+    'stage_timings': False,  # Report time, files and bytes for every stage of every folder
+    'profile_path': '',  # Write a cProfile dump of each run here when set
+    'presets': {
+        'lossy': ["pingo", "-s4", "-webp", "-process=4"],
+        'lossless': ["pingo", "-s4", "-lossless", "-webp", "-process=4", "-no-jpeg"],
+        # Encoded in-process with Pillow, no pingo needed (pip install pillow)
+        'pillow-lossy': ["pillow", "-quality=80", "-method=4"],
+        'pillow-lossless': ["pillow", "-lossless", "-method=4"]
+    }
+}
+
+
+# Seconds of quiet after the last change before settings are written to disk
+SAVE_DELAY_SECONDS = 0.5
+
+
+def _read_settings() -> dict:
+    if not os.path.exists(SETTINGS_FILE):
+        return copy.deepcopy(DEFAULT_SETTINGS)
+    try:
+        data = toml.load(SETTINGS_FILE)
+    except Exception as e:
+        logger.warning(f"Failed to load user settings: {e}")
+        return copy.deepcopy(DEFAULT_SETTINGS)
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    # Merge presets dict if present, else use default
+    settings['presets'] = data.get('presets', settings['presets'])
+    # Merge other settings
+    for k, v in DEFAULT_SETTINGS.items():
+        if k != 'presets':
+            settings[k] = data.get(k, v)
+    return settings
+
+
+def _write_settings(settings: dict) -> None:
+    try:
+        os.makedirs(USER_CONFIG_DIR, exist_ok=True)
+        temp_path = SETTINGS_FILE + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            toml.dump(settings, f)
+        os.replace(temp_path, SETTINGS_FILE)
+    except Exception as e:
+        logger.warning(f"Failed to save user settings: {e}")
+
+
+class SettingsStore:
+    """
+    The user settings, read from disk once and shared by every caller.
+    save() only takes a snapshot and restarts a short timer; the snapshot is
+    written by a background thread once changes stop for delay seconds, so a
+    burst of changes (e.g. scrolling through font sizes) is one write off the
+    UI thread. flush() writes a pending snapshot right away and runs at exit.
+    """
+
+    def __init__(self, delay: float = SAVE_DELAY_SECONDS):
+        self.delay = delay
+        self._settings = None
+        self._pending = None
+        self._timer = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def load(self) -> dict:
+        with self._lock:
+            if self._settings is None:
+                self._settings = _read_settings()
+                if not os.path.exists(SETTINGS_FILE):
+                    self._schedule(copy.deepcopy(self._settings))
+            return self._settings
+
+    def save(self, settings: dict) -> None:
+        snapshot = copy.deepcopy(settings)
+        with self._lock:
+            self._settings = settings
+            self._schedule(snapshot)
+
+    def _schedule(self, snapshot: dict) -> None:
+        self._pending = snapshot
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self) -> None:
+        # Writes run one at a time, so an older snapshot never lands after a newer one
+        with self._write_lock:
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if snapshot is not None:
+                _write_settings(snapshot)
+
+
+_store = SettingsStore()
+
+
+def load_user_settings():
+    """Return the shared settings dict; changes to it are kept by save_user_settings."""
+    return _store.load()
+
+
+def save_user_settings(settings):
+    """Schedule settings to be written to disk in the background."""
+    _store.save(settings)
+
+
+def flush_user_settings():
+    """Write settings saved with save_user_settings now instead of after the delay."""
+    _store.flush()
@@ -0,0 +1,96 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from . import config
+from .control import POLL_SECONDS, Cancelled
+
+logger = logging.getLogger(__name__)
+
+
+class ScratchSpace:
+    """
+    A fast scratch directory (a RAM disk, an SSD) where folders are processed instead
+    of in the library. A folder is copied in whole, cleaned, renamed, optimized and
+    read back into the archive there; the only write to the library is the archive.
+    Copies are made in the prepare stage, which runs ahead of pingo, so the next
+    folder is copied while the current one is being optimized.
+    Each folder reserves config.SCRATCH_SPACE_FACTOR times its size (the pages plus
+    pingo's output) until it is packaged; stage() waits while the budget is used up.
+    A folder that would not fit even in an empty scratch space is processed in place.
+    """
+
+    def __init__(self, root: str, budget_bytes: int, control=None):
+        os.makedirs(root, exist_ok=True)
+        self.root = tempfile.mkdtemp(prefix="comic-optimizer-", dir=root)
+        self.budget = min(budget_bytes, shutil.disk_usage(self.root).free)
+        self.control = control
+        self.used = 0
+        self.folders_staged = 0
+        self.folders_in_place = 0
+        self._reserved = {}
+        self._freed = threading.Condition()
+
+    def _reserve(self, nbytes: int, stopped=None) -> bool:
+        if nbytes > self.budget:
+            return False
+        while True:
+            with self._freed:
+                if self.used + nbytes <= self.budget:
+                    self.used += nbytes
+                    return True
+                self._freed.wait(POLL_SECONDS)
+            if self.control is not None:
+                self.control.checkpoint()
+            # Folders dropped by a stopped pipeline never give their space back
+            if stopped is not None and stopped():
+                raise Cancelled("Batch stopped")
+
+    def stage(self, job, stopped=None) -> bool:
+        """
+        Copy a folder job's folder to scratch space and point its work_path there;
+        False if it didn't fit. stopped: optional function, True once waiting for space is pointless.
+        """
+        index = job.folder_index()
+        nbytes = index.total_bytes() * config.SCRATCH_SPACE_FACTOR
+        if not self._reserve(nbytes, stopped):
+            logger.info("%s is too large for scratch space, processing it in place", job.folder_path)
+            self.folders_in_place += 1
+            return False
+        work_path = os.path.join(tempfile.mkdtemp(dir=self.root), os.path.basename(job.folder_path))
+        with self._freed:
+            self._reserved[job] = nbytes
+        try:
+            shutil.copytree(job.folder_path, work_path, copy_function=shutil.copyfile)
+        except BaseException:
+            self.release(job)
+            raise
+        job.work_path = work_path
+        job.index = None
+        self.folders_staged += 1
+        return True
+
+    def release(self, job) -> None:
+        """Delete a folder's scratch copy and give its space back."""
+        with self._freed:
+            nbytes = self._reserved.pop(job, None)
+        if nbytes is None:
+            return
+        if job.work_path != job.folder_path:
+            shutil.rmtree(os.path.dirname(job.work_path), ignore_errors=True)
+            job.work_path = job.folder_path
+        with self._freed:
+            self.used -= nbytes
+            self._freed.notify_all()
+
+    def close(self) -> None:
+        """Delete whatever is left in scratch space, e.g. copies of folders that were stopped."""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def summary(self) -> str:
+        line = f"Scratch space: {self.folders_staged} folders staged in {os.path.dirname(self.root)}"
+        if self.folders_in_place:
+            line += f", {self.folders_in_place} too large, processed in place"
+        return line
@@ -1,6 +0,0 @@
-IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".avif", ".gif"}
-
-OUTPUT_EXTENSIONS = [".cbz", ".cbr", ".zip"]
-
-DEFAULT_FONT_FAMILY = "Segoe UI"
-DEFAULT_FONT_SIZE = 10
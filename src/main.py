@@ -2,7 +2,7 @@ import os
 import sys
 
 sys.path.insert(0, os.path.dirname(__file__))
-import gui
+from comic_optimizer import gui
 
 
 def main():
@@ -0,0 +1,41 @@
+import zipfile
+
+from comic_optimizer import core
+from comic_optimizer.planner import plan_batch
+
+
+def _write_cbz(path, pages):
+    with zipfile.ZipFile(path, "w") as zipf:
+        for number in range(pages):
+            zipf.writestr(f"{number:02d}.png", b"\x89PNG\r\n\x1a\n" + bytes([number]) * 200)
+
+
+def test_discover_archives_skips_files_that_are_not_zips(tmp_path):
+    _write_cbz(tmp_path / "good.cbz", 3)
+    (tmp_path / "renamed.cbz").write_bytes(b"Rar!\x1a\x07\x00" + b"\x00" * 100)
+    (tmp_path / "truncated.cbz").write_bytes((tmp_path / "good.cbz").read_bytes()[:100])
+
+    archives = core.discover_archives(str(tmp_path), ".cbz")
+
+    assert archives == [(str(tmp_path / "good.cbz"), str(tmp_path / "good.cbz"))]
+
+
+def test_plan_batch_drops_archives_that_cannot_be_read(tmp_path):
+    _write_cbz(tmp_path / "good.cbz", 3)
+    _write_cbz(tmp_path / "damaged.cbz", 3)
+    # Still looks like a ZIP from its end record, but the central directory is garbage
+    data = bytearray((tmp_path / "damaged.cbz").read_bytes())
+    central = data.rfind(b"PK\x01\x02")
+    data[central:central + 4] = b"XXXX"
+    (tmp_path / "damaged.cbz").write_bytes(bytes(data))
+    assert zipfile.is_zipfile(tmp_path / "damaged.cbz")
+
+    jobs = [
+        core.ArchiveJob(str(tmp_path / name), str(tmp_path / name))
+        for name in ("damaged.cbz", "good.cbz")
+    ]
+    planned = plan_batch(jobs)
+
+    assert [job.folder_path for job in planned] == [str(tmp_path / "good.cbz")]
+    assert planned[0].size_pages == 3
+    assert jobs[0].size_error
@@ -0,0 +1,41 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+
+from comic_optimizer.control import BatchControl, Cancelled, run_command, run_command_async
+
+# Line endings of every kind, a \r\n split across two writes and no newline at the end
+SCRIPT = (
+    "import sys, time\n"
+    "out = sys.stdout\n"
+    "out.write('one\\ntwo\\r\\nthree\\rfour\\r'); out.flush(); time.sleep(0.2)\n"
+    "out.write('\\nfive\\n\\nlast'); out.flush()\n"
+)
+
+
+def test_async_output_matches_run_command():
+    cmd = [sys.executable, "-c", SCRIPT]
+    expected = run_command(cmd)
+    assert asyncio.run(run_command_async(cmd)) == expected
+    lines = []
+    asyncio.run(run_command_async(cmd, line_callback=lines.append))
+    assert lines == expected.split("\n")
+
+
+def test_stopping_terminates_the_child():
+    control = BatchControl()
+    cmd = [sys.executable, "-c", "import time; print('started', flush=True); time.sleep(60)"]
+    lines = []
+
+    def on_line(line):
+        lines.append(line)
+        threading.Timer(0.1, control.cancel).start()
+
+    started = time.monotonic()
+    with pytest.raises(Cancelled):
+        asyncio.run(run_command_async(cmd, control, on_line))
+    assert lines == ["started"]
+    assert time.monotonic() - started < 30
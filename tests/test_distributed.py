@@ -0,0 +1,35 @@
+import threading
+
+from comic_optimizer import config
+from comic_optimizer.cleanup import CleanupQueue
+from comic_optimizer.distributed import FolderQueue, QueueWorker, enqueue_library
+
+
+def _make_library(root):
+    for chapter in ("ch1", "ch2"):
+        folder = root / "series" / chapter
+        folder.mkdir(parents=True)
+        for number in range(3):
+            (folder / f"{number:02d}.png").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes([number]) * 200)
+
+
+def test_worker_started_before_the_coordinator_waits_for_the_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "QUEUE_POLL_SECONDS", 0.01)
+    library = tmp_path / "library"
+    _make_library(library)
+    queue = FolderQueue(str(tmp_path / "queue"))
+    worker = QueueWorker(queue, str(library), "", True, {}, workers=1,
+                         cleanup=CleanupQueue("delete", background=False))
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+
+    # Nothing is queued yet, which must not read as an empty batch
+    thread.join(0.2)
+    assert thread.is_alive()
+
+    assert enqueue_library(queue, str(library), ".cbz") == 2
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 2, "failed": 0}
+    assert (library / "series" / "ch1.cbz").is_file() and (library / "series" / "ch2.cbz").is_file()
@@ -0,0 +1,23 @@
+from comic_optimizer import core, instrument
+
+
+def test_stages_read_totals_from_the_folder_index(tmp_path, monkeypatch):
+    folder = tmp_path / "chapter"
+    folder.mkdir()
+    for number in (1, 2, 10):
+        (folder / f"{number}.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"x" * 100 * number)
+    (folder / "notes.txt").write_bytes(b"n" * 50)
+    events = []
+    job = core.FolderJob(str(folder), str(tmp_path / "chapter.cbz"))
+    job.instruments = instrument.Instrumentation(events.append)
+
+    def walk(path):
+        raise AssertionError(f"walked {path}")
+
+    monkeypatch.setattr(instrument, "folder_totals", walk)
+    core.prepare_folder(job)
+
+    clean, rename = events
+    assert (clean["stage"], clean["files_in"], clean["files_out"]) == ("clean", 4, 3)
+    assert clean["bytes_in"] - clean["bytes_out"] == 50
+    assert (rename["files_in"], rename["bytes_in"]) == (3, job.bytes_in)
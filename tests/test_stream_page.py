@@ -0,0 +1,57 @@
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from comic_optimizer import core
+
+
+def _make_folder(root, pages):
+    folder = root / "chapter"
+    (folder / "extras").mkdir(parents=True)
+    for number in range(pages):
+        (folder / f"{number:02d}.png").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes([number]) * 2000)
+        # pingo's result for every other page, smaller than the original
+        if number % 2:
+            (folder / f"{number:02d}.webp").write_bytes(b"RIFF" + bytes([number]) * 500)
+    (folder / "extras" / "bonus.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"x" * 100)
+    return folder
+
+
+def test_concurrent_stream_page_writes_one_archive(tmp_path, monkeypatch):
+    folder = _make_folder(tmp_path, 40)
+    job = core.FolderJob(str(folder), str(tmp_path / "chapter.cbz"))
+    job.pages = core.list_pages(job.work_path, job.folder_index())
+
+    writers = []
+    writer_class = core.CbzWriter
+
+    def counting_writer(*args, **kwargs):
+        writer = writer_class(*args, **kwargs)
+        writers.append(writer)
+        return writer
+
+    monkeypatch.setattr(core, "CbzWriter", counting_writer)
+    # Pages arrive from several dispatcher threads at once, in no particular order
+    start = threading.Barrier(8)
+
+    def stream(chunk):
+        start.wait()
+        for page in chunk:
+            job.stream_page(os.path.join(job.work_path, page))
+
+    chunks = [job.pages[offset::8] for offset in range(8)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(stream, chunks))
+    job.writer.close()
+
+    assert len(writers) == 1
+    assert not os.path.exists(job.zip_file_path + ".part")
+    with zipfile.ZipFile(job.zip_file_path) as zipf:
+        assert zipf.testzip() is None
+        names = [name for name in zipf.namelist() if name != "ComicInfo.xml"]
+    expected = [
+        os.path.splitext(page)[0] + ".webp" if page[:2].isdigit() and int(page[:2]) % 2 else page
+        for page in job.pages
+    ]
+    assert names == [name.replace(os.sep, "/") for name in expected]
@@ -0,0 +1,65 @@
+import zipfile
+
+from comic_optimizer import core
+from comic_optimizer.cleanup import CleanupQueue
+
+
+def _write_cbz(path, pages):
+    with zipfile.ZipFile(path, "w") as zipf:
+        for number in range(pages):
+            zipf.writestr(f"{number:02d}.png", b"\x89PNG\r\n\x1a\n" + bytes([number]) * 200)
+    return path.read_bytes()
+
+
+def _package_in_place(path, cleanup):
+    job = core.ArchiveJob(str(path), str(path))
+    core.prepare_archive(job)
+    core.optimize_archive(job, "", True, {})
+    core.package_archive(job, cleanup=cleanup)
+    return job
+
+
+def test_in_place_rewrite_that_fails_verification_keeps_the_source(tmp_path, monkeypatch):
+    source = _write_cbz(tmp_path / "chapter.cbz", 5)
+    monkeypatch.setattr(core, "verify_archive", lambda zip_file_path, pages=None: "00.png fails its CRC check")
+    cleanup = CleanupQueue("delete", background=False)
+
+    job = _package_in_place(tmp_path / "chapter.cbz", cleanup)
+
+    assert (tmp_path / "chapter.cbz").read_bytes() == source
+    assert not (tmp_path / "chapter.cbz.part").exists()
+    assert not job.reached("archived")
+    assert job.bytes_out == job.bytes_in
+    assert len(cleanup.failures) == 1
+
+
+def test_in_place_rewrite_replaces_the_source_once_verified(tmp_path):
+    _write_cbz(tmp_path / "chapter.cbz", 5)
+    cleanup = CleanupQueue("delete", background=False)
+
+    job = _package_in_place(tmp_path / "chapter.cbz", cleanup)
+
+    assert job.reached("done")
+    assert not cleanup.failures
+    with zipfile.ZipFile(tmp_path / "chapter.cbz") as zipf:
+        assert "ComicInfo.xml" in zipf.namelist()
+
+
+def test_cleanup_keeps_a_source_whose_archive_fails_verification(tmp_path):
+    folder = tmp_path / "chapter"
+    folder.mkdir()
+    for number in range(3):
+        (folder / f"{number:02d}.png").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes([number]) * 200)
+    # An archive missing one of the folder's pages
+    with zipfile.ZipFile(tmp_path / "chapter.cbz", "w") as zipf:
+        for number in range(2):
+            zipf.write(folder / f"{number:02d}.png", f"{number:02d}.png")
+    job = core.FolderJob(str(folder), str(tmp_path / "chapter.cbz"))
+    cleanup = CleanupQueue("delete", background=False)
+
+    cleanup.submit(job, pages=3)
+
+    assert folder.is_dir() and len(list(folder.iterdir())) == 3
+    assert not job.reached("done")
+    assert cleanup.failures == [f"{folder} was left in place: archive {tmp_path / 'chapter.cbz'} "
+                                "failed verification (2 pages, expected 3)"]